@@ -0,0 +1,326 @@
+import numpy as np
+from typing import Dict, List, Any, Optional, Tuple
+
+# Detector thresholds. Vibration levels follow ArduPilot's guidance
+# (m/s/s, below 30 is fine, above 60 usually causes position problems).
+VIBRATION_WINDOW = 1.0          # seconds of samples in the rolling RMS
+VIBRATION_WARN = 30.0
+VIBRATION_HIGH = 60.0
+CLIP_MERGE_GAP = 2.0            # seconds between clipping bursts that count as one event
+CLIP_HIGH = 100                 # clip counter increase for a high-severity event
+BATTERY_SAG_FRACTION = 0.10     # voltage drop below the no-load trend
+BATTERY_SAG_HIGH = 0.20
+BATTERY_DEPLETION_FRACTION = 0.20
+GPS_HDOP_WARN = 2.0
+GPS_HDOP_HIGH = 5.0
+GPS_GAP_FACTOR = 5.0            # gaps longer than this many median intervals...
+GPS_GAP_MIN = 1.0               # ...and at least this many seconds
+ALTITUDE_RATE_MIN = 10.0        # m/s; slower changes are never outliers
+ALTITUDE_RATE_HIGH = 25.0
+ALTITUDE_RATE_MAD = 6.0         # robust z-score for an outlier
+MAX_EVENTS_PER_TYPE = 10
+
+SEVERITY_ORDER = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+# Short labels used for summary["anomalies"] and the fallback analysis
+EVENT_LABELS = {
+    "vibration_high": "High vibration levels",
+    "vibration_clipping": "IMU accelerometer clipping",
+    "battery_sag": "Battery voltage sag under load",
+    "battery_depletion": "Significant battery voltage drop",
+    "gps_fix_lost": "GPS fix lost",
+    "gps_hdop_high": "Poor GPS accuracy (high HDOP)",
+    "gps_data_gap": "Gap in GPS data",
+    "altitude_rate_outlier": "Abrupt altitude change",
+}
+
+# Kept free of commas: the analysis parser splits recommendation lists on them
+EVENT_RECOMMENDATIONS = {
+    "vibration_high": "Check propeller balance and motor bearings and the flight controller mounting",
+    "vibration_clipping": "Improve vibration isolation of the flight controller",
+    "battery_sag": "Check battery health and internal resistance or reduce the load",
+    "battery_depletion": "Review battery capacity against the flight plan",
+    "gps_fix_lost": "Check GPS antenna placement and interference sources",
+    "gps_hdop_high": "Wait for better satellite geometry before arming",
+    "gps_data_gap": "Check the GPS connection and logging rate",
+    "altitude_rate_outlier": "Compare barometer and GPS altitude around the event",
+}
+
+
+def _spans(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Start and stop (exclusive) indices of each run of True values"""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return edges[::2], edges[1::2]
+
+
+def _merge_spans(starts: np.ndarray, stops: np.ndarray, timestamps: np.ndarray,
+                 gap: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Join spans separated by less than `gap` seconds"""
+    if len(starts) < 2:
+        return starts, stops
+    separate = timestamps[starts[1:]] - timestamps[stops[:-1] - 1] >= gap
+    return starts[np.concatenate(([True], separate))], stops[np.concatenate((separate, [True]))]
+
+
+def _rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over `window` samples (shorter at the start)"""
+    sums = np.cumsum(values, dtype=np.float64)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return sums / counts
+
+
+def _window_samples(timestamps: np.ndarray, seconds: float) -> int:
+    """Number of samples covering `seconds` at the signal's typical rate"""
+    if len(timestamps) < 2:
+        return 1
+    interval = float(np.median(np.diff(timestamps)))
+    return max(1, int(round(seconds / interval))) if interval > 0 else 1
+
+
+class _EventBuilder:
+    """Collects events for one flight, with times relative to the flight start"""
+
+    def __init__(self, flight_start: float):
+        self.flight_start = flight_start
+        self.events: List[Dict[str, Any]] = []
+        self.counts: Dict[str, int] = {}
+
+    def add_spans(self, event_type: str, signal: str, timestamps: np.ndarray,
+                  starts: np.ndarray, stops: np.ndarray, peaks: np.ndarray,
+                  severities: List[str], describe):
+        """Add one event per span; only the most severe spans of a type are kept"""
+        if len(starts) == 0:
+            return
+        self.counts[event_type] = self.counts.get(event_type, 0) + len(starts)
+
+        # The end of a span is the first sample after it, so dropouts get their exact length
+        ends = timestamps[np.minimum(stops, len(timestamps) - 1)]
+        order = sorted(range(len(starts)),
+                       key=lambda i: (SEVERITY_ORDER[severities[i]], ends[i] - timestamps[starts[i]]),
+                       reverse=True)
+        for i in order[:MAX_EVENTS_PER_TYPE]:
+            start = float(timestamps[starts[i]])
+            peak = float(peaks[i])
+            self.events.append({
+                "type": event_type,
+                "signal": signal,
+                "severity": severities[i],
+                "start": start,
+                "end": float(ends[i]),
+                "duration": round(float(ends[i]) - start, 3),
+                "offset": round(start - self.flight_start, 3),
+                "samples": int(stops[i] - starts[i]),
+                "peak": round(peak, 3),
+                "description": describe(peak),
+            })
+
+
+def _signal_columns(telemetry, name: str, *fields: str) -> Optional[List[np.ndarray]]:
+    signal = telemetry.get(name) if hasattr(telemetry, "get") else None
+    if not signal or len(signal) == 0:
+        return None
+    return [signal[field] for field in fields]
+
+
+def detect_vibration(telemetry, events: _EventBuilder):
+    """Rolling-window vibration RMS above the warning level, and accelerometer clipping"""
+    columns = _signal_columns(telemetry, "vibration", "timestamp", "vibe_x", "vibe_y", "vibe_z",
+                              "clip_0", "clip_1", "clip_2")
+    if columns is None:
+        return
+    timestamps, vibe_x, vibe_y, vibe_z, clip_0, clip_1, clip_2 = columns
+    window = _window_samples(timestamps, VIBRATION_WINDOW)
+
+    # RMS per axis over the window; the worst axis decides
+    rms = np.sqrt(np.maximum.reduce([_rolling_mean(np.square(axis), window)
+                                     for axis in (vibe_x, vibe_y, vibe_z)]))
+    starts, stops = _spans(rms > VIBRATION_WARN)
+    if len(starts):
+        peaks = np.maximum.reduceat(rms, starts)
+        severities = ["high" if peak > VIBRATION_HIGH else "medium" for peak in peaks]
+        events.add_spans("vibration_high", "vibration", timestamps, starts, stops, peaks, severities,
+                         lambda peak: f"Vibration RMS reached {peak:.1f} m/s/s")
+
+    # Clip counters only grow, so any increase is a clipping burst
+    clips = clip_0.astype(np.int64) + clip_1 + clip_2
+    increments = np.diff(clips, prepend=clips[:1])
+    starts, stops = _spans(increments > 0)
+    starts, stops = _merge_spans(starts, stops, timestamps, CLIP_MERGE_GAP)
+    if len(starts):
+        added = np.add.reduceat(np.maximum(increments, 0), starts)
+        severities = ["high" if count >= CLIP_HIGH else "medium" for count in added]
+        events.add_spans("vibration_clipping", "vibration", timestamps, starts, stops, added, severities,
+                         lambda count: f"Accelerometers clipped {int(count)} times")
+
+
+def detect_battery(telemetry, events: _EventBuilder):
+    """Voltage sag under load relative to the flight's no-load discharge trend"""
+    columns = _signal_columns(telemetry, "battery", "timestamp", "voltage", "current")
+    signal = "battery"
+    if columns is None:
+        columns = _signal_columns(telemetry, "system_status", "timestamp", "voltage_battery",
+                                  "current_battery")
+        signal = "system_status"
+    if columns is None:
+        return
+    timestamps, voltage, current = columns
+    valid = voltage > 0
+    if np.count_nonzero(valid) < 10:
+        return
+    timestamps, voltage, current = timestamps[valid], voltage[valid], current[valid]
+
+    # Least-squares fit of V = a + b*t + c*t^2 - R*I: the time terms model the
+    # discharge curve, R the pack's internal resistance
+    elapsed = timestamps - timestamps[0]
+    scale = max(float(elapsed[-1]), 1.0)
+    t = elapsed / scale
+    terms = [np.ones_like(t), t, t * t]
+    has_current = bool(np.ptp(current) > 0)
+    if has_current:
+        terms.append(-current)
+    coefficients = np.linalg.lstsq(np.stack(terms, axis=1), voltage, rcond=None)[0]
+    no_load = coefficients[0] + coefficients[1] * t + coefficients[2] * t * t
+
+    sag = (no_load - voltage) / np.maximum(no_load, 1e-6)
+    starts, stops = _spans(sag > BATTERY_SAG_FRACTION)
+    if len(starts):
+        peaks = np.maximum.reduceat(sag, starts) * 100
+        severities = ["high" if peak > BATTERY_SAG_HIGH * 100 else "medium" for peak in peaks]
+        resistance = f" (internal resistance ~{coefficients[3]:.3f} ohm)" if has_current else ""
+        events.add_spans("battery_sag", signal, timestamps, starts, stops, peaks, severities,
+                         lambda peak: f"Voltage sagged {peak:.0f}% below the no-load trend{resistance}")
+
+    # Overall drop between the first and last tenth of the flight
+    tenth = max(1, len(voltage) // 10)
+    first, last = float(np.median(voltage[:tenth])), float(np.median(voltage[-tenth:]))
+    if last < first * (1 - BATTERY_DEPLETION_FRACTION):
+        drop = (first - last) / first * 100
+        events.add_spans("battery_depletion", signal, timestamps, np.array([0]), np.array([len(voltage)]),
+                         np.array([drop]), ["medium"],
+                         lambda peak: f"Voltage fell {peak:.0f}% from {first:.2f} to {last:.2f}")
+
+
+def detect_gps(telemetry, events: _EventBuilder):
+    """Lost 3D fix, high HDOP and gaps in GPS data, with exact time spans"""
+    columns = _signal_columns(telemetry, "gps", "timestamp", "fix_type", "hdop")
+    if columns is None:
+        return
+    timestamps, fix_type, hdop = columns
+
+    # Ignore the time before the first 3D fix: that is acquisition, not a dropout
+    fixed = np.flatnonzero(fix_type >= 3)
+    if len(fixed):
+        lost = fix_type < 3
+        lost[:fixed[0]] = False
+        starts, stops = _spans(lost)
+        if len(starts):
+            worst = np.minimum.reduceat(fix_type, starts)
+            severities = ["high" if fix < 2 else "medium" for fix in worst]
+            events.add_spans("gps_fix_lost", "gps", timestamps, starts, stops, worst, severities,
+                             lambda fix: f"GPS fix degraded to type {int(fix)}")
+
+    starts, stops = _spans(hdop > GPS_HDOP_WARN)
+    if len(starts):
+        peaks = np.maximum.reduceat(hdop, starts)
+        severities = ["high" if peak > GPS_HDOP_HIGH else "low" for peak in peaks]
+        events.add_spans("gps_hdop_high", "gps", timestamps, starts, stops, peaks, severities,
+                         lambda peak: f"HDOP rose to {peak:.1f}")
+
+    if len(timestamps) > 2:
+        intervals = np.diff(timestamps)
+        limit = max(GPS_GAP_MIN, GPS_GAP_FACTOR * float(np.median(intervals)))
+        gaps = np.flatnonzero(intervals > limit)
+        if len(gaps):
+            events.add_spans("gps_data_gap", "gps", timestamps, gaps, gaps + 1, intervals[gaps],
+                             ["medium"] * len(gaps), lambda gap: f"No GPS data for {gap:.1f} s")
+
+
+def detect_altitude(telemetry, events: _EventBuilder):
+    """Vertical rates far outside the flight's own distribution"""
+    signal = "position"
+    columns = _signal_columns(telemetry, "position", "timestamp", "alt")
+    if columns is None:
+        signal = "gps"
+        columns = _signal_columns(telemetry, "gps", "timestamp", "alt")
+    if columns is None or len(columns[0]) < 3:
+        return
+    timestamps, altitude = columns
+
+    intervals = np.diff(timestamps)
+    usable = intervals > 0
+    rates = np.zeros(len(intervals))
+    rates[usable] = np.diff(altitude)[usable] / intervals[usable]
+
+    # Robust z-score: median and MAD are not pulled around by the outliers themselves
+    median = float(np.median(rates[usable])) if usable.any() else 0.0
+    mad = float(np.median(np.abs(rates[usable] - median))) * 1.4826 if usable.any() else 0.0
+    limit = max(ALTITUDE_RATE_MIN, ALTITUDE_RATE_MAD * mad)
+    outliers = usable & (np.abs(rates - median) > limit)
+    starts, stops = _spans(outliers)
+    if len(starts):
+        # Rate i spans samples i..i+1
+        peaks = np.maximum.reduceat(np.where(outliers, np.abs(rates), 0), starts)
+        severities = ["high" if peak > ALTITUDE_RATE_HIGH else "medium" for peak in peaks]
+        events.add_spans("altitude_rate_outlier", signal, timestamps, starts, stops, peaks, severities,
+                         lambda peak: f"Altitude changed at {peak:.1f} m/s")
+
+
+DETECTORS = (detect_vibration, detect_battery, detect_gps, detect_altitude)
+
+
+def detect_anomalies(telemetry) -> Dict[str, Any]:
+    """Run every detector over full-resolution telemetry.
+
+    Returns {"events": [...], "counts": {...}}. Events are sorted by time and
+    carry absolute start/end timestamps, the offset from the flight start in
+    seconds, a severity (low/medium/high) and a short description. counts
+    holds the number of events per type, including ones dropped by the
+    MAX_EVENTS_PER_TYPE cap.
+    """
+    starts = [float(signal["timestamp"][0]) for _, signal in telemetry.items() if len(signal)]
+    events = _EventBuilder(min(starts) if starts else 0.0)
+    for detector in DETECTORS:
+        try:
+            detector(telemetry, events)
+        except Exception as e:
+            print(f"Anomaly detector {detector.__name__} failed: {e}")
+    return {
+        "events": sorted(events.events, key=lambda event: event["start"]),
+        "counts": events.counts,
+    }
+
+
+def anomaly_labels(detected: Dict[str, Any]) -> List[str]:
+    """One label per event type found, e.g. "GPS fix lost (2x)" """
+    return [
+        EVENT_LABELS.get(event_type, event_type) + (f" ({count}x)" if count > 1 else "")
+        for event_type, count in detected.get("counts", {}).items()
+    ]
+
+
+def highest_severity(detected: Dict[str, Any]) -> str:
+    """Worst severity among the events, "low" when there are none"""
+    severities = [event["severity"] for event in detected.get("events", [])]
+    return max(severities, key=SEVERITY_ORDER.get) if severities else "low"
+
+
+def most_severe(detected: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Events ordered by severity, longest first within a severity"""
+    return sorted(detected.get("events", []),
+                  key=lambda event: (SEVERITY_ORDER[event["severity"]], event["duration"]),
+                  reverse=True)
+
+
+def format_anomaly_events(detected: Dict[str, Any], limit: int = 20) -> str:
+    """One line per event, most severe first, for LLM prompts"""
+    events = most_severe(detected)
+    if not events:
+        return "No events detected."
+    lines = [
+        f"- [{event['severity']}] T+{event['offset']:.1f}s for {event['duration']:.1f}s: {event['description']}"
+        for event in events[:limit]
+    ]
+    if len(events) > limit:
+        lines.append(f"- ... and {len(events) - limit} more")
+    return "\n".join(lines)
@@ -0,0 +1,130 @@
+import asyncio
+from typing import Dict, Set, Any, Optional, Callable
+from anomaly_detectors import detect_anomalies, anomaly_labels
+from flight_prompt import build_flight_context
+from metrics import span, trace
+
+# Flights whose analysis still has to run (or was interrupted by a restart)
+UNFINISHED_STATUSES = {"pending", "running"}
+
+
+class AnomalyAnalysisManager:
+    """Runs LLM anomaly analysis for uploaded flights in the background.
+
+    Uploads complete as soon as a flight is summarized. The analysis then
+    runs here through the chat service's long-lived LLM provider, and its
+    result is written into the flight's summary and persisted. Progress is
+    tracked in summary["anomaly_analysis_status"] (pending, running,
+    completed or failed) and can be polled with get_status().
+
+    Flights that grew since they were summarized carry
+    summary["anomaly_events_stale"]; their detector events are recomputed
+    over the whole flight before the LLM sees them. Data appended while an
+    analysis runs gets one more analysis after it.
+    """
+
+    def __init__(self, parser, chat_service):
+        self.parser = parser
+        self.repository = parser.repository
+        self.chat_service = chat_service
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Flights that changed while their analysis was running
+        self._rerun: Set[str] = set()
+
+    def schedule(self, flight_id: str,
+                 on_complete: Callable[[Dict[str, Any]], None] = None) -> Optional[asyncio.Task]:
+        """Start analysis for a flight that still needs it; returns None if nothing to do
+
+        on_complete, if given, is called in a thread with the updated flight
+        metadata once the analysis has been stored.
+        """
+        task = self._tasks.get(flight_id)
+        summary = self.repository.get_summary(flight_id)
+        if task is not None:
+            # A running analysis marks the flight "running"; "pending" means new data arrived since
+            if summary is not None and summary.get("anomaly_analysis_status") == "pending":
+                self._rerun.add(flight_id)
+            return task
+        if summary is None or summary.get("anomaly_analysis_status") not in UNFINISHED_STATUSES:
+            return None
+        task = self._tasks[flight_id] = asyncio.create_task(self._run(flight_id, on_complete))
+        return task
+
+    def resume_pending(self):
+        """Restart analyses that were pending when the server last stopped"""
+        # Listing entries carry the status, so finished flights aren't loaded
+        for flight_id, listing in self.repository.cache.items():
+            if listing.get("summary", {}).get("anomaly_analysis_status") in UNFINISHED_STATUSES:
+                self.schedule(flight_id)
+
+    def get_status(self, flight_id: str) -> Optional[Dict[str, Any]]:
+        summary = self.repository.get_summary(flight_id)
+        if summary is None:
+            return None
+        return {
+            "flight_id": flight_id,
+            # Flights analyzed before background analysis existed have no status
+            "status": summary.get("anomaly_analysis_status", "completed"),
+            "anomaly_analysis": summary.get("anomaly_analysis"),
+        }
+
+    async def _run(self, flight_id: str, on_complete: Optional[Callable[[Dict[str, Any]], None]]):
+        # The upload job that scheduled this has finished; keep these stages out of its timings
+        with trace(), span("anomaly_analysis"):
+            await self._analyze(flight_id, on_complete)
+
+    async def _refresh_events(self, flight_id: str) -> Dict[str, Any]:
+        """Rerun the local detectors over all of a grown flight's telemetry; returns the new summary"""
+        flight_data = await asyncio.to_thread(self.repository.get, flight_id)
+        with span("anomaly_detection"):
+            detected = await asyncio.to_thread(detect_anomalies, flight_data["telemetry"])
+        # Only the events change: other fields may have been extended meanwhile
+        current = self.repository.get_summary(flight_id)
+        summary = {**current, "anomalies": anomaly_labels(detected),
+                   "telemetry_summary": {**current.get("telemetry_summary", {}), "anomaly_events": detected}}
+        summary.pop("anomaly_events_stale", None)
+        await asyncio.to_thread(self.repository.update, flight_id, summary=summary)
+        return summary
+
+    async def _analyze(self, flight_id: str, on_complete: Optional[Callable[[Dict[str, Any]], None]]):
+        try:
+            summary = self.repository.get_summary(flight_id)
+            await asyncio.to_thread(self.repository.update, flight_id,
+                                    summary={**summary, "anomaly_analysis_status": "running"})
+            if summary.get("anomaly_events_stale"):
+                summary = await self._refresh_events(flight_id)
+
+            analysis = await self.parser.analyze_anomalies(
+                summary.get("telemetry_summary", {}), self.chat_service.llm_provider)
+
+            summary = {
+                **self.repository.get_summary(flight_id),
+                "anomaly_analysis": analysis,
+                "anomaly_analysis_status": "completed",
+            }
+            flight_data = await asyncio.to_thread(
+                self.repository.update, flight_id,
+                summary=summary, prompt_context=build_flight_context({"summary": summary}))
+
+            # Answers given before the analysis arrived did not include it
+            self.chat_service.response_cache.invalidate(flight_id)
+            if on_complete:
+                await asyncio.to_thread(on_complete, flight_data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Anomaly analysis for flight {flight_id} failed: {e}")
+            if flight_id in self.repository:
+                summary = {**self.repository.get_summary(flight_id), "anomaly_analysis_status": "failed"}
+                await asyncio.to_thread(self.repository.update, flight_id, summary=summary)
+        finally:
+            rerun = flight_id in self._rerun and flight_id in self.repository
+            self._rerun.discard(flight_id)
+            if rerun:
+                summary = {**self.repository.get_summary(flight_id), "anomaly_events_stale": True,
+                           "anomaly_analysis_status": "pending"}
+                await asyncio.to_thread(self.repository.update, flight_id, summary=summary)
+            # Still registered while the status is written, so schedule() can't start a second task
+            self._tasks.pop(flight_id, None)
+            if rerun:
+                self.schedule(flight_id, on_complete)
@@ -1,12 +1,28 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response, PlainTextResponse
 from pydantic import BaseModel
+import aiofiles
+import asyncio
 import uvicorn
 import os
-from typing import List, Dict, Any, Optional
+import json
+import uuid
+import hashlib
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 from mavlink_parser import MAVLinkParser
 from chat_service import ChatService
+from flight_repository import FlightRepository
+from config import Config
+from parse_pool import ParseWorkerPool
+from upload_jobs import UploadJobManager, log_size
+from parse_cache import ParseCache
+from anomaly_tasks import AnomalyAnalysisManager
+from downsampling import slice_telemetry
+from live_ingest import LiveIngestService, LIVE_SIGNALS
+from metrics import registry, span, trace, PROMETHEUS_CONTENT_TYPE, LIVE_BATCHES
+from telemetry_transport import flight_response, signal_response, signal_etag, etag_matches, wants_binary, not_modified_response
 
 app = FastAPI(title="UAV Log Analyzer", version="1.0.0")
 
@@ -19,9 +35,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-parser = MAVLinkParser()
-chat_service = ChatService()
+# Services are built when the server starts, not at import: parse workers
+# are spawned processes that re-import the main module (this one, when
+# launched with `python app.py`), and must not load flights, conversation
+# memory or LLM clients of their own
+flight_repository: Optional[FlightRepository] = None
+parser: Optional[MAVLinkParser] = None
+chat_service: Optional[ChatService] = None
+parse_pool: Optional[ParseWorkerPool] = None
+anomaly_analysis: Optional[AnomalyAnalysisManager] = None
+upload_jobs: Optional[UploadJobManager] = None
+live_ingest: Optional[LiveIngestService] = None
+
+@app.on_event("startup")
+async def start_services():
+    global flight_repository, parser, chat_service, parse_pool, anomaly_analysis, upload_jobs, live_ingest
+    # One flight repository backs both the parser and the chat service
+    flight_repository = FlightRepository()
+    parser = MAVLinkParser(flight_repository)
+    chat_service = ChatService(flight_repository)
+    parse_pool = ParseWorkerPool()
+    anomaly_analysis = AnomalyAnalysisManager(parser, chat_service)
+    upload_jobs = UploadJobManager(parser, parse_pool, ParseCache(), anomaly_analysis, chat_service.response_cache)
+    live_ingest = LiveIngestService()
+
+    anomaly_analysis.resume_pending()
+    live_ingest.start()
+
+@app.on_event("shutdown")
+async def shutdown_services():
+    live_ingest.stop()
+    parse_pool.shutdown()
+    await chat_service.close()
 
 class ChatMessage(BaseModel):
     message: str
@@ -29,46 +74,166 @@ class ChatMessage(BaseModel):
 
 class ChatResponse(BaseModel):
     response: str
-    flight_data: Dict[str, Any] = {}
+    # The flight asked about, without telemetry (see /api/flights/{id}/signals)
+    flight_id: Optional[str] = None
+    summary: Dict[str, Any] = {}
+    signals: Dict[str, Any] = {}
     proactive_suggestions: List[str] = []
     comparison_insights: str = ""
+    # Seconds per request phase and LLM tokens used
+    timings: Dict[str, float] = {}
+    usage: Dict[str, int] = {}
 
-@app.post("/api/upload")
-async def upload_flight_data(file: UploadFile = File(...)):
-    """Upload and parse .bin flight data file"""
+async def save_upload_to_disk(file: UploadFile) -> Tuple[str, str]:
+    """Stream an uploaded file to the upload directory in fixed-size chunks
+
+    Only one chunk is held in memory at a time; the parser then reads the
+    saved file through a memory map instead of an in-memory copy. Returns
+    the saved path and the SHA-256 of the content, computed while streaming.
+    """
+    os.makedirs(Config.UPLOAD_DIR, exist_ok=True)
+    # Prefix with a unique id so concurrent uploads of the same filename don't collide
+    filename = os.path.basename(file.filename or "upload.bin")
+    file_path = os.path.join(Config.UPLOAD_DIR, f"{uuid.uuid4().hex}_{filename}")
+
+    bytes_written = 0
+    content_hash = hashlib.sha256()
+    try:
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while True:
+                chunk = await file.read(Config.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                bytes_written += len(chunk)
+                if bytes_written > Config.MAX_FILE_SIZE:
+                    raise HTTPException(status_code=413, detail=Config.FILE_TOO_LARGE_MESSAGE)
+                content_hash.update(chunk)
+                await buffer.write(chunk)
+    except Exception:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+
+    return file_path, content_hash.hexdigest()
+
+@app.post("/api/upload", status_code=202)
+async def upload_flight_data(file: UploadFile = File(...), profile: bool = False):
+    """Upload a .bin flight data file and start parsing it in the background
+
+    With profile=true (and profiling enabled in the config) the job's
+    parse and summary are sampled; the folded stacks are served from
+    /api/jobs/{job_id}/profile when the job has finished.
+    """
+    if parse_pool.is_full:
+        raise HTTPException(status_code=503, detail="Too many uploads are being processed - please retry shortly")
+    if profile and not Config.PROFILING_ENABLED:
+        raise HTTPException(status_code=400, detail="Profiling is disabled (set PROFILING_ENABLED=true)")
     try:
         # Save uploaded file
-        file_path = f"uploads/{file.filename}"
-        os.makedirs("uploads", exist_ok=True)
-
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-
-        # Parse flight data
-        flight_data = parser.parse_bin_file(file_path)
-        
-        # Debug logging
-        print(f"Parsed flight data keys: {list(flight_data.keys())}")
-        print(f"Telemetry keys: {list(flight_data['telemetry'].keys())}")
-        print(f"GPS data length: {len(flight_data['telemetry']['gps'])}")
-        print(f"Sample GPS data: {flight_data['telemetry']['gps'][:3] if flight_data['telemetry']['gps'] else 'No GPS data'}")
-
-        # Add timestamp for recency tracking
-        flight_data["timestamp"] = datetime.now().isoformat()
-        
-        # Cache flight data in chat service
-        chat_service.cache_flight_data(flight_data["flight_id"], flight_data)
+        with trace() as timings, span("upload_receive"):
+            file_path, content_hash = await save_upload_to_disk(file)
 
+        job = upload_jobs.submit(file.filename, file_path, os.path.getsize(file_path), content_hash,
+                                 profile=profile, timings=timings)
         return {
-            "flight_id": flight_data["flight_id"],
-            "summary": flight_data["summary"],
-            "telemetry": flight_data["telemetry"],
-            "message": "Flight data uploaded and parsed successfully"
+            "job_id": job.job_id,
+            "status_url": f"/api/jobs/{job.job_id}",
+            "events_url": f"/api/jobs/{job.job_id}/events",
+            "message": "Flight data uploaded, parsing started"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/flights/{flight_id}/append", status_code=202)
+async def append_flight_data(flight_id: str, file: UploadFile = File(...), offset: Optional[int] = None):
+    """Append data to the log of a flight that is still being recorded
+
+    The file holds the bytes written to the log since the last upload or
+    append; only those are decoded and the flight's telemetry and summary
+    are extended with them. offset is the log position the data starts at:
+    if the server's copy of the log has a different size the request gets
+    409 with the size to resume from. The job's result has the new
+    log_bytes. An append that fails, or is cancelled before its data has
+    been decoded, leaves the log and the flight as they were, so it can be
+    retried at the same offset.
+    """
+    metadata = flight_repository.peek(flight_id)
+    if metadata is None:
+        raise HTTPException(status_code=404, detail="Flight not found")
+    if not metadata.get("parse_state"):
+        raise HTTPException(status_code=409, detail="This flight's log cannot be extended - upload the complete log instead")
+    log_bytes = log_size(metadata)
+    if offset is not None and offset != log_bytes:
+        raise HTTPException(status_code=409, detail={"message": "Offset does not match the stored log",
+                                                     "log_bytes": log_bytes})
+    if parse_pool.is_full:
+        raise HTTPException(status_code=503, detail="Too many uploads are being processed - please retry shortly")
+    try:
+        with trace() as timings, span("upload_receive"):
+            file_path, content_hash = await save_upload_to_disk(file)
+        if log_bytes + os.path.getsize(file_path) > Config.MAX_FILE_SIZE:
+            os.remove(file_path)
+            raise HTTPException(status_code=413, detail=Config.FILE_TOO_LARGE_MESSAGE)
+
+        job = upload_jobs.submit_append(flight_id, file.filename, file_path, os.path.getsize(file_path),
+                                        content_hash, offset=offset, timings=timings)
+        return {
+            "job_id": job.job_id,
+            "flight_id": flight_id,
+            "status_url": f"/api/jobs/{job.job_id}",
+            "events_url": f"/api/jobs/{job.job_id}/events",
+            "message": "Flight data received, decoding appended records"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/jobs/{job_id}")
+async def get_upload_job(job_id: str):
+    """Get progress of an upload job, including the flight summary once completed"""
+    job = upload_jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    status = job.to_dict()
+    result = upload_jobs.get_result(job_id)
+    if result:
+        status["result"] = result
+    return status
+
+@app.get("/api/jobs/{job_id}/profile")
+async def get_upload_job_profile(job_id: str):
+    """Folded stack samples of a profiled upload job (flamegraph.pl / speedscope input)"""
+    job = upload_jobs.get_job(job_id)
+    if not job or not job.profiled:
+        raise HTTPException(status_code=404, detail="No profile for this job")
+    profile = upload_jobs.get_profile(job_id)
+    if profile is None:
+        raise HTTPException(status_code=409, detail="Job is still running")
+    return PlainTextResponse(profile)
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_upload_job(job_id: str):
+    """Stream upload job progress as server-sent events"""
+    if not upload_jobs.get_job(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        upload_jobs.events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_upload_job(job_id: str):
+    """Cancel an upload job that is still running"""
+    if not upload_jobs.get_job(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not upload_jobs.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job has already finished")
+    return {"job_id": job_id, "message": "Cancellation requested"}
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat_with_flight_data(chat_message: ChatMessage):
     """Chat about flight data using LLM"""
@@ -79,36 +244,197 @@ async def chat_with_flight_data(chat_message: ChatMessage):
         )
         return ChatResponse(
             response=response["answer"],
-            flight_data=response.get("flight_data", {}),
+            flight_id=response.get("flight_id"),
+            summary=response.get("summary", {}),
+            signals=response.get("signals", {}),
             proactive_suggestions=response.get("proactive_suggestions", []),
-            comparison_insights=response.get("comparison_insights", "")
+            comparison_insights=response.get("comparison_insights", ""),
+            timings=response.get("timings", {}),
+            usage=response.get("usage", {})
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/chat/stream")
+async def stream_chat_with_flight_data(chat_message: ChatMessage):
+    """Chat about flight data, streaming the answer as server-sent events"""
+    async def events():
+        async for event, data in chat_service.stream_message(chat_message.message, chat_message.flight_id):
+            yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/chat/cache/stats")
+async def get_response_cache_stats():
+    """Get chat response cache hit/miss counters"""
+    return chat_service.response_cache.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Upload stage timings, decode counters, chat latency and LLM usage in the Prometheus text format"""
+    return Response(content=registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.get("/api/flights")
 async def get_flights():
     """Get list of uploaded flights"""
     return parser.get_flight_list()
 
+@app.get("/api/flight-cache/stats")
+async def get_flight_cache_stats():
+    """Get flight cache occupancy and hit/miss/eviction counters"""
+    return flight_repository.stats()
+
 @app.get("/api/flights/recent")
-async def get_recent_flight():
-    """Get the most recently uploaded flight"""
+async def get_recent_flight(request: Request):
+    """Get the most recently uploaded flight (binary telemetry if the client accepts it)"""
     try:
         flight_data = chat_service.get_most_recent_flight()
         if not flight_data:
             raise HTTPException(status_code=404, detail="No flights found")
-        return flight_data
     except Exception as e:
         raise HTTPException(status_code=404, detail="No recent flight found")
+    return flight_response(flight_data, request.headers.get("accept"), request.headers.get("accept-encoding"))
+
+@app.get("/api/flights/{flight_id}/anomalies")
+async def get_flight_anomalies(flight_id: str):
+    """Get the background anomaly analysis status and result for a flight"""
+    status = anomaly_analysis.get_status(flight_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Flight not found")
+    return status
+
+@app.get("/api/flights/{flight_id}/signals")
+async def get_flight_signals(flight_id: str):
+    """List a flight's signals with sample counts, time ranges and fields"""
+    flight_data = flight_repository.peek(flight_id)
+    if flight_data is None:
+        raise HTTPException(status_code=404, detail="Flight not found")
+    manifest = flight_data.get("signal_manifest")
+    if manifest is None:
+        # Flights stored before manifests existed
+        flight_data = flight_repository.get(flight_id)
+        manifest = flight_data["telemetry"].manifest() if flight_data.get("telemetry") is not None else {}
+    return {"flight_id": flight_id, "signals": manifest}
+
+@app.get("/api/flights/{flight_id}/signals/{signal}")
+async def get_flight_signal(flight_id: str, signal: str, request: Request):
+    """Get one telemetry signal, binary if the client prefers it
+
+    Responses carry an ETag derived from the log's content hash; a matching
+    If-None-Match gets 304 without loading the telemetry.
+    """
+    metadata = flight_repository.peek(flight_id)
+    if metadata is None:
+        raise HTTPException(status_code=404, detail="Flight not found")
+    accept = request.headers.get("accept")
+    if etag_matches(request.headers.get("if-none-match"), signal_etag(metadata, signal, wants_binary(accept))):
+        return not_modified_response(metadata, signal, accept)
+
+    flight_data = flight_repository.get(flight_id)
+    telemetry = flight_data.get("telemetry")
+    if telemetry is None or signal not in telemetry:
+        raise HTTPException(status_code=404, detail="Signal not found")
+    return signal_response(flight_data, signal, accept, request.headers.get("accept-encoding"))
+
+@app.get("/api/flights/{flight_id}/telemetry")
+async def get_flight_telemetry(flight_id: str, signals: Optional[str] = None, start: Optional[float] = None,
+                               end: Optional[float] = None, points: Optional[int] = None,
+                               method: str = "minmax", fields: Optional[str] = None):
+    """Get downsampled telemetry for a time window
+
+    signals and fields are comma-separated; start and end are log
+    timestamps in seconds. At most `points` samples are returned per field
+    (min/max per bucket, bucket means with method=mean, or LTTB with
+    method=lttb), so the payload size does not depend on the length of the
+    log. minmax and mean are read from the flight's precomputed pyramid.
+    """
+    flight_data = flight_repository.get(flight_id)
+    if flight_data is None or flight_data.get("telemetry") is None:
+        raise HTTPException(status_code=404, detail="Flight not found")
+
+    telemetry = flight_data["telemetry"]
+    signal_names = signals.split(",") if signals else list(telemetry.keys())
+    points = max(4, min(points or Config.TELEMETRY_DEFAULT_POINTS, Config.TELEMETRY_MAX_POINTS))
+    try:
+        series = slice_telemetry(telemetry, signal_names, start, end, points, method,
+                                 fields.split(",") if fields else None)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "flight_id": flight_id,
+        "start": start,
+        "end": end,
+        "points": points,
+        "method": method,
+        "signals": series,
+    }
+
+@app.get("/api/live/vehicles")
+async def get_live_vehicles():
+    """Vehicles heard on the live MAVLink endpoint, with message counts and window sizes"""
+    return {
+        "enabled": bool(live_ingest.endpoint),
+        "endpoint": live_ingest.endpoint,
+        "buffer_samples": live_ingest.capacity,
+        "vehicles": live_ingest.vehicles(),
+    }
+
+@app.websocket("/api/live/ws")
+async def stream_live_telemetry(websocket: WebSocket, vehicle: Optional[int] = None,
+                                signals: Optional[str] = None, interval: Optional[float] = None):
+    """Stream live telemetry as JSON batches of the samples received since the last one
+
+    vehicle is a MAVLink system id (all vehicles if omitted), signals is
+    comma-separated and interval is the seconds between batches. The first
+    batch carries the retained window; each batch holds at most
+    Config.LIVE_BATCH_MAX_SAMPLES samples per signal, and samples left out
+    are counted under "skipped".
+    """
+    signal_names = tuple(signals.split(",")) if signals else LIVE_SIGNALS
+    unknown = [name for name in signal_names if name not in LIVE_SIGNALS]
+    if not live_ingest.endpoint:
+        await websocket.close(code=1008, reason="Live ingest is disabled (set LIVE_INGEST_ENDPOINT)")
+        return
+    if unknown:
+        await websocket.close(code=1008, reason=f"Unknown live signals: {', '.join(unknown)}")
+        return
+    await websocket.accept()
+
+    async def send_updates():
+        async for batch in live_ingest.subscribe(vehicle, signal_names, interval):
+            await websocket.send_json(batch)
+            LIVE_BATCHES.inc()
+
+    async def wait_for_disconnect():
+        # Clients only listen; reading notices when they go away
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(send_updates()), asyncio.create_task(wait_for_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 @app.get("/api/flights/{flight_id}")
-async def get_flight_details(flight_id: str):
-    """Get detailed flight information"""
+async def get_flight_details(flight_id: str, request: Request):
+    """Get detailed flight information
+
+    Telemetry is sent as raw typed arrays when the Accept header prefers
+    application/x-uav-telemetry, and as JSON otherwise; either is
+    compressed with zstd or gzip when the client accepts it.
+    """
     try:
-        return parser.get_flight_details(flight_id)
+        flight_data = parser.get_flight_details(flight_id)
     except Exception as e:
         raise HTTPException(status_code=404, detail="Flight not found")
+    return flight_response(flight_data, request.headers.get("accept"), request.headers.get("accept-encoding"))
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
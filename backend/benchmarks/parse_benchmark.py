@@ -0,0 +1,286 @@
+"""Parse-throughput benchmarks over synthetic DataFlash logs.
+
+Each case parses a generated log, summarizes it and serializes the result,
+in a fresh process so peak RSS belongs to that case alone. Results are
+written as JSON; two result files can be compared to catch regressions.
+
+Run from the backend directory:
+
+    python -m benchmarks.parse_benchmark run --sizes 1,10,100 --output after.json
+    python -m benchmarks.parse_benchmark compare before.json after.json --threshold 0.1
+
+compare exits with status 1 when any case regressed by more than the
+threshold, so it can gate a release.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from typing import Dict, List, Any, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak RSS is then not reported
+    resource = None
+
+from benchmarks.synthetic_log import generate_log, MESSAGE_MIXES
+
+RESULTS_VERSION = 1
+STAGES = ("parse", "summary", "serialize_npz", "serialize_binary", "serialize_json")
+DEFAULT_SIZES_MB = (1, 10, 50, 100)
+MB = 1024 * 1024
+
+
+def _peak_rss_mb() -> Optional[float]:
+    # VmHWM is reset by exec; ru_maxrss would include the parent's peak
+    # inherited through fork
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / MB if sys.platform == "darwin" else peak / 1024
+
+
+def _run_case(path: str, engine: str, stages: List[str]) -> Dict[str, Any]:
+    """One parse of one log with per-stage timings (runs in a child process)"""
+    from config import Config
+    from mavlink_parser import MAVLinkParser
+    from telemetry_store import flight_to_jsonable
+    from telemetry_transport import encode_flight_binary
+
+    # The benchmark measures throughput, so the production message cap
+    # must not reject the largest logs
+    Config.MAX_LOG_MESSAGES = sys.maxsize
+    parser = MAVLinkParser()
+    timings, sizes, rss = {}, {}, {"baseline": _peak_rss_mb()}
+
+    start = time.perf_counter()
+    flight_data = parser.parse_bin_file(path, engine=engine, summarize=False)
+    timings["parse"] = time.perf_counter() - start
+    rss["parse"] = _peak_rss_mb()
+
+    for stage in stages:
+        if stage == "parse":
+            continue
+        start = time.perf_counter()
+        if stage == "summary":
+            parser.summarize_flight(flight_data)
+        elif stage == "serialize_npz":
+            with tempfile.TemporaryDirectory() as tmp:
+                npz_path = os.path.join(tmp, "telemetry.npz")
+                flight_data["telemetry"].save_npz(npz_path)
+                sizes[stage] = os.path.getsize(npz_path)
+        elif stage == "serialize_binary":
+            sizes[stage] = len(encode_flight_binary(flight_data))
+        elif stage == "serialize_json":
+            sizes[stage] = len(json.dumps(flight_to_jsonable(flight_data), default=str))
+        timings[stage] = time.perf_counter() - start
+        rss[stage] = _peak_rss_mb()
+
+    return {
+        "messages": flight_data["total_messages"],
+        "timings": timings,
+        "output_bytes": sizes,
+        "rss_mb": rss,
+    }
+
+
+def _environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+def run_benchmarks(sizes_mb: List[float], mixes: List[str], engine: str = "bulk", repeat: int = 3,
+                   stages: List[str] = STAGES, log_dir: Optional[str] = None, seed: int = 0) -> Dict[str, Any]:
+    """Benchmark every (mix, size) case and return the results document.
+
+    Logs are generated once per case into log_dir (reused if already
+    there). Stage times are the median over `repeat` runs, each in a fresh
+    process; peak RSS is the largest seen in any run.
+    """
+    log_dir = log_dir or os.path.join(tempfile.gettempdir(), "uav_benchmark_logs")
+    os.makedirs(log_dir, exist_ok=True)
+    cases = []
+    for mix in mixes:
+        for size_mb in sizes_mb:
+            name = f"{mix}-{size_mb:g}mb"
+            path = os.path.join(log_dir, f"{mix}_{size_mb:g}mb_seed{seed}.bin")
+            if not os.path.exists(path):
+                generate_log(path, int(size_mb * MB), mix, seed)
+            log_bytes = os.path.getsize(path)
+
+            runs = []
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                    runs.append(pool.submit(_run_case, path, engine, list(stages)).result())
+
+            stage_results = {}
+            for stage in stages:
+                samples = [run["timings"][stage] for run in runs if stage in run["timings"]]
+                if samples:
+                    stage_results[stage] = {"median": statistics.median(samples), "min": min(samples),
+                                            "samples": samples}
+            parse_time = stage_results["parse"]["median"]
+            peaks = [run["rss_mb"][stage] for run in runs for stage in run["rss_mb"]
+                     if run["rss_mb"][stage] is not None]
+            case = {
+                "name": name,
+                "mix": mix,
+                "size_mb": size_mb,
+                "bytes": log_bytes,
+                "messages": runs[0]["messages"],
+                "repeat": repeat,
+                "stages": stage_results,
+                "messages_per_s": runs[0]["messages"] / parse_time,
+                "mb_per_s": log_bytes / MB / parse_time,
+                "peak_rss_mb": max(peaks) if peaks else None,
+                "baseline_rss_mb": runs[0]["rss_mb"]["baseline"],
+                "output_bytes": runs[0]["output_bytes"],
+            }
+            cases.append(case)
+            print(_format_case(case), file=sys.stderr)
+
+    return {
+        "version": RESULTS_VERSION,
+        "created": datetime.now().isoformat(),
+        "engine": engine,
+        "seed": seed,
+        "environment": _environment(),
+        "cases": cases,
+    }
+
+
+def _format_case(case: Dict[str, Any]) -> str:
+    stages = "  ".join(f"{stage}={result['median'] * 1000:.1f}ms" for stage, result in case["stages"].items())
+    rss = f"{case['peak_rss_mb']:.0f}MB" if case["peak_rss_mb"] is not None else "n/a"
+    return (f"{case['name']:<18} {case['messages']:>9} msgs  {case['messages_per_s']:>12,.0f} msg/s  "
+            f"{case['mb_per_s']:>7.1f} MB/s  peak RSS {rss}  {stages}")
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1,
+                    min_delta: float = 0.005) -> Dict[str, Any]:
+    """Compare two results documents case by case.
+
+    A stage regresses when its median time grows by more than `threshold`
+    (relative) and `min_delta` seconds (absolute, to ignore timer noise);
+    peak RSS regresses when it grows by more than `threshold`.
+    """
+    baseline_cases = {case["name"]: case for case in baseline["cases"]}
+    rows, regressions = [], []
+    for case in current["cases"]:
+        before = baseline_cases.get(case["name"])
+        if before is None:
+            continue
+        metrics = [(f"{stage}_s", before["stages"][stage]["median"], result["median"], min_delta)
+                   for stage, result in case["stages"].items() if stage in before["stages"]]
+        if case.get("peak_rss_mb") is not None and before.get("peak_rss_mb") is not None:
+            metrics.append(("peak_rss_mb", before["peak_rss_mb"], case["peak_rss_mb"], 0.0))
+        for metric, old, new, floor in metrics:
+            change = (new - old) / old if old else 0.0
+            regressed = change > threshold and new - old > floor
+            row = {"case": case["name"], "metric": metric, "baseline": old, "current": new,
+                   "change": change, "regressed": regressed}
+            rows.append(row)
+            if regressed:
+                regressions.append(row)
+
+    return {
+        "threshold": threshold,
+        "baseline_commit": baseline.get("environment", {}).get("commit"),
+        "current_commit": current.get("environment", {}).get("commit"),
+        "comparisons": rows,
+        "regressions": regressions,
+        "missing_cases": sorted(set(baseline_cases) - {case["name"] for case in current["cases"]}),
+    }
+
+
+def _print_comparison(report: Dict[str, Any]):
+    print(f"{'case':<18} {'metric':<22} {'baseline':>12} {'current':>12} {'change':>8}")
+    for row in report["comparisons"]:
+        flag = "  REGRESSION" if row["regressed"] else ""
+        print(f"{row['case']:<18} {row['metric']:<22} {row['baseline']:>12.4f} {row['current']:>12.4f} "
+              f"{row['change']:>+8.1%}{flag}")
+    if report["missing_cases"]:
+        print(f"Not in current run: {', '.join(report['missing_cases'])}")
+    print(f"{len(report['regressions'])} regression(s) above {report['threshold']:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parser throughput benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmarks and write JSON results")
+    run.add_argument("--sizes", default=",".join(f"{size:g}" for size in DEFAULT_SIZES_MB),
+                     help="comma-separated log sizes in MiB")
+    run.add_argument("--mixes", default="copter", help=f"comma-separated message mixes ({', '.join(MESSAGE_MIXES)})")
+    run.add_argument("--engine", default="bulk", choices=["bulk", "pymavlink", "auto"])
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--stages", default=",".join(STAGES), help="comma-separated stages (parse always runs)")
+    run.add_argument("--log-dir", help="where generated logs are kept (default: system temp dir)")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--output", "-o", help="results file (default: stdout)")
+
+    compare = commands.add_parser("compare", help="compare two results files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown")
+    compare.add_argument("--min-delta", type=float, default=0.005, help="ignore time changes below this (s)")
+    compare.add_argument("--output", "-o", help="also write the comparison as JSON")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        stages = [stage for stage in args.stages.split(",") if stage]
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+        results = run_benchmarks([float(size) for size in args.sizes.split(",")], args.mixes.split(","),
+                                 args.engine, args.repeat, ["parse"] + [s for s in stages if s != "parse"],
+                                 args.log_dir, args.seed)
+        output = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output)
+        else:
+            print(output)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        report = compare_results(baseline, current, args.threshold, args.min_delta)
+        _print_comparison(report)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        sys.exit(1 if report["regressions"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Deterministic synthetic DataFlash (.bin) logs for parser benchmarks.
+
+Logs are built from FMT records plus message streams at fixed rates, so a
+given (size, mix, seed) always produces the same bytes. Record layouts
+follow current ArduPilot formats and are packed with the same dtypes the
+bulk decoder reads them with.
+
+    python -m benchmarks.synthetic_log flight.bin --size-mb 10 --mix copter
+"""
+import argparse
+import os
+import numpy as np
+from typing import Dict, Any, Callable
+
+from dataflash_decoder import DataFlashFormat, FORMAT_TO_DTYPE, FMT_STRUCT, FMT_TYPE, HEAD1, HEAD2
+
+GPS_WEEK = 2200
+GPS_START_MS = 345600000  # Tuesday 00:00 of GPS_WEEK
+HOME_LAT = -35.3632621
+HOME_LON = 149.1652374
+
+# name: (type id, format characters, columns)
+MESSAGE_FORMATS = {
+    "GPS": (130, "QBBIHBcLLeffffB", "TimeUS,I,Status,GMS,GWk,NSats,HDop,Lat,Lng,Alt,Spd,GCrs,VZ,Yaw,U"),
+    "ATT": (131, "QccccCCffB", "TimeUS,DesRoll,Roll,DesPitch,Pitch,DesYaw,Yaw,ErrRP,ErrYaw,AEKF"),
+    "BAT": (132, "QBfffffcfBBB", "TimeUS,Inst,Volt,VoltR,Curr,CurrTot,EnrgTot,Temp,Res,RemPct,H,SH"),
+    "VIBE": (133, "QfffIII", "TimeUS,VibeX,VibeY,VibeZ,Clip0,Clip1,Clip2"),
+    "BARO": (134, "QBffcfIffB", "TimeUS,I,Alt,Press,Temp,CRt,SMS,Offset,GndTemp,Health"),
+    "MODE": (135, "QMBB", "TimeUS,Mode,ModeNum,Rsn"),
+    "IMU": (136, "QBffffffIIfBBHH", "TimeUS,I,GyrX,GyrY,GyrZ,AccX,AccY,AccZ,EG,EA,T,GH,AH,GHz,AHz"),
+    "RCOU": (137, "QHHHHHHHHHHHHHH", "TimeUS,C1,C2,C3,C4,C5,C6,C7,C8,C9,C10,C11,C12,C13,C14"),
+    "CTUN": (138, "Qffffffeccf", "TimeUS,ThI,ABst,ThO,ThH,DAlt,Alt,BAlt,DSAlt,SAlt,TAlt"),
+}
+
+# Message rates in Hz. copter resembles a default ArduCopter log, where
+# most bytes are IMU and other types the viewer does not decode;
+# telemetry holds only decoded types at high rates, so decoding dominates;
+# scan is almost all IMU and RC output, so walking the records dominates.
+MESSAGE_MIXES = {
+    "copter": {"IMU": 400, "ATT": 100, "RCOU": 25, "CTUN": 25, "GPS": 5, "BAT": 10, "VIBE": 10,
+               "BARO": 10, "MODE": 0.01},
+    "telemetry": {"ATT": 400, "GPS": 10, "BAT": 50, "VIBE": 50, "BARO": 50, "MODE": 0.05},
+    "scan": {"IMU": 1000, "RCOU": 50, "ATT": 1, "GPS": 1, "BAT": 1, "MODE": 0.01},
+}
+
+
+def _fmt_record(name: str, fmt: DataFlashFormat) -> bytes:
+    return bytes([HEAD1, HEAD2, FMT_TYPE]) + FMT_STRUCT.pack(
+        fmt.type_id, fmt.length, name.encode(), fmt.format_chars.encode(), ",".join(fmt.columns).encode())
+
+
+def _gps(t: np.ndarray, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    n = len(t)
+    # A slow circuit around home, with occasional fix dropouts
+    angle = t / 120.0
+    status = np.where(rng.random(n) < 0.002, 1, 3)
+    return {
+        "Status": status, "GMS": GPS_START_MS + np.round(t * 1000), "GWk": np.full(n, GPS_WEEK),
+        "NSats": np.where(status == 3, 14, 4), "HDop": rng.integers(70, 160, n),
+        "Lat": np.round((HOME_LAT + 0.002 * np.sin(angle)) * 1e7),
+        "Lng": np.round((HOME_LON + 0.002 * np.cos(angle)) * 1e7),
+        "Alt": np.round((584 + 40 * (1 - np.cos(t / 300.0))) * 100),
+        "Spd": 8 + rng.normal(0, 0.5, n), "GCrs": np.degrees(angle) % 360, "U": np.ones(n),
+    }
+
+
+def _att(t: np.ndarray, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    n = len(t)
+    roll = 800 * np.sin(t / 3.0) + rng.normal(0, 50, n)
+    pitch = 600 * np.cos(t / 4.0) + rng.normal(0, 50, n)
+    yaw = (np.degrees(t / 120.0) * 100) % 36000
+    return {"DesRoll": roll, "Roll": roll + rng.normal(0, 20, n), "DesPitch": pitch,
+            "Pitch": pitch + rng.normal(0, 20, n), "DesYaw": yaw, "Yaw": yaw,
+            "ErrRP": rng.random(n) * 0.05, "ErrYaw": rng.random(n) * 0.05, "AEKF": np.ones(n)}
+
+
+def _bat(t: np.ndarray, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    n = len(t)
+    current = 18 + 6 * np.sin(t / 20.0) + rng.normal(0, 1, n)
+    used = np.cumsum(np.maximum(current, 0)) * (np.diff(t, prepend=t[:1]).mean() if n > 1 else 0) / 3.6
+    voltage = 16.8 - 2.0 * used / 5000 - 0.015 * current + rng.normal(0, 0.02, n)
+    return {"Volt": voltage, "VoltR": voltage + 0.015 * current, "Curr": current, "CurrTot": used,
+            "EnrgTot": used * voltage / 1000, "Temp": np.full(n, 3100), "Res": np.full(n, 0.015),
+            "RemPct": np.clip(100 - used / 50, 0, 100)}
+
+
+def _vibe(t: np.ndarray, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    n = len(t)
+    return {"VibeX": np.abs(rng.normal(8, 3, n)), "VibeY": np.abs(rng.normal(8, 3, n)),
+            "VibeZ": np.abs(rng.normal(15, 5, n)), "Clip0": np.arange(n) // 5000,
+            "Clip1": np.zeros(n), "Clip2": np.zeros(n)}
+
+
+def _baro(t: np.ndarray, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    n = len(t)
+    alt = 40 * (1 - np.cos(t / 300.0)) + rng.normal(0, 0.2, n)
+    return {"Alt": alt, "Press": 101325 - 12 * alt, "Temp": np.full(n, 3500),
+            "CRt": np.gradient(alt) if n > 1 else np.zeros(n), "SMS": np.round(t * 1000),
+            "GndTemp": np.full(n, 25.0), "Health": np.ones(n)}
+
+
+def _mode(t: np.ndarray, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    modes = np.array([0, 5, 3, 6, 9])  # stabilize, loiter, auto, rtl, land
+    mode = modes[np.arange(len(t)) % len(modes)]
+    return {"Mode": mode, "ModeNum": mode, "Rsn": np.ones(len(t))}
+
+
+def _imu(t: np.ndarray, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    n = len(t)
+    return {"GyrX": rng.normal(0, 0.05, n), "GyrY": rng.normal(0, 0.05, n), "GyrZ": rng.normal(0, 0.05, n),
+            "AccX": rng.normal(0, 0.3, n), "AccY": rng.normal(0, 0.3, n), "AccZ": rng.normal(-9.81, 0.5, n),
+            "T": np.full(n, 40.0), "GH": np.ones(n), "AH": np.ones(n), "GHz": np.full(n, 400),
+            "AHz": np.full(n, 400)}
+
+
+def _rcou(t: np.ndarray, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    n = len(t)
+    return {f"C{i}": 1500 + rng.integers(-300, 300, n) if i <= 4 else np.full(n, 1500) for i in range(1, 15)}
+
+
+def _ctun(t: np.ndarray, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    n = len(t)
+    alt = 40 * (1 - np.cos(t / 300.0))
+    return {"ThI": np.full(n, 0.45), "ThO": 0.45 + rng.normal(0, 0.05, n), "ThH": np.full(n, 0.45),
+            "DAlt": alt, "Alt": alt + rng.normal(0, 0.2, n), "BAlt": alt, "DSAlt": alt * 100,
+            "SAlt": alt * 100, "TAlt": np.zeros(n)}
+
+
+GENERATORS: Dict[str, Callable[[np.ndarray, np.random.Generator], Dict[str, np.ndarray]]] = {
+    "GPS": _gps, "ATT": _att, "BAT": _bat, "VIBE": _vibe, "BARO": _baro, "MODE": _mode,
+    "IMU": _imu, "RCOU": _rcou, "CTUN": _ctun,
+}
+
+
+def generate_log(path: str, size_bytes: int, mix: str = "copter", seed: int = 0) -> Dict[str, Any]:
+    """Write a log of at most size_bytes with the given message mix.
+
+    The flight lasts as long as the mix needs to fill size_bytes; messages
+    are interleaved in timestamp order. Returns the log's size, duration
+    and message counts.
+    """
+    if mix not in MESSAGE_MIXES:
+        raise Exception(f"Unknown message mix '{mix}' (expected one of {', '.join(MESSAGE_MIXES)})")
+    rates = MESSAGE_MIXES[mix]
+    rng = np.random.default_rng(seed)
+
+    formats = {}
+    for name in rates:
+        type_id, format_chars, columns = MESSAGE_FORMATS[name]
+        columns = columns.split(",")
+        payload = np.dtype([(column, FORMAT_TO_DTYPE[char]) for column, char in zip(columns, format_chars)])
+        formats[name] = DataFlashFormat(type_id, name, payload.itemsize + 3, format_chars, columns)
+    header = b"".join(_fmt_record(name, fmt) for name, fmt in formats.items())
+
+    bytes_per_second = sum(rate * formats[name].length for name, rate in rates.items())
+    duration = max(size_bytes - len(header), 0) / bytes_per_second
+
+    # Per type: timestamps and packed records (header + payload)
+    streams = []
+    for name, rate in rates.items():
+        fmt = formats[name]
+        count = int(duration * rate)
+        # Offset each stream's phase so types don't all land on the same instant
+        t = (np.arange(count) + (fmt.type_id % 7) / 7.0) / rate
+        values = GENERATORS[name](t, rng)
+        record_dtype = np.dtype([("head", "u1", (3,)), ("payload", fmt.dtype)])
+        records = np.zeros(count, dtype=record_dtype)
+        records["head"] = (HEAD1, HEAD2, fmt.type_id)
+        records["payload"]["TimeUS"] = np.round((t + 30.0) * 1e6)  # boot 30 s before logging starts
+        for column, column_values in values.items():
+            records["payload"][column] = column_values
+        streams.append((t, records.view(np.uint8).reshape(count, fmt.length)))
+
+    # Interleave in time order (stable, so equal timestamps keep type order)
+    times = np.concatenate([t for t, _ in streams])
+    lengths = np.concatenate([np.full(len(t), rows.shape[1]) for t, rows in streams])
+    order = np.argsort(times, kind="stable")
+    starts = np.empty(len(order), dtype=np.int64)
+    starts[order] = np.concatenate(([0], np.cumsum(lengths[order])[:-1])) if len(order) else []
+
+    body = np.empty(int(lengths.sum()), dtype=np.uint8)
+    first = 0
+    for t, rows in streams:
+        offsets = starts[first:first + len(t)]
+        body[offsets[:, None] + np.arange(rows.shape[1])] = rows
+        first += len(t)
+
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(body.tobytes())
+
+    return {
+        "path": path,
+        "mix": mix,
+        "seed": seed,
+        "bytes": os.path.getsize(path),
+        "duration": duration,
+        "messages": len(formats) + len(order),
+        "message_types": {name: int(duration * rate) for name, rate in rates.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic DataFlash log")
+    parser.add_argument("path")
+    parser.add_argument("--size-mb", type=float, default=10, help="target size in MiB (upper bound)")
+    parser.add_argument("--mix", default="copter", choices=sorted(MESSAGE_MIXES))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    info = generate_log(args.path, int(args.size_mb * 1024 * 1024), args.mix, args.seed)
+    print(f"{info['path']}: {info['bytes']} bytes, {info['messages']} messages, {info['duration']:.0f} s ({info['mix']})")
+
+
+if __name__ == "__main__":
+    main()
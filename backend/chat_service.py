@@ -1,290 +1,255 @@
-import openai
-import anthropic
+import asyncio
 import json
-from typing import Dict, Any, Optional
+import time
+from typing import Dict, Any, Optional, AsyncIterator, Tuple
 import os
 from datetime import datetime
 from dotenv import load_dotenv
 from memory_service import agent_memory
+from flight_repository import FlightRepository
+from llm_providers import create_llm_provider
+from response_cache import ResponseCache
+from flight_prompt import build_system_prompt_prefix, format_anomaly_analysis
+from metrics import chat_phase, CHAT_PHASE_SECONDS, CHAT_REQUESTS
 
 # Load environment variables from .env file
 load_dotenv()
 
 class ChatService:
-    def __init__(self):
-        # Initialize API clients
-        self.openai_client = None
-        self.anthropic_client = None
-
-        # Try to initialize OpenAI
-        openai_key = os.getenv("OPENAI_API_KEY")
-        if openai_key:
-            self.openai_client = openai.OpenAI(api_key=openai_key)
-
-        # Try to initialize Anthropic
-        anthropic_key = os.getenv("ANTHROPIC_API_KEY")
-        if anthropic_key:
-            self.anthropic_client = anthropic.Anthropic(api_key=anthropic_key)
-
-        # Flight data cache
-        self.flight_cache = {}
-        self.flight_cache_file = "flight_cache.json"
-        self.load_flight_cache()
+    def __init__(self, repository: FlightRepository = None):
+        # Async LLM client (None when no API key is configured)
+        self.llm_provider = create_llm_provider()
+
+        # Answers to repeated questions about the same flight skip the LLM
+        self.response_cache = ResponseCache()
+
+        # Analyzed flights, shared with the parser
+        self.repository = repository if repository is not None else FlightRepository()
 
     async def process_message(self, message: str, flight_id: str = None) -> Dict[str, Any]:
-        """Process chat message about flight data with advanced memory"""
+        """Process chat message about flight data with advanced memory
+
+        The result includes the time spent in each phase ("timings") and
+        the LLM tokens used ("usage"); both are also recorded in metrics.
+        """
+        started = time.perf_counter()
+        timings, usage = {}, {}
         try:
             # Validate input
             if not message or not message.strip():
-                return {
-                    "answer": "Please enter a message to get started!",
-                    "flight_data": None,
-                    "proactive_suggestions": [],
-                    "comparison_insights": "",
-                    "timestamp": datetime.now().isoformat()
-                }
-            
-            # Truncate very long messages
-            if len(message) > 2000:
-                message = message[:2000] + "..."
-
-            # Get flight data if flight_id provided
-            flight_data = None
-            if flight_id:
-                flight_data = self._get_flight_data(flight_id)
-
-            # Get conversation context from memory
-            conversation_context = ""
-            if flight_id:
-                conversation_context = agent_memory.get_conversation_context(flight_id)
+                return self._empty_message_response()
+
+            message, cached_response, flight_data = await self._prepare_message(message, flight_id, timings)
 
             # Generate response using LLM with timeout protection
             response = None
             try:
-                if self.openai_client:
-                    response = await self._query_openai(message, flight_data, conversation_context)
-                elif self.anthropic_client:
-                    response = await self._query_anthropic(message, flight_data, conversation_context)
+                if cached_response is not None:
+                    source = "cache"
+                    response = cached_response
+                elif self.llm_provider:
+                    source = "provider"
+                    conversation_context = self._get_conversation_context(flight_id, timings)
+                    response = await self._query_llm(message, flight_data, conversation_context, timings, usage)
+                    self.response_cache.put(flight_id, message, response)
                 else:
+                    source = "fallback"
                     response = self._fallback_response(message, flight_data)
             except Exception as llm_error:
                 print(f"LLM Error: {llm_error}")
+                source = "provider_error"
                 response = self._fallback_response(message, flight_data, error=str(llm_error))
+            CHAT_REQUESTS.inc(source=source)
+
+            result = self._finish_message(message, response, flight_id, flight_data, timings)
+            return self._with_timings(result, timings, usage, started)
+        except Exception as e:
+            print(f"Chat service error: {e}")
+            CHAT_REQUESTS.inc(source="error")
+            return self._with_timings(self._error_response(e), timings, usage, started)
+
+    async def stream_message(self, message: str, flight_id: str = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Streaming variant of process_message.
+
+        Yields ("token", {"text": ...}) events as the model produces text,
+        then one ("done", result) event once memory and suggestions have been
+        updated. The result matches process_message().
+        """
+        started = time.perf_counter()
+        timings, usage = {}, {}
+        try:
+            if not message or not message.strip():
+                result = self._empty_message_response()
+                yield "token", {"text": result["answer"]}
+                yield "done", result
+                return
 
-            # Store conversation in memory
-            if flight_id:
+            message, cached_response, flight_data = await self._prepare_message(message, flight_id, timings)
+
+            fragments = []
+            try:
+                if cached_response is not None:
+                    source = "cache"
+                    fragments.append(cached_response)
+                    yield "token", {"text": cached_response}
+                elif self.llm_provider:
+                    source = "provider"
+                    conversation_context = self._get_conversation_context(flight_id, timings)
+                    with chat_phase("prompt_build", timings):
+                        system_prompt, system_suffix = self._build_system_prompt(flight_data, conversation_context)
+                    provider_started = time.perf_counter()
+                    async for text in self.llm_provider.stream(system_prompt, message, max_tokens=700,
+                                                               system_suffix=system_suffix, usage=usage):
+                        if not fragments:
+                            first_token = time.perf_counter() - provider_started
+                            CHAT_PHASE_SECONDS.observe(first_token, phase="first_token")
+                            timings["first_token"] = first_token
+                        fragments.append(text)
+                        yield "token", {"text": text}
+                    # Includes the time the client took to read the tokens
+                    provider_seconds = time.perf_counter() - provider_started
+                    CHAT_PHASE_SECONDS.observe(provider_seconds, phase="provider")
+                    timings["provider"] = provider_seconds
+                    self.response_cache.put(flight_id, message, "".join(fragments))
+                else:
+                    source = "fallback"
+                    fragments.append(self._fallback_response(message, flight_data))
+                    yield "token", {"text": fragments[-1]}
+            except Exception as llm_error:
+                print(f"LLM Error: {llm_error}")
+                source = "provider_error"
+                if not fragments:
+                    fragments.append(self._fallback_response(message, flight_data, error=str(llm_error)))
+                    yield "token", {"text": fragments[-1]}
+            CHAT_REQUESTS.inc(source=source)
+
+            result = self._finish_message(message, "".join(fragments), flight_id, flight_data, timings)
+            yield "done", self._with_timings(result, timings, usage, started)
+        except Exception as e:
+            print(f"Chat service error: {e}")
+            CHAT_REQUESTS.inc(source="error")
+            yield "done", self._with_timings(self._error_response(e), timings, usage, started)
+
+    async def _prepare_message(self, message: str, flight_id: Optional[str],
+                               timings: Dict[str, float]) -> Tuple[str, Optional[str], Optional[Dict]]:
+        """Truncate the message, then look up a cached answer and the flight
+
+        Returns the message, the cached answer (None on a miss) and the
+        flight's metadata. Telemetry is only loaded for a flight without a
+        stored prompt context that is about to be asked to the LLM.
+        """
+        # Truncate very long messages
+        if len(message) > 2000:
+            message = message[:2000] + "..."
+
+        with chat_phase("cache_lookup", timings):
+            cached_response = self.response_cache.get(flight_id, message)
+
+        # Get flight data if flight_id provided
+        flight_data = None
+        if flight_id:
+            with chat_phase("flight_lookup", timings):
+                flight_data = self.repository.peek(flight_id)
+                if (flight_data is not None and cached_response is None and self.llm_provider
+                        and flight_data.get("prompt_context") is None):
+                    # Flights stored before the prompt context was rendered at upload
+                    flight_data = await asyncio.to_thread(self.repository.get, flight_id)
+
+        return message, cached_response, flight_data
+
+    def _get_conversation_context(self, flight_id: Optional[str], timings: Dict[str, float]) -> str:
+        """Earlier turns about the flight from memory, for the LLM prompt"""
+        if not flight_id:
+            return ""
+        with chat_phase("memory_lookup", timings):
+            return agent_memory.get_conversation_context(flight_id)
+
+    def _finish_message(self, message: str, response: str, flight_id: Optional[str],
+                        flight_data: Optional[Dict], timings: Dict[str, float]) -> Dict[str, Any]:
+        """Record the turn in memory and gather suggestions and comparison insights"""
+        # Store conversation in memory
+        if flight_id:
+            with chat_phase("save_memory", timings):
                 agent_memory.add_conversation_turn(
                     user_message=message,
                     assistant_response=response,
                     flight_id=flight_id,
-                    context={"flight_data": flight_data}
+                    flight_data=flight_data
                 )
 
-            # Get proactive suggestions
-            suggestions = []
-            if flight_id and flight_data:
+        # Get proactive suggestions
+        suggestions = []
+        if flight_id and flight_data:
+            with chat_phase("suggestions", timings):
                 suggestions = agent_memory.get_proactive_suggestions(flight_id, flight_data)
 
-            # Get flight comparison insights
-            comparison_insights = ""
-            if flight_id and flight_data:
+        # Get flight comparison insights
+        comparison_insights = ""
+        if flight_id and flight_data:
+            with chat_phase("comparison_insights", timings):
                 comparison_insights = agent_memory.get_flight_comparison_insights(flight_id, flight_data)
 
-            return {
-                "answer": response,
-                "flight_data": flight_data or {},
-                "proactive_suggestions": suggestions,
-                "comparison_insights": comparison_insights,
-                "timestamp": datetime.now().isoformat()
-            }
-        except Exception as e:
-            print(f"Chat service error: {e}")
-            return {
-                "answer": f"I'm having trouble processing your request. Please try again or upload a new flight file. Error: {str(e)}",
-                "flight_data": None,
-                "proactive_suggestions": ["Try uploading a different .bin file", "Ask a simpler question", "Check your internet connection"],
-                "comparison_insights": "",
-                "timestamp": datetime.now().isoformat()
-            }
-
-    async def _query_openai(self, message: str, flight_data: Optional[Dict], conversation_context: str = "") -> str:
-        """Query OpenAI with flight data context and conversation memory"""
-        system_prompt = self._build_system_prompt(flight_data, conversation_context)
-
-        response = self.openai_client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": message}
-            ],
-            max_tokens=700,
-            temperature=0.7
-        )
-
-        return response.choices[0].message.content
-
-    async def _query_anthropic(self, message: str, flight_data: Optional[Dict], conversation_context: str = "") -> str:
-        """Query Anthropic with flight data context and conversation memory"""
-        system_prompt = self._build_system_prompt(flight_data, conversation_context)
-
-        response = self.anthropic_client.messages.create(
-            model="claude-3-sonnet-20240229",
-            max_tokens=700,
-            system=system_prompt,
-            messages=[
-                {"role": "user", "content": message}
-            ]
-        )
-
-        return response.content[0].text
-
-    def _build_system_prompt(self, flight_data: Optional[Dict], conversation_context: str = "") -> str:
-        """Build system prompt with flight data context and conversation memory"""
-        base_prompt = """You are an expert UAV flight data analyst with advanced memory capabilities. You help users understand flight telemetry data, identify issues, and provide insights about drone flights.
-
-You can analyze:
-- GPS coordinates and flight paths
-- Altitude and speed data
-- Battery performance
-- Vibration levels
-- Flight anomalies
-- Safety concerns
-
-IMPORTANT: You have conversation memory and should:
-1. Reference previous discussions when relevant
-2. Build upon earlier analyses
-3. Avoid repeating information already covered
-4. Provide progressive insights that deepen understanding
-5. Be proactive in suggesting related topics
-
-Provide clear, technical answers while being accessible to users."""
-
-        context_parts = []
-        
-        if conversation_context:
-            context_parts.append(f"\nConversation History:\n{conversation_context}")
-
-        if flight_data:
-            summary = flight_data.get("summary", {})
-            telemetry_summary = summary.get("telemetry_summary", {})
-
-            flight_context = f"""
-Current Flight Data:
-- Duration: {summary.get('duration', 'Unknown')} seconds
-- Max Altitude: {summary.get('max_altitude', 'Unknown')} meters
-- GPS Points: {len(flight_data.get('telemetry', {}).get('gps', []))}
-- Battery Data Points: {len(flight_data.get('telemetry', {}).get('battery', []))}
-
-Telemetry Analysis Patterns (analyze for anomalies dynamically):
-{self._format_telemetry_patterns(telemetry_summary)}
-
-Automatic Anomaly Analysis Results:
-{self._format_anomaly_analysis(summary.get('anomaly_analysis', {}))}
-
-IMPORTANT: Instead of rigid rules, analyze these patterns to identify:
-- Unusual GPS behavior (look for patterns, not fixed thresholds)
-- Concerning vibration trends (consider context and flight phase)
-- Battery performance issues (analyze voltage trends and current draw)
-- Altitude anomalies (sudden changes, unexpected patterns)
-- System stability indicators (correlate multiple sensors)
-
-Use your expertise to reason about these patterns contextually."""
-            
-            context_parts.append(flight_context)
-        else:
-            no_flight_context = """
-No flight data is currently loaded. You can:
-1. Answer general questions about UAV analysis, MAVLink protocol, or flight safety
-2. Provide guidance on what to look for in flight logs
-3. Explain common flight anomalies and their causes
-4. Help interpret flight telemetry data concepts
-5. Suggest the user upload a .bin flight log file for specific analysis
-
-Be helpful and informative even without specific flight data."""
-            
-            context_parts.append(no_flight_context)
-
-        return base_prompt + "".join(context_parts)
-
-    def _format_telemetry_patterns(self, telemetry_summary: Dict[str, Any]) -> str:
-        """Format telemetry patterns for LLM analysis"""
-        if not telemetry_summary:
-            return "No telemetry patterns available for analysis."
-        
-        formatted_patterns = []
-        
-        # GPS patterns
-        if "gps_patterns" in telemetry_summary:
-            gps = telemetry_summary["gps_patterns"]
-            formatted_patterns.append(f"""
-GPS Signal Quality:
-- Total GPS readings: {gps.get('total_points', 0)}
-- Fix types: {gps.get('fix_type_distribution', {})}
-- HDOP range: {gps.get('hdop_range', {})}
-- Satellite count range: {gps.get('satellite_range', {})}""")
-        
-        # Vibration patterns
-        if "vibration_patterns" in telemetry_summary:
-            vibe = telemetry_summary["vibration_patterns"]
-            formatted_patterns.append(f"""
-Vibration Analysis:
-- Total vibration readings: {vibe.get('total_readings', 0)}
-- X-axis range: {vibe.get('x_axis', {})}
-- Y-axis range: {vibe.get('y_axis', {})}
-- Z-axis range: {vibe.get('z_axis', {})}""")
-        
-        # Battery patterns
-        if "battery_patterns" in telemetry_summary:
-            battery = telemetry_summary["battery_patterns"]
-            formatted_patterns.append(f"""
-Battery Performance:
-- Total battery readings: {battery.get('total_readings', 0)}
-- Voltage trend: {battery.get('voltage_trend', [])}
-- Voltage range: {battery.get('voltage_range', {})}
-- Current range: {battery.get('current_range', {})}""")
-        
-        # Altitude patterns
-        if "altitude_patterns" in telemetry_summary:
-            altitude = telemetry_summary["altitude_patterns"]
-            formatted_patterns.append(f"""
-Altitude Behavior:
-- Total position readings: {altitude.get('total_points', 0)}
-- Altitude range: {altitude.get('altitude_range', {})}
-- Largest climb: {altitude.get('largest_climb', 0)}m
-- Largest descent: {altitude.get('largest_descent', 0)}m
-- Altitude profile: {altitude.get('altitude_profile', [])}""")
-        
-        return "\n".join(formatted_patterns) if formatted_patterns else "No detailed telemetry patterns available."
-    
-    def _format_anomaly_analysis(self, anomaly_analysis: Dict[str, Any]) -> str:
-        """Format anomaly analysis results for LLM context"""
-        if not anomaly_analysis:
-            return "No automatic anomaly analysis available."
-        
-        formatted_analysis = []
-        
-        # Anomalies detected
-        anomalies = anomaly_analysis.get("anomalies_detected", [])
-        if anomalies:
-            formatted_analysis.append(f"Anomalies Detected: {', '.join(anomalies)}")
-        else:
-            formatted_analysis.append("Anomalies Detected: None")
-        
-        # Severity assessment
-        severity = anomaly_analysis.get("severity_assessment", "unknown")
-        formatted_analysis.append(f"Severity Level: {severity.title()}")
-        
-        # Analysis summary
-        analysis_summary = anomaly_analysis.get("analysis_summary", "")
-        if analysis_summary:
-            formatted_analysis.append(f"Analysis Summary: {analysis_summary}")
-        
-        # Recommendations
-        recommendations = anomaly_analysis.get("recommendations", [])
-        if recommendations:
-            formatted_analysis.append(f"Recommendations: {', '.join(recommendations)}")
-        
-        return "\n".join(formatted_analysis)
+        # Like upload results, the flight is referenced by id, summary and signal
+        # manifest; clients fetch the telemetry they need separately
+        return {
+            "answer": response,
+            "flight_id": flight_id,
+            "summary": flight_data.get("summary", {}) if flight_data else {},
+            "signals": flight_data.get("signal_manifest", {}) if flight_data else {},
+            "proactive_suggestions": suggestions,
+            "comparison_insights": comparison_insights,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    @staticmethod
+    def _with_timings(result: Dict[str, Any], timings: Dict[str, float], usage: Dict[str, int],
+                      started: float) -> Dict[str, Any]:
+        """Attach phase timings (plus the total) and token usage to a result"""
+        total = time.perf_counter() - started
+        CHAT_PHASE_SECONDS.observe(total, phase="total")
+        result["timings"] = {**timings, "total": total}
+        result["usage"] = usage
+        return result
+
+    def _empty_message_response(self) -> Dict[str, Any]:
+        return {
+            "answer": "Please enter a message to get started!",
+            "flight_id": None,
+            "proactive_suggestions": [],
+            "comparison_insights": "",
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def _error_response(self, error: Exception) -> Dict[str, Any]:
+        return {
+            "answer": f"I'm having trouble processing your request. Please try again or upload a new flight file. Error: {str(error)}",
+            "flight_id": None,
+            "proactive_suggestions": ["Try uploading a different .bin file", "Ask a simpler question", "Check your internet connection"],
+            "comparison_insights": "",
+            "timestamp": datetime.now().isoformat()
+        }
+
+    async def _query_llm(self, message: str, flight_data: Optional[Dict], conversation_context: str = "",
+                         timings: Dict[str, float] = None, usage: Dict[str, int] = None) -> str:
+        """Query the configured LLM with flight data context and conversation memory"""
+        timings = {} if timings is None else timings
+        with chat_phase("prompt_build", timings):
+            system_prompt, system_suffix = self._build_system_prompt(flight_data, conversation_context)
+        with chat_phase("provider", timings):
+            return await self.llm_provider.complete(system_prompt, message, max_tokens=700,
+                                                    system_suffix=system_suffix, usage=usage)
+
+    def _build_system_prompt(self, flight_data: Optional[Dict], conversation_context: str = "") -> Tuple[str, str]:
+        """Build system prompt with flight data context and conversation memory
+
+        Returns (prefix, suffix). The prefix (instructions plus the flight
+        context rendered at upload) is the same for every message about a
+        flight, so providers can cache it; only the conversation history in
+        the suffix is assembled per request.
+        """
+        prefix = build_system_prompt_prefix(flight_data)
+        suffix = f"\n\nConversation History:\n{conversation_context}" if conversation_context else ""
+        return prefix, suffix
 
     def _fallback_response(self, message: str, flight_data: Optional[Dict], error: str = None) -> str:
         """Fallback response when no LLM API is available"""
@@ -297,7 +262,7 @@ Altitude Behavior:
             if anomaly_analysis:
                 analysis_text = f"""
 Automatic Anomaly Analysis:
-{self._format_anomaly_analysis(anomaly_analysis)}
+{format_anomaly_analysis(anomaly_analysis)}
 """
 
             return f"""I can see you're asking about flight data. Here's what I found:
@@ -305,48 +270,18 @@ Automatic Anomaly Analysis:
 Flight Summary:
 - Duration: {summary.get('duration', 'Unknown')} seconds
 - Max Altitude: {summary.get('max_altitude', 'Unknown')} meters
-- Legacy Anomalies: {', '.join(anomalies) if anomalies else 'None detected'}
+- Detected Anomalies: {', '.join(anomalies) if anomalies else 'None detected'}
 {analysis_text}
 To get more detailed AI analysis, please set up your OpenAI or Anthropic API key in the environment variables.
 {f"Note: {error}" if error else ""}"""
         else:
             return "I'm ready to analyze flight data! Please upload a .bin file first, then I can answer questions about the flight telemetry."
 
-    def _get_flight_data(self, flight_id: str) -> Optional[Dict]:
-        """Get flight data from cache or parser"""
-        # This would normally get data from the parser
-        # For now, return cached data
-        return self.flight_cache.get(flight_id)
-
-    def cache_flight_data(self, flight_id: str, data: Dict[str, Any]):
-        """Cache flight data for quick access"""
-        self.flight_cache[flight_id] = data
-        self.save_flight_cache()
-        
+    async def close(self):
+        """Release the LLM client's pooled connections"""
+        if self.llm_provider:
+            await self.llm_provider.close()
+
     def get_most_recent_flight(self) -> Optional[Dict[str, Any]]:
-        """Get the most recently cached flight data"""
-        if not self.flight_cache:
-            return None
-        
-        # Get the most recent flight based on timestamp or just return the last one
-        most_recent_flight_id = max(self.flight_cache.keys(), 
-                                   key=lambda fid: self.flight_cache[fid].get('timestamp', ''))
-        return self.flight_cache.get(most_recent_flight_id)
-    
-    def load_flight_cache(self):
-        """Load flight cache from file"""
-        try:
-            if os.path.exists(self.flight_cache_file):
-                with open(self.flight_cache_file, 'r') as f:
-                    self.flight_cache = json.load(f)
-                print(f"Loaded {len(self.flight_cache)} flights from cache")
-        except Exception as e:
-            print(f"Error loading flight cache: {e}")
-    
-    def save_flight_cache(self):
-        """Save flight cache to file"""
-        try:
-            with open(self.flight_cache_file, 'w') as f:
-                json.dump(self.flight_cache, f, indent=2, default=str)
-        except Exception as e:
-            print(f"Error saving flight cache: {e}")
+        """Get the most recently uploaded flight data"""
+        return self.repository.most_recent()
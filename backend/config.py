@@ -1,21 +1,97 @@
 import os
+import json
 from typing import Optional
+from dotenv import load_dotenv
+
+# Load .env before the class body reads the environment
+load_dotenv()
 
 class Config:
     # API Keys
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
     ANTHROPIC_API_KEY: Optional[str] = os.getenv("ANTHROPIC_API_KEY")
 
+    # LLM client settings; base URLs can point at a local stub server
+    OPENAI_BASE_URL: Optional[str] = os.getenv("OPENAI_BASE_URL")
+    ANTHROPIC_BASE_URL: Optional[str] = os.getenv("ANTHROPIC_BASE_URL")
+    OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4")
+    ANTHROPIC_MODEL: str = os.getenv("ANTHROPIC_MODEL", "claude-3-sonnet-20240229")
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", 8))  # in-flight requests per provider
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", 60))  # seconds per request
+    # USD per million tokens by model and token kind, for cost estimates;
+    # LLM_PRICING (JSON, same layout) adds or overrides models
+    LLM_PRICING: dict = {
+        "gpt-4": {"input": 30.0, "output": 60.0, "cache_read": 30.0},
+        "claude-3-sonnet-20240229": {"input": 3.0, "output": 15.0, "cache_read": 0.3, "cache_write": 3.75},
+        **json.loads(os.getenv("LLM_PRICING", "{}")),
+    }
+
     # Server settings
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     DEBUG: bool = True
 
     # File upload settings
-    MAX_FILE_SIZE: int = 100 * 1024 * 1024  # 100MB
+    MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", 100 * 1024 * 1024))  # 100MB
+    FILE_TOO_LARGE_MESSAGE: str = (f"File too large (>{MAX_FILE_SIZE / (1024 * 1024):.3g}MB) - "
+                                   "please upload a smaller flight log")
     UPLOAD_DIR: str = "uploads"
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # 1MB read/write chunks when streaming uploads
     ALLOWED_EXTENSIONS: set = {".bin", ".log"}
 
+    # Log parsing settings
+    PARSE_ENGINE: str = os.getenv("PARSE_ENGINE", "auto")  # auto, bulk or pymavlink
+    PARSE_WORKERS: int = int(os.getenv("PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+    PARSE_QUEUE_SIZE: int = int(os.getenv("PARSE_QUEUE_SIZE", 8))  # jobs allowed to wait for a worker
+    MAX_LOG_MESSAGES: int = int(os.getenv("MAX_LOG_MESSAGES", 1000000))  # larger logs are rejected
+
+    # Content-addressed cache of parsed flights, keyed by log SHA-256
+    PARSE_CACHE_DIR: str = os.getenv("PARSE_CACHE_DIR", "parse_cache")
+    PARSE_CACHE_MAX_BYTES: int = int(os.getenv("PARSE_CACHE_MAX_BYTES", 1024 * 1024 * 1024))  # 1GB
+
+    # Analyzed flights: a listing index.json plus metadata .json and telemetry .npz per flight
+    FLIGHT_STORAGE_DIR: str = os.getenv("FLIGHT_STORAGE_DIR", "flight_storage")
+    FLIGHT_CACHE_MAX_BYTES: int = int(os.getenv("FLIGHT_CACHE_MAX_BYTES", 512 * 1024 * 1024))  # telemetry kept in memory
+    FLIGHT_STORAGE_MAX_SEGMENTS: int = int(os.getenv("FLIGHT_STORAGE_MAX_SEGMENTS", 32))  # appended telemetry files before compacting
+
+    # Downsampled telemetry windows (/api/flights/{id}/telemetry)
+    TELEMETRY_DEFAULT_POINTS: int = int(os.getenv("TELEMETRY_DEFAULT_POINTS", 1000))  # points per field
+    TELEMETRY_MAX_POINTS: int = int(os.getenv("TELEMETRY_MAX_POINTS", 10000))
+
+    # Flight payload transport (binary or JSON, see telemetry_transport)
+    TRANSPORT_COMPRESS_MIN_BYTES: int = int(os.getenv("TRANSPORT_COMPRESS_MIN_BYTES", 1024))
+    TRANSPORT_GZIP_LEVEL: int = int(os.getenv("TRANSPORT_GZIP_LEVEL", 1))  # favour speed over ratio
+    TRANSPORT_ZSTD_LEVEL: int = int(os.getenv("TRANSPORT_ZSTD_LEVEL", 3))
+    SIGNAL_CACHE_MAX_AGE: int = int(os.getenv("SIGNAL_CACHE_MAX_AGE", 86400))  # seconds clients may reuse a signal
+
+    # Profiling: uploads may ask for a sampled stack profile (?profile=true) when enabled
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROFILE_INTERVAL: float = float(os.getenv("PROFILE_INTERVAL", 0.005))  # seconds between stack samples
+    # Latency quantiles on /metrics cover this many recent seconds (and at most this many samples)
+    METRICS_WINDOW_SECONDS: float = float(os.getenv("METRICS_WINDOW_SECONDS", 600))
+    METRICS_WINDOW_SAMPLES: int = int(os.getenv("METRICS_WINDOW_SAMPLES", 10000))
+
+    # Live MAVLink ingest: a mavutil connection string such as udpin:0.0.0.0:14550
+    # or tcp:127.0.0.1:5760; unset disables it
+    LIVE_INGEST_ENDPOINT: Optional[str] = os.getenv("LIVE_INGEST_ENDPOINT")
+    LIVE_BUFFER_SAMPLES: int = int(os.getenv("LIVE_BUFFER_SAMPLES", 6000))  # retained samples per signal per vehicle
+    LIVE_MAX_VEHICLES: int = int(os.getenv("LIVE_MAX_VEHICLES", 16))  # the longest-silent vehicle is dropped beyond this
+    LIVE_UPDATE_INTERVAL: float = float(os.getenv("LIVE_UPDATE_INTERVAL", 0.25))  # seconds between WebSocket batches
+    LIVE_MIN_INTERVAL: float = float(os.getenv("LIVE_MIN_INTERVAL", 0.05))  # fastest rate a client may ask for
+    LIVE_BATCH_MAX_SAMPLES: int = int(os.getenv("LIVE_BATCH_MAX_SAMPLES", 500))  # per signal; larger batches are decimated
+
+    # Upload job settings
+    JOB_PROGRESS_INTERVAL: float = 0.25  # seconds between parse progress updates
+    JOB_RETENTION_SECONDS: int = 3600  # how long finished jobs stay queryable
+
+    # Chat response cache (per flight and normalized question)
+    RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", 512))
+    RESPONSE_CACHE_TTL: float = float(os.getenv("RESPONSE_CACHE_TTL", 3600))  # seconds
+    RESPONSE_CACHE_SIMILARITY: float = float(os.getenv("RESPONSE_CACHE_SIMILARITY", 0.85))  # 1 = exact matches only
+
+    # Conversation memory: journal turns are folded into the snapshot this often
+    MEMORY_COMPACT_EVERY: int = int(os.getenv("MEMORY_COMPACT_EVERY", 200))
+
     # CORS settings
     CORS_ORIGINS: list = [
         "http://localhost:8080",
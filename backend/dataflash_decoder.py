@@ -0,0 +1,320 @@
+import mmap
+import struct
+import time
+import numpy as np
+from typing import Dict, List, Optional, Iterable, Any
+
+# DataFlash format characters mapped to little-endian NumPy types.
+# Mirrors pymavlink.DFReader.FORMAT_TO_STRUCT so decoded values match.
+FORMAT_TO_DTYPE = {
+    "a": ("<i2", (32,)),
+    "b": "i1",
+    "B": "u1",
+    "g": "<f2",
+    "h": "<i2",
+    "H": "<u2",
+    "i": "<i4",
+    "I": "<u4",
+    "f": "<f4",
+    "n": "S4",
+    "N": "S16",
+    "Z": "S64",
+    "c": "<i2",
+    "C": "<u2",
+    "e": "<i4",
+    "E": "<u4",
+    "L": "<i4",
+    "d": "<f8",
+    "M": "i1",
+    "q": "<i8",
+    "Q": "<u8",
+}
+
+# Scale factors applied by pymavlink when reading these format characters
+FORMAT_MULTIPLIERS = {
+    "c": 0.01,
+    "C": 0.01,
+    "e": 0.01,
+    "E": 0.01,
+    "L": 1.0e-7,
+}
+
+HEAD1 = 0xA3
+HEAD2 = 0x95
+FMT_TYPE = 0x80
+FMT_LENGTH = 89
+FMT_STRUCT = struct.Struct("<BB4s16s64s")
+
+# Rows gathered per NumPy fancy-indexing block when decoding a message type
+DECODE_BLOCK_ROWS = 16384
+
+
+class UnsupportedLogError(Exception):
+    """Raised when a log uses a layout the bulk decoder does not handle"""
+
+
+class ParseCancelledError(Exception):
+    """Raised when a parse is stopped through its cancel event"""
+
+
+def _null_term(value: bytes) -> str:
+    return value.split(b"\0", 1)[0].decode("ascii", errors="ignore")
+
+
+class DataFlashFormat:
+    """Message layout declared by a FMT record"""
+
+    def __init__(self, type_id: int, name: str, length: int, format_chars: str, columns: List[str]):
+        self.type_id = type_id
+        self.name = name
+        self.length = length
+        self.format_chars = format_chars
+        self.columns = columns
+        self._dtype = None
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Packed structured dtype for the record payload (after the 3-byte header)"""
+        if self._dtype is None:
+            try:
+                fields = [(column, FORMAT_TO_DTYPE[char])
+                          for column, char in zip(self.columns, self.format_chars)]
+                dtype = np.dtype(fields)
+            except (KeyError, ValueError, TypeError) as e:
+                raise UnsupportedLogError(f"Cannot build dtype for {self.name}: {e}")
+            if dtype.itemsize != self.length - 3:
+                raise UnsupportedLogError(
+                    f"Format {self.name} declares {self.length} bytes but fields need {dtype.itemsize + 3}")
+            self._dtype = dtype
+        return self._dtype
+
+
+class DataFlashDecoder:
+    """Bulk decoder for binary DataFlash (.bin) logs.
+
+    The log is memory-mapped and walked once to index record offsets by
+    message type; the wanted types are then decoded a block at a time into
+    typed column arrays instead of building one message object per record.
+
+    A decoder created with the `state` of an earlier one resumes where that
+    one stopped: only records after its byte offset are decoded, using the
+    FMT table and time base already read. This is how logs that are still
+    being written are parsed incrementally.
+    """
+
+    def __init__(self, file_path: str, max_parse_time: Optional[float] = None, cancel_event=None,
+                 progress=None, state: Optional[Dict[str, Any]] = None):
+        self.file_path = file_path
+        self.max_parse_time = max_parse_time
+        self.cancel_event = cancel_event
+        self.progress = progress
+        self.formats: Dict[int, DataFlashFormat] = {}
+        self.counts = [0] * 256
+        self.offsets: Dict[int, np.ndarray] = {}
+        self.bytes_scanned = 0
+        # Seconds added to TimeUS, None until a GPS record with a valid week is seen
+        self.timebase: Optional[float] = None
+        if state:
+            self._restore(state)
+        # Counts carried over from the state, so this run's records can be told apart
+        self.resumed_counts = list(self.counts)
+        # Wall time of the record walk, and of column decoding per message name
+        self.scan_seconds = 0.0
+        self.decode_seconds: Dict[str, float] = {}
+
+    def decode(self, wanted: Iterable[str]) -> Dict[str, Dict[str, np.ndarray]]:
+        """Decode all records of the wanted message types.
+
+        Returns {message name: {column: array}}, with a "_timestamp" column
+        computed the same way as pymavlink's microsecond clock.
+        """
+        wanted = set(wanted)
+        with open(self.file_path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                raw = np.frombuffer(data, dtype=np.uint8)
+                try:
+                    start = time.perf_counter()
+                    self._scan(data, wanted | {"GPS"})
+                    self.scan_seconds = time.perf_counter() - start
+                    decoded = {}
+                    for type_id, fmt in self.formats.items():
+                        if fmt.name in wanted or fmt.name == "GPS":
+                            self._check_cancelled()
+                            start = time.perf_counter()
+                            decoded[fmt.name] = self._decode_type(raw, type_id)
+                            self.decode_seconds[fmt.name] = time.perf_counter() - start
+                finally:
+                    # Release the buffer export before the map is closed
+                    del raw
+            finally:
+                data.close()
+
+        if self.timebase is None:
+            self.timebase = self._find_timebase(decoded.get("GPS"))
+        timebase = self.timebase or 0
+        result = {}
+        for name, columns in decoded.items():
+            if name not in wanted:
+                continue
+            time_us = columns.get("TimeUS")
+            if time_us is None:
+                raise UnsupportedLogError(f"{name} records have no TimeUS field")
+            columns["_timestamp"] = timebase + time_us.astype(np.float64) * 0.000001
+            result[name] = columns
+        return result
+
+    @property
+    def message_types(self) -> Dict[str, int]:
+        """Record counts by message name, as reported by the legacy parser"""
+        return self._count_by_name(self.counts)
+
+    @property
+    def decoded_message_types(self) -> Dict[str, int]:
+        """Record counts by message name for this run only (differs from message_types when resumed)"""
+        return self._count_by_name([count - resumed for count, resumed in zip(self.counts, self.resumed_counts)])
+
+    def _count_by_name(self, type_counts: List[int]) -> Dict[str, int]:
+        counts = {}
+        for type_id, count in enumerate(type_counts):
+            if count:
+                name = self.formats[type_id].name if type_id in self.formats else "FMT"
+                counts[name] = counts.get(name, 0) + count
+        return counts
+
+    @property
+    def total_messages(self) -> int:
+        return sum(self.counts)
+
+    @property
+    def state(self) -> Dict[str, Any]:
+        """JSON-serializable position of the decoder, to resume from once the log has grown"""
+        return {
+            "offset": self.bytes_scanned,
+            "formats": [[fmt.type_id, fmt.name, fmt.length, fmt.format_chars, ",".join(fmt.columns)]
+                        for fmt in self.formats.values()],
+            "counts": [[type_id, count] for type_id, count in enumerate(self.counts) if count],
+            "timebase": self.timebase,
+        }
+
+    def _restore(self, state: Dict[str, Any]):
+        for type_id, name, length, format_chars, columns in state["formats"]:
+            self.formats[type_id] = DataFlashFormat(type_id, name, length, format_chars, columns.split(","))
+        for type_id, count in state["counts"]:
+            self.counts[type_id] = count
+        self.bytes_scanned = state["offset"]
+        self.timebase = state["timebase"]
+
+    def _scan(self, data: mmap.mmap, wanted: set):
+        """Walk the record chain once, reading FMT records and indexing offsets"""
+        lengths = [-1] * 256
+        lengths[FMT_TYPE] = FMT_LENGTH
+        counts = self.counts
+        formats = self.formats
+        wanted_ids = [False] * 256
+        offsets: Dict[int, List[int]] = {}
+        # Formats read by the decoder this one resumes from
+        for type_id, fmt in formats.items():
+            lengths[type_id] = fmt.length
+            wanted_ids[type_id] = fmt.name in wanted
+            if wanted_ids[type_id]:
+                offsets[type_id] = []
+        data_len = len(data)
+        deadline = time.time() + self.max_parse_time if self.max_parse_time else None
+
+        ofs = self.bytes_scanned
+        records = 0
+        while ofs + 3 <= data_len:
+            if data[ofs] != HEAD1 or data[ofs + 1] != HEAD2:
+                # Skip garbage between records, as pymavlink does
+                ofs += 1
+                continue
+            msg_type = data[ofs + 2]
+            mlen = lengths[msg_type]
+            if mlen < 0:
+                ofs += 1
+                continue
+            if ofs + mlen > data_len:
+                # Truncated final record
+                break
+
+            if msg_type == FMT_TYPE:
+                type_id, length, name, format_chars, columns = FMT_STRUCT.unpack_from(data, ofs + 3)
+                fmt = DataFlashFormat(type_id, _null_term(name), length, _null_term(format_chars),
+                                      _null_term(columns).split(","))
+                formats[type_id] = fmt
+                lengths[type_id] = length
+                wanted_ids[type_id] = fmt.name in wanted
+                if wanted_ids[type_id] and type_id not in offsets:
+                    offsets[type_id] = []
+            elif wanted_ids[msg_type]:
+                offsets[msg_type].append(ofs)
+
+            counts[msg_type] += 1
+            ofs += mlen
+
+            records += 1
+            if not records & 0xFFFF:
+                if deadline is not None and time.time() > deadline:
+                    raise Exception("File parsing timeout - file may be corrupted or too complex")
+                self._check_cancelled()
+                if self.progress is not None:
+                    self.progress.update(bytes_consumed=ofs, messages_decoded=records)
+
+        if self.progress is not None:
+            self.progress.update(bytes_consumed=ofs, messages_decoded=records)
+        self.bytes_scanned = ofs
+        self.offsets = {type_id: np.asarray(type_offsets, dtype=np.int64)
+                        for type_id, type_offsets in offsets.items()}
+
+    def _check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ParseCancelledError("Parsing was cancelled")
+
+    def _decode_type(self, raw: np.ndarray, type_id: int) -> Dict[str, np.ndarray]:
+        """Gather every record of one type and convert it to scaled columns"""
+        fmt = self.formats[type_id]
+        dtype = fmt.dtype
+        record_offsets = self.offsets.get(type_id, np.zeros(0, dtype=np.int64))
+        payload = np.arange(3, fmt.length, dtype=np.int64)
+
+        records = np.empty(len(record_offsets), dtype=dtype)
+        for start in range(0, len(record_offsets), DECODE_BLOCK_ROWS):
+            block = record_offsets[start:start + DECODE_BLOCK_ROWS]
+            rows = raw[block[:, None] + payload]
+            records[start:start + len(block)] = rows.view(dtype).reshape(-1)
+
+        columns = {}
+        for column, char in zip(fmt.columns, fmt.format_chars):
+            values = records[column]
+            multiplier = FORMAT_MULTIPLIERS.get(char)
+            if multiplier is not None:
+                # Divide rather than multiply, matching pymavlink's rounding
+                values = values.astype(np.float64) / (1 / multiplier)
+            elif values.dtype.kind == "f":
+                values = values.astype(np.float64)
+            columns[column] = values
+        return columns
+
+    @staticmethod
+    def _gps_time_to_time(week, msec) -> float:
+        """Convert GPS week and time-of-week to seconds since 1970"""
+        epoch = 86400 * (10 * 365 + int((1980 - 1969) / 4) + 1 + 6 - 2)
+        return epoch + 86400 * 7 * week + msec * 0.001 - 18
+
+    def _find_timebase(self, gps: Optional[Dict[str, np.ndarray]]) -> Optional[float]:
+        """Time base of pymavlink's microsecond clock: first GPS fix with a valid week
+
+        None when there is no such fix (yet); timestamps then start at 0.
+        """
+        if not gps:
+            return None
+        if not all(column in gps for column in ("TimeUS", "GWk", "GMS")):
+            raise UnsupportedLogError("GPS records use a pre-TimeUS layout")
+
+        valid = np.flatnonzero(gps["GWk"] > 0)
+        if len(valid) == 0:
+            return None
+        first = valid[0]
+        t = self._gps_time_to_time(int(gps["GWk"][first]), int(gps["GMS"][first]))
+        return t - int(gps["TimeUS"][first]) * 0.000001
@@ -0,0 +1,189 @@
+import numpy as np
+from typing import Dict, List, Any, Optional
+from telemetry_store import FlightTelemetry
+from telemetry_pyramid import FieldPyramid
+
+# minmax and mean are served from the flight's level-of-detail pyramid when
+# the window is large; lttb always scans the raw samples in the window
+DOWNSAMPLING_METHODS = ("minmax", "mean", "lttb")
+
+
+def minmax_indices(values: np.ndarray, points: int) -> np.ndarray:
+    """Indices of the min and max sample of each of points/2 equal-count buckets.
+
+    Keeps every spike visible at any zoom level. The first and last samples
+    are always included so the series spans the whole window.
+    """
+    count = len(values)
+    if count <= points:
+        return np.arange(count)
+
+    # Every bucket holds `size` samples; only the last one is padded.
+    # Two points per bucket plus the first and last sample stay within `points`.
+    size = -(-count // max(1, (points - 2) // 2))
+    buckets = -(-count // size)
+    padding = buckets * size - count
+    if padding:
+        values = np.concatenate((values, np.repeat(values[-1:], padding)))
+    grid = values.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    indices = np.concatenate((grid.argmin(axis=1) + offsets, grid.argmax(axis=1) + offsets, [0, count - 1]))
+    return np.unique(np.minimum(indices, count - 1))
+
+
+def lttb_indices(timestamps: np.ndarray, values: np.ndarray, points: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets selection of `points` samples.
+
+    Picks, per bucket, the sample forming the largest triangle with the
+    previous pick and the average of the next bucket, which preserves the
+    visual shape of the series.
+    """
+    count = len(values)
+    if count <= points or points < 3:
+        return np.arange(count) if count <= points else np.array([0, count - 1])
+
+    x = timestamps - timestamps[0]
+    y = values.astype(np.float64)
+    # Bucket edges over the samples between the fixed first and last points
+    edges = np.linspace(1, count - 1, points - 1).astype(np.int64)
+
+    # Mean of every bucket, from cumulative sums
+    x_sums = np.concatenate(([0.0], np.cumsum(x)))
+    y_sums = np.concatenate(([0.0], np.cumsum(y)))
+    sizes = np.maximum(edges[1:] - edges[:-1], 1)
+    x_means = (x_sums[edges[1:]] - x_sums[edges[:-1]]) / sizes
+    y_means = (y_sums[edges[1:]] - y_sums[edges[:-1]]) / sizes
+    x_means = np.append(x_means, x[-1])
+    y_means = np.append(y_means, y[-1])
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(points - 2):
+        lo, hi = edges[bucket], max(edges[bucket + 1], edges[bucket] + 1)
+        next_x, next_y = x_means[bucket + 1], y_means[bucket + 1]
+        areas = np.abs((x[previous] - next_x) * (y[lo:hi] - y[previous])
+                       - (x[previous] - x[lo:hi]) * (next_y - y[previous]))
+        previous = lo + int(areas.argmax())
+        selected[bucket + 1] = previous
+    return np.unique(selected)
+
+
+def bucket_means(values: np.ndarray, points: int):
+    """Bucket start indices and means of `points` equal-count buckets (raw path of method=mean)"""
+    count = len(values)
+    if count <= points:
+        return np.arange(count), values.astype(np.float64)
+    starts = np.linspace(0, count, points, endpoint=False).astype(np.int64)
+    sums = np.add.reduceat(values.astype(np.float64), starts)
+    return starts, sums / np.diff(np.append(starts, count))
+
+
+def pyramid_series(pyramid: FieldPyramid, timestamps: np.ndarray, lo: int, hi: int, points: int,
+                   method: str) -> Optional[Dict[str, Any]]:
+    """Series for samples [lo, hi) read from the coarsest adequate pyramid level.
+
+    Work is proportional to the number of buckets returned, not to the
+    window's length. Buckets at the window edges may include a few samples
+    just outside it. Returns None when the window is small enough to be
+    answered from the raw samples.
+    """
+    buckets = max(1, (points // 2 if method == "minmax" else points) - 1)
+    level = pyramid.select_level(hi - lo, buckets)
+    if level is None:
+        return None
+
+    size = pyramid.bucket_size(level)
+    first_index, stats = pyramid.query(level, lo, hi)
+    last_index = np.minimum(first_index + size, len(timestamps)) - 1
+    first_time = timestamps[np.maximum(first_index, lo)]
+    last_time = timestamps[np.minimum(last_index, hi - 1)]
+
+    if method == "mean":
+        series_time = (first_time + last_time) / 2
+        series_values = stats["sum"] / (last_index - first_index + 1)
+    else:
+        # Two points per bucket, minimum and maximum in the order they occurred
+        min_first = stats["min_first"]
+        series_time = np.column_stack((first_time, last_time)).ravel()
+        series_values = np.column_stack((np.where(min_first, stats["min"], stats["max"]),
+                                         np.where(min_first, stats["max"], stats["min"]))).ravel()
+
+    finite = np.isfinite(series_values)
+    return {
+        "timestamp": series_time[finite].tolist(),
+        "values": series_values[finite].tolist(),
+        "bucket_size": size,
+    }
+
+
+def downsample_signal(telemetry: FlightTelemetry, name: str, fields: List[str], start: Optional[float],
+                      end: Optional[float], points: int, method: str = "minmax") -> Dict[str, Any]:
+    """Decimate the given fields of one signal within [start, end].
+
+    Each field is decimated on its own, so every field gets its own
+    timestamps and keeps its own spikes. Series read from the pyramid carry
+    the bucket_size (in samples) they were aggregated at.
+    """
+    signal = telemetry[name]
+    window = signal.time_window(start, end)
+    timestamps = signal["timestamp"][window]
+    series = {}
+    for field in fields:
+        # The pyramid is in sample order, so it only applies to time-ordered signals
+        if method != "lttb" and isinstance(window, slice) and len(timestamps):
+            decimated = pyramid_series(telemetry.pyramid(name, field), signal["timestamp"],
+                                       window.start, window.stop, points, method)
+            if decimated is not None:
+                series[field] = decimated
+                continue
+
+        values = signal[field][window]
+        field_timestamps = timestamps
+        finite = np.isfinite(values)
+        if not finite.all():
+            values, field_timestamps = values[finite], timestamps[finite]
+
+        if method == "mean":
+            indices, means = bucket_means(values, points)
+            series[field] = {"timestamp": field_timestamps[indices].tolist(), "values": means.tolist()}
+            continue
+        if method == "lttb":
+            indices = lttb_indices(field_timestamps, values, points)
+        else:
+            indices = minmax_indices(values, points)
+        series[field] = {
+            "timestamp": field_timestamps[indices].tolist(),
+            "values": values[indices].tolist(),
+        }
+    return {"total_samples": len(timestamps), "fields": series}
+
+
+def slice_telemetry(telemetry: FlightTelemetry, signals: List[str], start: Optional[float] = None,
+                    end: Optional[float] = None, points: int = 1000, method: str = "minmax",
+                    fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Downsampled series for a time window of several signals.
+
+    The payload holds at most `points` samples per field whatever the
+    window's length. `fields` restricts every signal to those of its fields
+    that exist; by default all fields are returned.
+    """
+    if method not in DOWNSAMPLING_METHODS:
+        raise Exception(f"Unknown downsampling method '{method}' (use {', '.join(DOWNSAMPLING_METHODS)})")
+    unknown = [name for name in signals if name not in telemetry]
+    if unknown:
+        raise Exception(f"Unknown telemetry signals: {', '.join(unknown)}")
+
+    result = {}
+    matched = set()
+    for name in signals:
+        signal = telemetry[name]
+        signal_fields = [field for field in signal.fields if field != "timestamp"]
+        if fields:
+            signal_fields = [field for field in signal_fields if field in fields]
+            matched.update(signal_fields)
+        result[name] = downsample_signal(telemetry, name, signal_fields, start, end, points, method)
+
+    if fields and set(fields) - matched:
+        raise Exception(f"Unknown telemetry fields: {', '.join(sorted(set(fields) - matched))}")
+    return result
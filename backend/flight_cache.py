@@ -0,0 +1,165 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Iterator, Set
+from config import Config
+from telemetry_store import FlightTelemetry
+
+TelemetryLoader = Callable[[str], Optional[FlightTelemetry]]
+MetadataLoader = Callable[[str], Optional[Dict[str, Any]]]
+
+
+class FlightCache:
+    """In-memory flight registry with a byte budget for telemetry.
+
+    Flight metadata (summary, anomaly analysis, timestamps) is always kept.
+    Flights registered from the storage index with register() start with
+    their listing fields only; the rest of their metadata is read through
+    `metadata_loader` the first time it is needed. Telemetry arrays are
+    tracked in least-recently-used order and dropped once their total size
+    exceeds max_bytes; an evicted flight's telemetry is reloaded through
+    `loader` the next time it is looked up. Without a loader nothing is
+    evicted, since it could not be reloaded.
+
+    Lookups with [] or get() count as telemetry hits or misses. keys(),
+    items() and iteration return entries as they are (possibly just the
+    listing fields) and never load anything.
+    """
+
+    def __init__(self, max_bytes: int = None, loader: TelemetryLoader = None,
+                 metadata_loader: MetadataLoader = None):
+        self.max_bytes = Config.FLIGHT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.loader = loader
+        self.metadata_loader = metadata_loader
+        self._flights: Dict[str, Dict[str, Any]] = {}
+        # Flights holding only their listing fields so far
+        self._listed: Set[str] = set()
+        # Flight id -> telemetry bytes, least recently used first
+        self._loaded: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _telemetry_size(flight_data: Dict[str, Any]) -> int:
+        telemetry = flight_data.get("telemetry")
+        return telemetry.nbytes if isinstance(telemetry, FlightTelemetry) else 0
+
+    def register(self, flight_id: str, listing: Dict[str, Any]):
+        """Add a stored flight by its listing fields; the rest is loaded on first use"""
+        with self._lock:
+            self._flights[flight_id] = listing
+            self._listed.add(flight_id)
+
+    def _metadata(self, flight_id: str) -> Dict[str, Any]:
+        """A flight's entry, with its full metadata loaded if it was only listed"""
+        flight_data = self._flights[flight_id]
+        if flight_id in self._listed:
+            self._listed.discard(flight_id)
+            metadata = self.metadata_loader(flight_id) if self.metadata_loader else None
+            if metadata is not None:
+                flight_data = self._flights[flight_id] = {**flight_data, **metadata}
+        return flight_data
+
+    def __setitem__(self, flight_id: str, flight_data: Dict[str, Any]):
+        with self._lock:
+            self._flights[flight_id] = flight_data
+            self._listed.discard(flight_id)
+            self._loaded.pop(flight_id, None)
+            if "telemetry" in flight_data:
+                self._loaded[flight_id] = self._telemetry_size(flight_data)
+                self._evict(keep=flight_id)
+
+    def __getitem__(self, flight_id: str) -> Dict[str, Any]:
+        with self._lock:
+            flight_data = self._metadata(flight_id)
+            if flight_id in self._loaded:
+                self._loaded.move_to_end(flight_id)
+                self.hits += 1
+                return flight_data
+
+            self.misses += 1
+            telemetry = self.loader(flight_id) if self.loader else None
+            if telemetry is not None:
+                flight_data = {**flight_data, "telemetry": telemetry}
+                self._flights[flight_id] = flight_data
+                self._loaded[flight_id] = telemetry.nbytes
+                self._evict(keep=flight_id)
+            return flight_data
+
+    def get(self, flight_id: str, default: Any = None) -> Any:
+        try:
+            return self[flight_id]
+        except KeyError:
+            return default
+
+    def peek(self, flight_id: str) -> Optional[Dict[str, Any]]:
+        """Registered flight metadata: no telemetry loading, no hit/miss counting"""
+        with self._lock:
+            if flight_id not in self._flights:
+                return None
+            return self._metadata(flight_id)
+
+    def update(self, flight_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """Update metadata fields of a registered flight in place, without loading telemetry"""
+        with self._lock:
+            flight_data = self._metadata(flight_id)
+            flight_data.update(changes)
+            return flight_data
+
+    def __delitem__(self, flight_id: str):
+        with self._lock:
+            del self._flights[flight_id]
+            self._listed.discard(flight_id)
+            self._loaded.pop(flight_id, None)
+
+    def __contains__(self, flight_id: str) -> bool:
+        return flight_id in self._flights
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._flights))
+
+    def keys(self):
+        return list(self._flights.keys())
+
+    def items(self):
+        return list(self._flights.items())
+
+    @property
+    def nbytes(self) -> int:
+        """Telemetry bytes currently held in memory"""
+        return sum(self._loaded.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and occupancy for monitoring"""
+        with self._lock:
+            return {
+                "flights": len(self._flights),
+                "loaded": len(self._loaded),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self, keep: str = None):
+        """Drop least recently used telemetry until the budget is met"""
+        if self.loader is None:
+            return
+        total = self.nbytes
+        for flight_id in list(self._loaded):
+            if total <= self.max_bytes:
+                break
+            if flight_id == keep:
+                continue
+            total -= self._loaded.pop(flight_id)
+            # Swap in a copy without telemetry rather than mutating the dict,
+            # which callers may still be using
+            self._flights[flight_id] = {
+                key: value for key, value in self._flights[flight_id].items() if key != "telemetry"
+            }
+            self.evictions += 1
@@ -0,0 +1,172 @@
+from typing import Dict, Any, Optional
+from anomaly_detectors import format_anomaly_events
+
+# Static instructions that open every chat system prompt
+BASE_PROMPT = """You are an expert UAV flight data analyst with advanced memory capabilities. You help users understand flight telemetry data, identify issues, and provide insights about drone flights.
+
+You can analyze:
+- GPS coordinates and flight paths
+- Altitude and speed data
+- Battery performance
+- Vibration levels
+- Flight anomalies
+- Safety concerns
+
+IMPORTANT: You have conversation memory and should:
+1. Reference previous discussions when relevant
+2. Build upon earlier analyses
+3. Avoid repeating information already covered
+4. Provide progressive insights that deepen understanding
+5. Be proactive in suggesting related topics
+
+Provide clear, technical answers while being accessible to users."""
+
+NO_FLIGHT_CONTEXT = """
+No flight data is currently loaded. You can:
+1. Answer general questions about UAV analysis, MAVLink protocol, or flight safety
+2. Provide guidance on what to look for in flight logs
+3. Explain common flight anomalies and their causes
+4. Help interpret flight telemetry data concepts
+5. Suggest the user upload a .bin flight log file for specific analysis
+
+Be helpful and informative even without specific flight data."""
+
+
+def build_flight_context(flight_data: Dict[str, Any]) -> str:
+    """Render the flight-specific part of the chat system prompt.
+
+    Only the summary is used, so this is rendered once when a flight is
+    summarized (and again when its anomaly analysis arrives) and stored with
+    the flight as "prompt_context" (see flight_prompt_context).
+    """
+    summary = flight_data.get("summary", {})
+    telemetry_summary = summary.get("telemetry_summary", {})
+    telemetry = flight_data.get("telemetry") or {}
+    signal_counts = summary.get("signal_counts", {})
+    gps_points = signal_counts.get("gps", len(telemetry.get("gps", [])))
+    battery_points = signal_counts.get("battery", len(telemetry.get("battery", [])))
+
+    return f"""
+Current Flight Data:
+- Duration: {summary.get('duration', 'Unknown')} seconds
+- Max Altitude: {summary.get('max_altitude', 'Unknown')} meters
+- GPS Points: {gps_points}
+- Battery Data Points: {battery_points}
+
+Telemetry Analysis Patterns (analyze for anomalies dynamically):
+{format_telemetry_patterns(telemetry_summary)}
+
+Automatic Anomaly Analysis Results:
+{format_anomaly_analysis(summary.get('anomaly_analysis', {}))}
+
+IMPORTANT: Instead of rigid rules, analyze these patterns to identify:
+- Unusual GPS behavior (look for patterns, not fixed thresholds)
+- Concerning vibration trends (consider context and flight phase)
+- Battery performance issues (analyze voltage trends and current draw)
+- Altitude anomalies (sudden changes, unexpected patterns)
+- System stability indicators (correlate multiple sensors)
+
+Use your expertise to reason about these patterns contextually."""
+
+
+def flight_prompt_context(flight_data: Dict[str, Any]) -> str:
+    """Stored flight context, rendering and remembering it for older flights"""
+    prompt_context = flight_data.get("prompt_context")
+    if prompt_context is None:
+        prompt_context = flight_data["prompt_context"] = build_flight_context(flight_data)
+    return prompt_context
+
+
+def build_system_prompt_prefix(flight_data: Optional[Dict[str, Any]]) -> str:
+    """The part of the system prompt that is identical for every message about a flight"""
+    if flight_data:
+        return BASE_PROMPT + flight_prompt_context(flight_data)
+    return BASE_PROMPT + NO_FLIGHT_CONTEXT
+
+
+def format_telemetry_patterns(telemetry_summary: Dict[str, Any]) -> str:
+    """Format telemetry patterns for LLM analysis"""
+    if not telemetry_summary:
+        return "No telemetry patterns available for analysis."
+    
+    formatted_patterns = []
+    
+    # GPS patterns
+    if "gps_patterns" in telemetry_summary:
+        gps = telemetry_summary["gps_patterns"]
+        formatted_patterns.append(f"""
+GPS Signal Quality:
+- Total GPS readings: {gps.get('total_points', 0)}
+- Fix types: {gps.get('fix_type_distribution', {})}
+- HDOP range: {gps.get('hdop_range', {})}
+- Satellite count range: {gps.get('satellite_range', {})}""")
+    
+    # Vibration patterns
+    if "vibration_patterns" in telemetry_summary:
+        vibe = telemetry_summary["vibration_patterns"]
+        formatted_patterns.append(f"""
+Vibration Analysis:
+- Total vibration readings: {vibe.get('total_readings', 0)}
+- X-axis range: {vibe.get('x_axis', {})}
+- Y-axis range: {vibe.get('y_axis', {})}
+- Z-axis range: {vibe.get('z_axis', {})}""")
+    
+    # Battery patterns
+    if "battery_patterns" in telemetry_summary:
+        battery = telemetry_summary["battery_patterns"]
+        formatted_patterns.append(f"""
+Battery Performance:
+- Total battery readings: {battery.get('total_readings', 0)}
+- Voltage trend: {battery.get('voltage_trend', [])}
+- Voltage range: {battery.get('voltage_range', {})}
+- Current range: {battery.get('current_range', {})}""")
+    
+    # Altitude patterns
+    if "altitude_patterns" in telemetry_summary:
+        altitude = telemetry_summary["altitude_patterns"]
+        formatted_patterns.append(f"""
+Altitude Behavior:
+- Total position readings: {altitude.get('total_points', 0)}
+- Altitude range: {altitude.get('altitude_range', {})}
+- Largest climb: {altitude.get('largest_climb', 0)}m
+- Largest descent: {altitude.get('largest_descent', 0)}m
+- Altitude profile: {altitude.get('altitude_profile', [])}""")
+    
+    # Events from the local anomaly detectors
+    if "anomaly_events" in telemetry_summary:
+        formatted_patterns.append(f"""
+Detected Events (T+ is seconds after log start):
+{format_anomaly_events(telemetry_summary['anomaly_events'])}""")
+    
+    return "\n".join(formatted_patterns) if formatted_patterns else "No detailed telemetry patterns available."
+
+
+def format_anomaly_analysis(anomaly_analysis: Dict[str, Any]) -> str:
+    """Format anomaly analysis results for LLM context"""
+    if not anomaly_analysis:
+        return "No automatic anomaly analysis available."
+    
+    formatted_analysis = []
+    
+    # Anomalies detected
+    anomalies = anomaly_analysis.get("anomalies_detected", [])
+    if anomalies:
+        formatted_analysis.append(f"Anomalies Detected: {', '.join(anomalies)}")
+    else:
+        formatted_analysis.append("Anomalies Detected: None")
+    
+    # Severity assessment
+    severity = anomaly_analysis.get("severity_assessment", "unknown")
+    formatted_analysis.append(f"Severity Level: {severity.title()}")
+    
+    # Analysis summary
+    analysis_summary = anomaly_analysis.get("analysis_summary", "")
+    if analysis_summary:
+        formatted_analysis.append(f"Analysis Summary: {analysis_summary}")
+    
+    # Recommendations
+    recommendations = anomaly_analysis.get("recommendations", [])
+    if recommendations:
+        formatted_analysis.append(f"Recommendations: {', '.join(recommendations)}")
+    
+    return "\n".join(formatted_analysis)
@@ -0,0 +1,116 @@
+from typing import Dict, List, Any, Optional
+from flight_storage import FlightStorage, index_entry
+from flight_cache import FlightCache
+
+
+class FlightRepository:
+    """The one registry of analyzed flights, shared by the parser and chat service.
+
+    Flights are persisted through FlightStorage and held in memory by a
+    FlightCache, so every flight has a single in-memory copy of its arrays
+    and a single write path. With persistent=False nothing touches disk and
+    telemetry is never evicted (used by throwaway parsers in worker processes).
+    """
+
+    def __init__(self, storage: FlightStorage = None, cache: FlightCache = None,
+                 persistent: bool = True, legacy_cache_file: str = "flight_cache.json"):
+        self.storage = storage or (FlightStorage() if persistent else None)
+        if cache is None:
+            cache = FlightCache(loader=self.storage.load_telemetry, metadata_loader=self.storage.load_metadata) \
+                if self.storage else FlightCache()
+        self.cache = cache
+        self.legacy_cache_file = legacy_cache_file
+        if self.storage:
+            self.load()
+
+    def load(self):
+        """Register every stored flight from the index; metadata and telemetry are read lazily per flight"""
+        try:
+            self.storage.migrate_legacy_cache(self.legacy_cache_file)
+            for flight_id, listing in self.storage.load_index().items():
+                self.cache.register(flight_id, listing)
+            print(f"Loaded {len(self.cache)} flights from cache")
+        except Exception as e:
+            print(f"Error loading flight cache: {e}")
+
+    def add(self, flight_data: Dict[str, Any]):
+        """Persist a flight and make it available to lookups"""
+        if self.storage:
+            try:
+                self.storage.save(flight_data)
+            except Exception as e:
+                print(f"Error saving flight {flight_data['flight_id']}: {e}")
+        self.cache[flight_data["flight_id"]] = flight_data
+
+    def update(self, flight_id: str, **changes) -> Dict[str, Any]:
+        """Change metadata of a stored flight (e.g. a late anomaly analysis) and persist it"""
+        flight_data = self.cache.update(flight_id, changes)
+        if self.storage:
+            try:
+                self.storage.save(flight_data)
+            except Exception as e:
+                print(f"Error saving flight {flight_id}: {e}")
+        return flight_data
+
+    def append(self, flight_data: Dict[str, Any], starts: Dict[str, int], rewrite: bool = False):
+        """Persist a flight whose telemetry grew (see FlightTelemetry.grow) and make it the current one
+
+        Only the new samples are written unless rewrite=True (needed when
+        existing samples changed). The cache re-accounts the telemetry size.
+        Unlike add(), a failed write is raised and leaves both the stored
+        and the cached flight unchanged, so the append can be retried.
+        """
+        flight_id = flight_data["flight_id"]
+        if self.storage:
+            try:
+                self.storage.append(flight_data, starts, rewrite)
+            except Exception as e:
+                print(f"Error saving flight {flight_id}: {e}")
+                raise
+        self.cache[flight_id] = flight_data
+
+    def get(self, flight_id: str) -> Optional[Dict[str, Any]]:
+        """Full flight data including telemetry, or None if unknown"""
+        return self.cache.get(flight_id)
+
+    def peek(self, flight_id: str) -> Optional[Dict[str, Any]]:
+        """A flight's metadata without loading its telemetry (which may or may not be attached)"""
+        return self.cache.peek(flight_id)
+
+    def get_summary(self, flight_id: str) -> Optional[Dict[str, Any]]:
+        """A flight's summary, without loading its telemetry"""
+        flight_data = self.cache.peek(flight_id)
+        return flight_data.get("summary", {}) if flight_data is not None else None
+
+    def __contains__(self, flight_id: str) -> bool:
+        return flight_id in self.cache
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def remove(self, flight_id: str):
+        if flight_id in self.cache:
+            del self.cache[flight_id]
+        if self.storage:
+            self.storage.delete(flight_id)
+
+    def list_flights(self) -> List[Dict[str, Any]]:
+        """Flight ids with the summary fields kept in the storage index, without loading anything"""
+        return [
+            {
+                "flight_id": flight_id,
+                "summary": index_entry(data)["summary"]
+            }
+            for flight_id, data in self.cache.items()
+        ]
+
+    def most_recent(self) -> Optional[Dict[str, Any]]:
+        """The flight with the latest timestamp"""
+        flights = self.cache.items()
+        if not flights:
+            return None
+        flight_id, _ = max(flights, key=lambda item: item[1].get('timestamp', ''))
+        return self.get(flight_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
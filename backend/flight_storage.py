@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+from typing import Dict, List, Any, Optional
+from config import Config
+from telemetry_store import FlightTelemetry, flight_from_jsonable
+
+# What index.json keeps per flight: enough to list flights and find
+# unfinished analyses without reading any per-flight file
+INDEX_FIELDS = ("flight_id", "timestamp", "content_hash")
+INDEX_SUMMARY_FIELDS = ("duration", "max_altitude", "max_speed", "total_distance", "battery_usage",
+                        "anomalies", "total_messages", "anomaly_analysis_status")
+
+
+def index_entry(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """The listing fields of a flight's metadata, as stored in index.json"""
+    entry = {key: metadata[key] for key in INDEX_FIELDS if key in metadata}
+    summary = metadata.get("summary") or {}
+    entry["summary"] = {key: summary[key] for key in INDEX_SUMMARY_FIELDS if key in summary}
+    return entry
+
+
+class FlightStorage:
+    """Persistent store of analyzed flights.
+
+    Telemetry for each flight is written once to its own <flight_id>.npz
+    file, and the rest of its metadata (summary, anomaly analysis, prompt
+    context, parse state) to <flight_id>.json next to it. index.json only
+    holds the listing fields of each flight (see index_entry), so startup
+    reads a small file and saving a flight rewrites the index only when
+    its listing changed. Samples appended to a flight later go to
+    <flight_id>.<n>.npz segment files, which are folded back into the main
+    file once there are Config.FLIGHT_STORAGE_MAX_SEGMENTS of them.
+    """
+
+    def __init__(self, storage_dir: str = None):
+        self.storage_dir = storage_dir or Config.FLIGHT_STORAGE_DIR
+        self.index_file = os.path.join(self.storage_dir, "index.json")
+        self._lock = threading.Lock()
+        # Copy of index.json, read on first use
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        os.makedirs(self.storage_dir, exist_ok=True)
+
+    def _telemetry_path(self, flight_id: str) -> str:
+        return os.path.join(self.storage_dir, f"{flight_id}.npz")
+
+    def _metadata_path(self, flight_id: str) -> str:
+        return os.path.join(self.storage_dir, f"{flight_id}.json")
+
+    def _segment_paths(self, flight_id: str) -> List[str]:
+        paths = []
+        while True:
+            path = os.path.join(self.storage_dir, f"{flight_id}.{len(paths) + 1}.npz")
+            if not os.path.exists(path):
+                return paths
+            paths.append(path)
+
+    def load_index(self) -> Dict[str, Dict[str, Any]]:
+        """Return the listing fields of every flight (see index_entry) keyed by flight id"""
+        with self._lock:
+            return {flight_id: dict(entry) for flight_id, entry in self._read_index().items()}
+
+    def load_metadata(self, flight_id: str) -> Optional[Dict[str, Any]]:
+        """All metadata (without telemetry) of one flight, or None if it is not stored"""
+        metadata_path = self._metadata_path(flight_id)
+        if not os.path.exists(metadata_path):
+            return None
+        try:
+            with open(metadata_path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading metadata for flight {flight_id}: {e}")
+            return None
+
+    def _read_index(self) -> Dict[str, Dict[str, Any]]:
+        if self._index is not None:
+            return self._index
+        index = {}
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r') as f:
+                    index = json.load(f)
+            except Exception as e:
+                print(f"Error reading flight index: {e}")
+        self._index = index
+        return index
+
+    @staticmethod
+    def _write_json(path: str, data: Any):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, default=str)
+        os.replace(tmp_path, path)
+
+    def save(self, flight_data: Dict[str, Any]):
+        """Persist a flight: telemetry file (once), its metadata file and its index entry"""
+        flight_id = flight_data["flight_id"]
+        telemetry = flight_data.get("telemetry")
+        with self._lock:
+            # Only written the first time; appended samples go through append()
+            telemetry_path = self._telemetry_path(flight_id)
+            if isinstance(telemetry, FlightTelemetry) and not os.path.exists(telemetry_path):
+                telemetry.save_npz(telemetry_path)
+            self._save_metadata(flight_data)
+
+    def _save_metadata(self, flight_data: Dict[str, Any]):
+        flight_id = flight_data["flight_id"]
+        metadata = {key: value for key, value in flight_data.items() if key != "telemetry"}
+        index = self._read_index()
+        # Round-trip through JSON so the comparison sees what is on disk
+        entry = json.loads(json.dumps(index_entry(metadata), default=str))
+        if index.get(flight_id) != entry:
+            index[flight_id] = entry
+            self._write_json(self.index_file, index)
+        # Written last: the flight counts as saved once its metadata file is
+        self._write_json(self._metadata_path(flight_id), metadata)
+
+    def append(self, flight_data: Dict[str, Any], starts: Dict[str, int], rewrite: bool = False):
+        """Persist a flight whose telemetry grew since `starts` (see FlightTelemetry.grow)
+
+        The new samples go to a segment file, or all samples to the main
+        file with rewrite=True (needed when existing samples changed) or
+        once there are Config.FLIGHT_STORAGE_MAX_SEGMENTS segments. If
+        writing fails, the stored flight is left as it was.
+        """
+        flight_id = flight_data["flight_id"]
+        telemetry = flight_data["telemetry"]
+        with self._lock:
+            segments = self._segment_paths(flight_id)
+            if rewrite or len(segments) + 1 >= Config.FLIGHT_STORAGE_MAX_SEGMENTS:
+                # Written next to the main file, which is only replaced once the metadata is saved
+                new_path = f"{self._telemetry_path(flight_id)}.new"
+                telemetry.save_npz(new_path)
+            else:
+                new_path = os.path.join(self.storage_dir, f"{flight_id}.{len(segments) + 1}.npz")
+                telemetry.save_npz(new_path, starts=starts)
+                segments = None
+            previous_entry = self._read_index().get(flight_id)
+            try:
+                self._save_metadata(flight_data)
+            except Exception:
+                os.remove(new_path)
+                # The index is written first and may list the grown flight already
+                index = self._read_index()
+                if index.get(flight_id) != previous_entry:
+                    index[flight_id] = previous_entry
+                    self._write_json(self.index_file, index)
+                raise
+            if segments is not None:
+                os.replace(new_path, self._telemetry_path(flight_id))
+                for path in segments:
+                    os.remove(path)
+
+    def load_telemetry(self, flight_id: str) -> Optional[FlightTelemetry]:
+        """Load the telemetry of one flight, or None if it is not stored"""
+        telemetry_path = self._telemetry_path(flight_id)
+        if not os.path.exists(telemetry_path):
+            return None
+        try:
+            return FlightTelemetry.load_npz(telemetry_path, self._segment_paths(flight_id))
+        except Exception as e:
+            print(f"Error loading telemetry for flight {flight_id}: {e}")
+            return None
+
+    def delete(self, flight_id: str):
+        """Remove a flight from the index and delete its metadata and telemetry files"""
+        with self._lock:
+            index = self._read_index()
+            if index.pop(flight_id, None) is not None:
+                self._write_json(self.index_file, index)
+            for path in (self._metadata_path(flight_id), self._telemetry_path(flight_id)):
+                if os.path.exists(path):
+                    os.remove(path)
+            for path in self._segment_paths(flight_id):
+                os.remove(path)
+
+    def migrate_legacy_cache(self, legacy_file: str):
+        """Import flights from the old single-file flight_cache.json, then retire it"""
+        if not os.path.exists(legacy_file):
+            return
+        try:
+            with open(legacy_file, 'r') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            print(f"Error reading legacy flight cache: {e}")
+            return
+        if not legacy:
+            return
+
+        for flight_id, data in legacy.items():
+            data.setdefault("flight_id", flight_id)
+            self.save(flight_from_jsonable(data))
+        os.replace(legacy_file, f"{legacy_file}.migrated")
+        print(f"Migrated {len(legacy)} flights from {legacy_file}")
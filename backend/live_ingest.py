@@ -0,0 +1,265 @@
+import asyncio
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple, AsyncIterator
+import numpy as np
+from pymavlink import mavutil
+from config import Config
+from mavlink_parser import MAVLINK_SIGNALS
+from telemetry_store import TELEMETRY_SCHEMA
+from metrics import LIVE_MESSAGES, LIVE_VEHICLES, LIVE_SUBSCRIBERS
+
+# Messages kept in the live window; each fills the signal MAVLINK_SIGNALS maps it to
+LIVE_MESSAGE_TYPES = ("GLOBAL_POSITION_INT", "ATTITUDE", "SYS_STATUS", "BATTERY_STATUS", "VIBRATION")
+LIVE_SIGNALS = tuple(MAVLINK_SIGNALS[msg_type][0] for msg_type in LIVE_MESSAGE_TYPES)
+
+RECONNECT_DELAY = 1.0  # seconds before reopening a failed connection
+MAX_UPDATE_INTERVAL = 10.0
+
+
+class SignalRing:
+    """The most recent samples of one telemetry signal, in preallocated columns
+
+    Samples are numbered from 0 in arrival order; sample n lives in slot
+    n % capacity, so appending never allocates and older samples are simply
+    overwritten. Readers keep the number of the next sample they want and
+    ask for everything since it.
+    """
+
+    def __init__(self, name: str, fields: Tuple[Tuple[str, str], ...], capacity: int):
+        self.name = name
+        self.fields = tuple(field for field, _ in fields)
+        self.capacity = capacity
+        self.columns = {field: np.zeros(capacity, dtype=dtype) for field, dtype in fields}
+        self.total = 0  # samples ever appended
+
+    def __len__(self) -> int:
+        return min(self.total, self.capacity)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values())
+
+    def append(self, timestamp: float, values: Dict[str, Any]):
+        slot = self.total % self.capacity
+        self.columns["timestamp"][slot] = timestamp
+        for field in self.fields[1:]:
+            self.columns[field][slot] = values.get(field, 0)
+        self.total += 1
+
+    def since(self, sequence: int, max_samples: int) -> Tuple[Optional[Dict[str, List]], int]:
+        """Samples from number `sequence` on, as {field: values}, and how many were skipped
+
+        Samples already overwritten are skipped, and more than max_samples
+        are decimated evenly, always keeping the newest. Returns None when
+        there is nothing new.
+        """
+        if sequence > self.total:
+            # The vehicle was dropped and has come back with a fresh window
+            sequence = 0
+        start = max(sequence, self.total - self.capacity)
+        count = self.total - start
+        if count <= 0:
+            return None, 0
+        if count > max_samples:
+            numbers = np.linspace(start, self.total - 1, max_samples).astype(np.int64)
+        else:
+            numbers = np.arange(start, self.total)
+        slots = numbers % self.capacity
+        samples = {field: self.columns[field][slots].tolist() for field in self.fields}
+        return samples, self.total - sequence - len(numbers)
+
+
+class LiveVehicle:
+    """Rolling telemetry window of one vehicle (MAVLink system id)"""
+
+    def __init__(self, system_id: int, capacity: int):
+        self.system_id = system_id
+        self.signals = {
+            name: SignalRing(name, TELEMETRY_SCHEMA[name], capacity) for name in LIVE_SIGNALS
+        }
+        self.message_counts = {msg_type: 0 for msg_type in LIVE_MESSAGE_TYPES}
+        self.first_seen = self.last_seen = time.time()
+        # The reader thread appends while subscribers read from the event loop
+        self.lock = threading.Lock()
+
+    def append(self, msg_type: str, signal: str, timestamp: float, values: Dict[str, Any]):
+        with self.lock:
+            self.signals[signal].append(timestamp, values)
+            self.message_counts[msg_type] += 1
+            self.last_seen = time.time()
+
+    def since(self, cursors: Dict[str, int], signals: Tuple[str, ...],
+              max_samples: int) -> Tuple[Dict[str, Dict[str, List]], Dict[str, int]]:
+        """New samples of each signal since the cursors, which are advanced in place"""
+        samples, skipped = {}, {}
+        with self.lock:
+            for name in signals:
+                ring = self.signals[name]
+                new, missed = ring.since(cursors.get(name, 0), max_samples)
+                cursors[name] = ring.total
+                if new is not None:
+                    samples[name] = new
+                if missed:
+                    skipped[name] = missed
+        return samples, skipped
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "system_id": self.system_id,
+                "first_seen": self.first_seen,
+                "last_seen": self.last_seen,
+                "message_counts": dict(self.message_counts),
+                "samples": {name: len(ring) for name, ring in self.signals.items()},
+                "buffer_bytes": sum(ring.nbytes for ring in self.signals.values()),
+            }
+
+
+class LiveIngestService:
+    """Receives MAVLink telemetry from a live connection into per-vehicle windows.
+
+    A reader thread listens on a mavutil endpoint (udpin:, udpout:, tcp:,
+    serial ...) and appends position, attitude, power and vibration messages
+    to fixed-size ring buffers per vehicle, so memory stays constant however
+    long a vehicle flies. At most Config.LIVE_MAX_VEHICLES vehicles are kept;
+    a new one replaces the vehicle that has been silent longest.
+
+    Subscribers read the windows through subscribe(), which yields batches
+    at a bounded rate with only the samples they haven't seen yet.
+    """
+
+    def __init__(self, endpoint: Optional[str] = None, capacity: Optional[int] = None,
+                 max_vehicles: Optional[int] = None):
+        self.endpoint = endpoint or Config.LIVE_INGEST_ENDPOINT
+        self.capacity = capacity or Config.LIVE_BUFFER_SAMPLES
+        self.max_vehicles = max_vehicles or Config.LIVE_MAX_VEHICLES
+        self._vehicles: Dict[int, LiveVehicle] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.subscribers = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start listening; does nothing when no endpoint is configured"""
+        if not self.endpoint or self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="live-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        # recv_match only accepts a list or set of types
+        wanted = set(LIVE_MESSAGE_TYPES)
+        while not self._stop.is_set():
+            try:
+                connection = mavutil.mavlink_connection(self.endpoint, source_system=255)
+            except Exception as e:
+                print(f"Error opening live MAVLink endpoint {self.endpoint}: {e}")
+                self._stop.wait(RECONNECT_DELAY)
+                continue
+            print(f"Listening for live MAVLink telemetry on {self.endpoint}")
+            try:
+                while not self._stop.is_set():
+                    msg = connection.recv_match(type=wanted, blocking=True, timeout=0.5)
+                    if msg is not None:
+                        self.ingest(msg)
+            except Exception as e:
+                print(f"Error reading live MAVLink telemetry: {e}")
+                self._stop.wait(RECONNECT_DELAY)
+            finally:
+                connection.close()
+
+    def ingest(self, msg):
+        """Add one received MAVLink message to its vehicle's window"""
+        msg_type = msg.get_type()
+        if msg_type not in LIVE_MESSAGE_TYPES:
+            return
+        signal, convert = MAVLINK_SIGNALS[msg_type]
+        try:
+            values = convert(msg)
+        except Exception as e:
+            print(f"Skipping malformed {msg_type} message: {e}")
+            return
+        timestamp = getattr(msg, '_timestamp', None) or time.time()
+        self._vehicle(msg.get_srcSystem()).append(msg_type, signal, timestamp, values)
+        LIVE_MESSAGES.inc(type=msg_type)
+
+    def _vehicle(self, system_id: int) -> LiveVehicle:
+        vehicle = self._vehicles.get(system_id)
+        if vehicle is not None:
+            return vehicle
+        with self._lock:
+            if system_id not in self._vehicles:
+                if len(self._vehicles) >= self.max_vehicles:
+                    silent = min(self._vehicles.values(), key=lambda v: v.last_seen)
+                    del self._vehicles[silent.system_id]
+                    print(f"Dropped live telemetry of vehicle {silent.system_id} to make room for {system_id}")
+                self._vehicles[system_id] = LiveVehicle(system_id, self.capacity)
+                LIVE_VEHICLES.set(len(self._vehicles))
+            return self._vehicles[system_id]
+
+    def vehicles(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            vehicles = list(self._vehicles.values())
+        return [vehicle.status() for vehicle in sorted(vehicles, key=lambda v: v.system_id)]
+
+    def collect(self, cursors: Dict[int, Dict[str, int]], system_id: Optional[int] = None,
+                signals: Tuple[str, ...] = LIVE_SIGNALS,
+                max_samples: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """One batch of samples not yet seen by a subscriber, or None if there are none
+
+        cursors ({system_id: {signal: next sample}}) belong to the
+        subscriber and are advanced in place; a new subscriber starts with
+        the whole retained window.
+        """
+        max_samples = max_samples or Config.LIVE_BATCH_MAX_SAMPLES
+        with self._lock:
+            vehicles = [
+                vehicle for vehicle in self._vehicles.values()
+                if system_id is None or vehicle.system_id == system_id
+            ]
+        batch = {}
+        for vehicle in vehicles:
+            samples, skipped = vehicle.since(cursors.setdefault(vehicle.system_id, {}), signals, max_samples)
+            if samples:
+                batch[str(vehicle.system_id)] = {"signals": samples, "skipped": skipped}
+        if not batch:
+            return None
+        return {"type": "telemetry", "time": time.time(), "vehicles": batch}
+
+    async def subscribe(self, system_id: Optional[int] = None, signals: Optional[Tuple[str, ...]] = None,
+                        interval: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Yield batches of new samples, at most one per interval seconds
+
+        The interval is clamped to [Config.LIVE_MIN_INTERVAL, 10]; intervals
+        with nothing new yield nothing.
+        """
+        signals = tuple(signals or LIVE_SIGNALS)
+        interval = min(max(interval or Config.LIVE_UPDATE_INTERVAL, Config.LIVE_MIN_INTERVAL), MAX_UPDATE_INTERVAL)
+        cursors: Dict[int, Dict[str, int]] = {}
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        self.subscribers += 1
+        LIVE_SUBSCRIBERS.set(self.subscribers)
+        try:
+            while True:
+                batch = self.collect(cursors, system_id, signals)
+                if batch is not None:
+                    yield batch
+                # Keep a steady cadence however long sending the batch took
+                deadline = max(deadline + interval, loop.time())
+                await asyncio.sleep(deadline - loop.time())
+        finally:
+            self.subscribers -= 1
+            LIVE_SUBSCRIBERS.set(self.subscribers)
@@ -0,0 +1,213 @@
+"""Replay a DataFlash (.bin) log as a live MAVLink telemetry stream.
+
+Log records are converted to the messages an autopilot streams to a ground
+station (GPS -> GLOBAL_POSITION_INT, ATT -> ATTITUDE, BAT -> SYS_STATUS and
+BATTERY_STATUS, VIBE -> VIBRATION, plus a HEARTBEAT every second) and sent
+at the pace they were logged, like a SITL vehicle. Point the server's
+LIVE_INGEST_ENDPOINT at the same port to watch the flight live:
+
+    LIVE_INGEST_ENDPOINT=udpin:127.0.0.1:14550 python app.py
+    python live_replay.py flight.bin udpout:127.0.0.1:14550 --speed 5 --vehicles 3
+
+Logs can be generated with benchmarks.synthetic_log. --speed 0 sends as
+fast as possible; --vehicles replays the log once per system id.
+"""
+import argparse
+import time
+import numpy as np
+from typing import Dict, Iterator, List, Tuple, Any
+from pymavlink import mavutil
+from dataflash_decoder import DataFlashDecoder
+
+MAV_TYPE_QUADROTOR = 2
+MAV_AUTOPILOT_ARDUPILOTMEGA = 3
+MAV_STATE_ACTIVE = 4
+UINT16_UNKNOWN = 65535
+
+# (time, message name, fields of that message's _send method)
+ReplayMessage = Tuple[float, str, Dict[str, Any]]
+
+
+def _column(columns: Dict[str, np.ndarray], name: str, default: float = 0) -> np.ndarray:
+    values = columns.get(name)
+    if values is None:
+        return np.full(len(columns["TimeUS"]), default, dtype=np.float64)
+    return values.astype(np.float64)
+
+
+def _int(values: np.ndarray, low: int, high: int) -> np.ndarray:
+    return np.clip(np.nan_to_num(np.round(values)), low, high).astype(np.int64)
+
+
+def _global_position_int(gps: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    alt = _column(gps, "Alt")
+    course = np.radians(_column(gps, "GCrs"))
+    speed = _column(gps, "Spd")
+    return {
+        "time_boot_ms": gps["TimeUS"] // 1000,
+        "lat": _int(_column(gps, "Lat") * 1e7, -2**31, 2**31 - 1),
+        "lon": _int(_column(gps, "Lng") * 1e7, -2**31, 2**31 - 1),
+        "alt": _int(alt * 1000, -2**31, 2**31 - 1),
+        "relative_alt": _int((alt - alt[0]) * 1000, -2**31, 2**31 - 1),
+        "vx": _int(speed * np.cos(course) * 100, -32768, 32767),
+        "vy": _int(speed * np.sin(course) * 100, -32768, 32767),
+        "vz": _int(_column(gps, "VZ") * 100, -32768, 32767),
+        "hdg": _int(_column(gps, "GCrs") * 100, 0, 35999),
+    }
+
+
+def _attitude(att: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    # DataFlash logs degrees, MAVLink sends radians
+    zeros = np.zeros(len(att["TimeUS"]))
+    return {
+        "time_boot_ms": att["TimeUS"] // 1000,
+        "roll": np.radians(_column(att, "Roll")),
+        "pitch": np.radians(_column(att, "Pitch")),
+        "yaw": np.radians(_column(att, "Yaw")),
+        "rollspeed": zeros, "pitchspeed": zeros, "yawspeed": zeros,
+    }
+
+
+def _sys_status(bat: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    zeros = np.zeros(len(bat["TimeUS"]), dtype=np.int64)
+    return {
+        "onboard_control_sensors_present": zeros, "onboard_control_sensors_enabled": zeros,
+        "onboard_control_sensors_health": zeros, "load": zeros,
+        "voltage_battery": _int(_column(bat, "Volt") * 1000, 0, UINT16_UNKNOWN),
+        "current_battery": _int(_column(bat, "Curr") * 100, -1, 32767),
+        "battery_remaining": _int(_column(bat, "RemPct", -1), -1, 100),
+        "drop_rate_comm": zeros, "errors_comm": zeros, "errors_count1": zeros,
+        "errors_count2": zeros, "errors_count3": zeros, "errors_count4": zeros,
+    }
+
+
+def _battery_status(bat: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    count = len(bat["TimeUS"])
+    voltages = np.full((count, 10), UINT16_UNKNOWN, dtype=np.int64)
+    voltages[:, 0] = _int(_column(bat, "Volt") * 1000, 0, UINT16_UNKNOWN - 1)
+    zeros = np.zeros(count, dtype=np.int64)
+    return {
+        "id": _int(_column(bat, "Instance"), 0, 255), "battery_function": zeros, "type": zeros,
+        "temperature": np.full(count, 32767, dtype=np.int64),
+        "voltages": voltages,
+        "current_battery": _int(_column(bat, "Curr") * 100, -1, 32767),
+        "current_consumed": _int(_column(bat, "CurrTot", -1), -1, 2**31 - 1),
+        "energy_consumed": np.full(count, -1, dtype=np.int64),
+        "battery_remaining": _int(_column(bat, "RemPct", -1), -1, 100),
+    }
+
+
+def _vibration(vibe: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    # Older logs count clipping per IMU, newer ones log one row per IMU with a single Clip
+    clip = _column(vibe, "Clip")
+    return {
+        "time_usec": vibe["TimeUS"],
+        "vibration_x": _column(vibe, "VibeX"),
+        "vibration_y": _column(vibe, "VibeY"),
+        "vibration_z": _column(vibe, "VibeZ"),
+        "clipping_0": _int(_column(vibe, "Clip0") + clip, 0, 2**32 - 1),
+        "clipping_1": _int(_column(vibe, "Clip1"), 0, 2**32 - 1),
+        "clipping_2": _int(_column(vibe, "Clip2"), 0, 2**32 - 1),
+    }
+
+
+# DataFlash message -> MAVLink messages built from its records
+LOG_CONVERSIONS = {
+    "GPS": (("GLOBAL_POSITION_INT", _global_position_int),),
+    "ATT": (("ATTITUDE", _attitude),),
+    "BAT": (("SYS_STATUS", _sys_status), ("BATTERY_STATUS", _battery_status)),
+    "VIBE": (("VIBRATION", _vibration),),
+}
+
+
+def log_messages(path: str) -> List[ReplayMessage]:
+    """MAVLink messages for a log's records, in log time order"""
+    decoded = DataFlashDecoder(path).decode(LOG_CONVERSIONS)
+    streams = []
+    for name, columns in decoded.items():
+        if name == "VIBE" and "IMU" in columns:
+            # One row per IMU; VIBRATION reports the first
+            columns = {field: values[columns["IMU"] == 0] for field, values in columns.items()}
+        if len(columns["TimeUS"]) == 0:
+            continue
+        for msg_name, convert in LOG_CONVERSIONS[name]:
+            streams.append((columns["_timestamp"], msg_name, convert(columns)))
+    if not streams:
+        return []
+
+    times = np.concatenate([stream_times for stream_times, _, _ in streams])
+    stream_ids = np.concatenate([np.full(len(t), i) for i, (t, _, _) in enumerate(streams)])
+    rows = np.concatenate([np.arange(len(t)) for t, _, _ in streams])
+    order = np.argsort(times, kind="stable")
+
+    messages = []
+    heartbeat_at = float(times[order[0]])
+    for index in order:
+        t = float(times[index])
+        while t >= heartbeat_at:
+            messages.append((heartbeat_at, "HEARTBEAT", {
+                "type": MAV_TYPE_QUADROTOR, "autopilot": MAV_AUTOPILOT_ARDUPILOTMEGA,
+                "base_mode": 0, "custom_mode": 0, "system_status": MAV_STATE_ACTIVE,
+            }))
+            heartbeat_at += 1.0
+        _, msg_name, fields = streams[stream_ids[index]]
+        row = rows[index]
+        messages.append((t, msg_name, {field: values[row].tolist() for field, values in fields.items()}))
+    return messages
+
+
+def replay(endpoint: str, messages: List[ReplayMessage], speed: float = 1.0,
+           system_ids: Tuple[int, ...] = (1,), loop: bool = False) -> int:
+    """Send the messages to a mavutil endpoint at `speed` times log pace; returns messages sent"""
+    connection = mavutil.mavlink_connection(endpoint, source_system=system_ids[0], source_component=1)
+    sent = 0
+    try:
+        while messages:
+            started = time.monotonic()
+            first = messages[0][0]
+            for t, msg_name, fields in _paced(messages, started, first, speed):
+                send = getattr(connection.mav, msg_name.lower() + "_send")
+                for system_id in system_ids:
+                    connection.mav.srcSystem = system_id
+                    send(**fields)
+                    sent += 1
+            if not loop:
+                break
+    finally:
+        connection.close()
+    return sent
+
+
+def _paced(messages: List[ReplayMessage], started: float, first: float, speed: float) -> Iterator[ReplayMessage]:
+    for message in messages:
+        if speed > 0:
+            delay = (message[0] - first) / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        yield message
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a DataFlash log as live MAVLink telemetry")
+    parser.add_argument("log", help="DataFlash .bin log")
+    parser.add_argument("endpoint", nargs="?", default="udpout:127.0.0.1:14550",
+                        help="mavutil connection string (default udpout:127.0.0.1:14550)")
+    parser.add_argument("--speed", type=float, default=1.0, help="multiple of log pace; 0 sends as fast as possible")
+    parser.add_argument("--vehicles", type=int, default=1, help="replay as this many vehicles (system ids 1..N)")
+    parser.add_argument("--loop", action="store_true", help="start over at the end of the log")
+    args = parser.parse_args()
+
+    messages = log_messages(args.log)
+    if not messages:
+        parser.error(f"{args.log} has no GPS, ATT, BAT or VIBE records")
+    duration = messages[-1][0] - messages[0][0]
+    print(f"Replaying {len(messages)} messages ({duration:.0f} s of flight) to {args.endpoint} "
+          f"as {args.vehicles} vehicle(s)")
+    started = time.monotonic()
+    sent = replay(args.endpoint, messages, args.speed, tuple(range(1, args.vehicles + 1)), args.loop)
+    elapsed = time.monotonic() - started
+    print(f"Sent {sent} messages in {elapsed:.1f} s ({sent / max(elapsed, 1e-9):.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
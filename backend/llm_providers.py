@@ -0,0 +1,218 @@
+import asyncio
+import time
+import openai
+import anthropic
+from typing import Dict, List, Any, Optional, AsyncIterator
+from config import Config
+from metrics import record_llm_call
+
+
+class LLMProvider:
+    """Async chat model client shared by all requests.
+
+    One provider instance holds one SDK client, so HTTP connections are
+    pooled and reused across requests. At most max_concurrency requests are
+    in flight at once; the rest wait on a semaphore. Every request is bounded
+    by `timeout` seconds.
+
+    The system prompt is passed as a static `system_prompt` plus a
+    per-request `system_suffix`, so providers with prompt caching can reuse
+    the static prefix across requests.
+
+    Every call's latency, outcome and token usage (input, output,
+    cache_read, cache_write) are recorded in the metrics registry; callers
+    can also pass a `usage` dict to receive the token counts of their call.
+    """
+
+    name = "base"
+
+    def __init__(self, model: str, max_concurrency: int = None, timeout: float = None):
+        self.model = model
+        self.max_concurrency = max_concurrency or Config.LLM_MAX_CONCURRENCY
+        self.timeout = timeout or Config.LLM_TIMEOUT
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def complete(self, system_prompt: str, message: str, max_tokens: int = 700,
+                       temperature: Optional[float] = None, system_suffix: str = "",
+                       usage: Dict[str, int] = None) -> str:
+        """Return the model's reply to a single user message"""
+        usage = {} if usage is None else usage
+        async with self._semaphore:
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                text = await asyncio.wait_for(
+                    self._complete(system_prompt, system_suffix, message, max_tokens, temperature, usage),
+                    self.timeout)
+                outcome = "ok"
+                return text
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise Exception(f"{self.name} request timed out after {self.timeout}s")
+            finally:
+                record_llm_call(self.name, self.model, time.perf_counter() - start, outcome, usage)
+
+    async def stream(self, system_prompt: str, message: str, max_tokens: int = 700,
+                     temperature: Optional[float] = None, system_suffix: str = "",
+                     usage: Dict[str, int] = None) -> AsyncIterator[str]:
+        """Yield the model's reply in text fragments as they arrive.
+
+        The timeout applies to the wait for each fragment, so long answers
+        are not cut off while the model keeps producing output. usage is
+        filled in once the stream has finished.
+        """
+        usage = {} if usage is None else usage
+        async with self._semaphore:
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                fragments = self._stream(system_prompt, system_suffix, message, max_tokens,
+                                         temperature, usage).__aiter__()
+                while True:
+                    try:
+                        text = await asyncio.wait_for(fragments.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        outcome = "timeout"
+                        raise Exception(f"{self.name} stream stalled for {self.timeout}s")
+                    yield text
+                outcome = "ok"
+            except (GeneratorExit, asyncio.CancelledError):
+                # The consumer stopped reading (e.g. the client disconnected)
+                outcome = "cancelled"
+                raise
+            finally:
+                record_llm_call(self.name, self.model, time.perf_counter() - start, outcome, usage)
+
+    async def _complete(self, system_prompt: str, system_suffix: str, message: str, max_tokens: int,
+                        temperature: Optional[float], usage: Dict[str, int]) -> str:
+        raise NotImplementedError
+
+    def _stream(self, system_prompt: str, system_suffix: str, message: str, max_tokens: int,
+                temperature: Optional[float], usage: Dict[str, int]) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    async def close(self):
+        """Close pooled connections"""
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self, api_key: str, base_url: str = None, model: str = None, **kwargs):
+        super().__init__(model or Config.OPENAI_MODEL, **kwargs)
+        self.client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=self.timeout)
+
+    @staticmethod
+    def _record_usage(response_usage, usage: Dict[str, int]):
+        if response_usage is None:
+            return
+        details = getattr(response_usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+        # prompt_tokens includes the cached ones
+        usage["input"] = response_usage.prompt_tokens - cached
+        usage["cache_read"] = cached
+        usage["output"] = response_usage.completion_tokens
+
+    # OpenAI caches repeated prompt prefixes automatically; keeping the
+    # static part first in the system message is all that is needed
+    async def _complete(self, system_prompt, system_suffix, message, max_tokens, temperature, usage):
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt + system_suffix},
+                {"role": "user", "content": message}
+            ],
+            max_tokens=max_tokens,
+            temperature=0.7 if temperature is None else temperature
+        )
+        self._record_usage(response.usage, usage)
+        return response.choices[0].message.content
+
+    async def _stream(self, system_prompt, system_suffix, message, max_tokens, temperature, usage):
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt + system_suffix},
+                {"role": "user", "content": message}
+            ],
+            max_tokens=max_tokens,
+            temperature=0.7 if temperature is None else temperature,
+            stream=True,
+            # Token counts arrive in a final chunk without choices
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None) is not None:
+                self._record_usage(chunk.usage, usage)
+
+    async def close(self):
+        await self.client.close()
+
+
+class AnthropicProvider(LLMProvider):
+    name = "anthropic"
+
+    def __init__(self, api_key: str, base_url: str = None, model: str = None, **kwargs):
+        super().__init__(model or Config.ANTHROPIC_MODEL, **kwargs)
+        self.client = anthropic.AsyncAnthropic(api_key=api_key, base_url=base_url, timeout=self.timeout)
+
+    @staticmethod
+    def _system_blocks(system_prompt: str, system_suffix: str) -> List[Dict[str, Any]]:
+        """System prompt with a cache breakpoint after the static prefix"""
+        blocks = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+        if system_suffix:
+            blocks.append({"type": "text", "text": system_suffix})
+        return blocks
+
+    @staticmethod
+    def _record_usage(response_usage, usage: Dict[str, int]):
+        usage["input"] = response_usage.input_tokens
+        usage["output"] = response_usage.output_tokens
+        usage["cache_read"] = getattr(response_usage, "cache_read_input_tokens", 0) or 0
+        usage["cache_write"] = getattr(response_usage, "cache_creation_input_tokens", 0) or 0
+
+    async def _complete(self, system_prompt, system_suffix, message, max_tokens, temperature, usage):
+        options = {} if temperature is None else {"temperature": temperature}
+        response = await self.client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            system=self._system_blocks(system_prompt, system_suffix),
+            messages=[
+                {"role": "user", "content": message}
+            ],
+            **options
+        )
+        self._record_usage(response.usage, usage)
+        return response.content[0].text
+
+    async def _stream(self, system_prompt, system_suffix, message, max_tokens, temperature, usage):
+        options = {} if temperature is None else {"temperature": temperature}
+        async with self.client.messages.stream(
+            model=self.model,
+            max_tokens=max_tokens,
+            system=self._system_blocks(system_prompt, system_suffix),
+            messages=[
+                {"role": "user", "content": message}
+            ],
+            **options
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            self._record_usage((await stream.get_final_message()).usage, usage)
+
+    async def close(self):
+        await self.client.close()
+
+
+def create_llm_provider() -> Optional[LLMProvider]:
+    """Build the provider for the configured API key, or None to use fallbacks"""
+    provider = Config.get_llm_provider()
+    if provider == "openai":
+        return OpenAIProvider(Config.OPENAI_API_KEY, base_url=Config.OPENAI_BASE_URL)
+    if provider == "anthropic":
+        return AnthropicProvider(Config.ANTHROPIC_API_KEY, base_url=Config.ANTHROPIC_BASE_URL)
+    return None
@@ -2,17 +2,106 @@ import pymavlink.mavutil as mavutil
 import json
 import uuid
 import os
+import time
 from datetime import datetime
-from typing import Dict, List, Any
-# import numpy as np
+from typing import Dict, List, Any, Tuple
+import numpy as np
+from telemetry_store import FlightTelemetry
+from anomaly_detectors import (detect_anomalies, anomaly_labels, highest_severity, most_severe,
+                               format_anomaly_events, EVENT_RECOMMENDATIONS)
+from flight_repository import FlightRepository
+from dataflash_decoder import DataFlashDecoder, UnsupportedLogError, ParseCancelledError
+from config import Config
+from metrics import span, observe_stage, record_decode
+
+# DataFlash message types decoded in bulk, mapped to telemetry signal fields.
+# Must stay in sync with the per-message handling in _decode_with_pymavlink.
+DATAFLASH_SIGNALS = {
+    "GPS": ("gps", {"timestamp": "_timestamp", "lat": "Lat", "lon": "Lng", "alt": "Alt",
+                    "fix_type": "Status", "hdop": "HDop", "speed": "Spd"}),
+    "ATT": ("attitude", {"timestamp": "_timestamp", "roll": "Roll", "pitch": "Pitch", "yaw": "Yaw"}),
+    "BAT": ("battery", {"timestamp": "_timestamp", "voltage": "Volt", "current": "Curr",
+                        "remaining": "CurrTot"}),
+    "VIBE": ("vibration", {"timestamp": "_timestamp", "vibe_x": "VibeX", "vibe_y": "VibeY",
+                           "vibe_z": "VibeZ", "clip_0": "Clip0", "clip_1": "Clip1", "clip_2": "Clip2"}),
+    "BARO": ("barometer", {"timestamp": "_timestamp", "altitude": "Alt", "pressure": "Press",
+                           "temperature": "Temp"}),
+    "MODE": ("mode", {"timestamp": "_timestamp", "mode": "Mode", "mode_num": "ModeNum"}),
+}
+
+# Standard MAVLink messages (telemetry logs, live streams) mapped to a
+# telemetry signal and that signal's fields, without the timestamp.
+# Used by _decode_with_pymavlink and by live_ingest.
+MAVLINK_SIGNALS = {
+    "GPS_RAW_INT": ("gps", lambda msg: {"lat": msg.lat / 1e7, "lon": msg.lon / 1e7, "alt": msg.alt / 1000,
+                                        "fix_type": msg.fix_type}),
+    "GLOBAL_POSITION_INT": ("position", lambda msg: {"lat": msg.lat / 1e7, "lon": msg.lon / 1e7,
+                                                     "alt": msg.alt / 1000, "relative_alt": msg.relative_alt / 1000,
+                                                     "vx": msg.vx / 100.0, "vy": msg.vy / 100.0,
+                                                     "vz": msg.vz / 100.0}),
+    "ATTITUDE": ("attitude", lambda msg: {"roll": msg.roll, "pitch": msg.pitch, "yaw": msg.yaw}),
+    "BATTERY_STATUS": ("battery", lambda msg: {"voltage": msg.voltages[0] / 1000.0,
+                                               "current": msg.current_battery / 100.0,
+                                               "remaining": msg.battery_remaining}),
+    "SYS_STATUS": ("system_status", lambda msg: {"voltage_battery": msg.voltage_battery / 1000.0,
+                                                 "current_battery": msg.current_battery / 100.0,
+                                                 "battery_remaining": msg.battery_remaining}),
+    "VIBRATION": ("vibration", lambda msg: {"vibe_x": msg.vibration_x, "vibe_y": msg.vibration_y,
+                                            "vibe_z": msg.vibration_z, "clip_0": msg.clipping_0,
+                                            "clip_1": msg.clipping_1, "clip_2": msg.clipping_2}),
+}
+
+def _value_range(values: np.ndarray) -> Dict[str, float]:
+    """Min/max of an array as plain floats, 0 when the array is empty"""
+    if len(values) == 0:
+        return {"min": 0, "max": 0}
+    return {"min": float(values.min()), "max": float(values.max())}
+
+def _merge_range(previous: Dict[str, float], values: np.ndarray) -> Dict[str, float]:
+    """_value_range of the earlier values (summarized by `previous`, None if there were none) plus `values`"""
+    if previous is None or len(values) == 0:
+        return previous if previous is not None else _value_range(values)
+    return {"min": min(previous["min"], float(values.min())), "max": max(previous["max"], float(values.max()))}
+
+def _first_matches(values: np.ndarray, condition, count: int) -> np.ndarray:
+    """The first `count` values meeting `condition`, reading only as much of the array as needed"""
+    window = 64
+    while True:
+        found = values[:window][condition(values[:window])]
+        if len(found) >= count or window >= len(values):
+            return found[:count]
+        window *= 4
+
+def _voltage_trend(voltages: np.ndarray) -> List[float]:
+    """The battery_patterns voltage trend (first and last five positive readings) without a full scan"""
+    positive = lambda values: values > 0
+    head = _first_matches(voltages, positive, 11)
+    if len(head) <= 10:
+        return head.tolist()
+    tail = _first_matches(voltages[::-1], positive, 5)[::-1]
+    return np.concatenate((head[:5], tail)).tolist()
 
 class MAVLinkParser:
-    def __init__(self):
-        self.flights = {}
+    def __init__(self, repository: FlightRepository = None):
+        # Shared with ChatService; a standalone parser keeps flights in memory only
+        self.repository = repository if repository is not None else FlightRepository(persistent=False)
         self.upload_dir = "uploads"
 
-    def parse_bin_file(self, file_path: str) -> Dict[str, Any]:
-        """Parse MAVLink .bin file and extract flight data"""
+    def parse_bin_file(self, file_path: str, engine: str = None, cancel_event=None,
+                       progress=None, summarize: bool = True) -> Dict[str, Any]:
+        """Parse MAVLink .bin file and extract flight data
+
+        engine selects the decoder: "bulk" (memory-mapped DataFlash decoder),
+        "pymavlink" (per-message recv_match loop) or "auto" (bulk, falling back
+        to pymavlink for logs it cannot handle). Defaults to Config.PARSE_ENGINE.
+        cancel_event is an optional Event polled during decoding; once it is
+        set the parse stops with ParseCancelledError. progress, if given, is a
+        dict updated with bytes_consumed/messages_decoded while decoding.
+        With summarize=False the summary is left empty so it can be generated
+        later with summarize_flight(); anomaly analysis runs in the background
+        (see anomaly_tasks).
+        The flight is returned but not registered; callers add it with add_flight().
+        """
         try:
             # Validate file exists and size
             if not os.path.exists(file_path):
@@ -21,170 +110,61 @@ class MAVLinkParser:
             file_size = os.path.getsize(file_path)
             if file_size == 0:
                 raise Exception("Empty file - please upload a valid .bin flight log")
-            if file_size > 100 * 1024 * 1024:  # 100MB limit
-                raise Exception("File too large (>100MB) - please upload a smaller flight log")
+            if file_size > Config.MAX_FILE_SIZE:
+                raise Exception(Config.FILE_TOO_LARGE_MESSAGE)
             
             # Validate it's a .bin file
             if not file_path.lower().endswith('.bin'):
                 raise Exception("Invalid file type - please upload a .bin flight log file")
             
-            # Create connection to log file
-            mlog = mavutil.mavlink_connection(file_path)
-
             flight_id = str(uuid.uuid4())
+            telemetry = FlightTelemetry()
             flight_data = {
                 "flight_id": flight_id,
                 "file_path": file_path,
                 "messages": [],
                 "summary": {},
-                "telemetry": {
-                    "gps": [],
-                    "attitude": [],
-                    "battery": [],
-                    "vibration": [],
-                    "position": [],
-                    "system_status": [],
-                    "barometer": [],
-                    "mode": []
-                },
+                "telemetry": telemetry,
                 "message_types": {},
-                "total_messages": 0
+                "total_messages": 0,
+                # Decoder position for append_to_flight(); None when the log cannot be resumed
+                "parse_state": None
             }
 
-            # Parse messages
-            message_count = 0
-            message_types = {}
-            
-            # Add timeout protection for parsing
-            import time
-            start_time = time.time()
             max_parse_time = 60  # 60 seconds max
-            
-            while True:
-                # Check timeout
-                if time.time() - start_time > max_parse_time:
-                    raise Exception("File parsing timeout - file may be corrupted or too complex")
-                
-                msg = mlog.recv_match(blocking=False)
-                if msg is None:
-                    break
-
-                message_count += 1
-                msg_type = msg.get_type()
-                message_types[msg_type] = message_types.get(msg_type, 0) + 1
-                
-                # Basic validation
-                if message_count > 1000000:  # Prevent memory issues
-                    raise Exception("File too complex - contains too many messages")
-
-                # Extract key telemetry data with better error handling
-                try:
-                    # Handle ArduPilot log format messages
-                    if msg_type == 'GPS':
-                        flight_data["telemetry"]["gps"].append({
-                            "timestamp": getattr(msg, '_timestamp', 0),
-                            "lat": getattr(msg, 'Lat', 0),
-                            "lon": getattr(msg, 'Lng', 0),
-                            "alt": getattr(msg, 'Alt', 0),
-                            "fix_type": getattr(msg, 'Status', 0),
-                            "hdop": getattr(msg, 'HDop', 0),
-                            "speed": getattr(msg, 'Spd', 0)
-                        })
-                    elif msg_type == 'ATT':
-                        flight_data["telemetry"]["attitude"].append({
-                            "timestamp": getattr(msg, '_timestamp', 0),
-                            "roll": getattr(msg, 'Roll', 0),
-                            "pitch": getattr(msg, 'Pitch', 0),
-                            "yaw": getattr(msg, 'Yaw', 0)
-                        })
-                    elif msg_type == 'BAT':
-                        flight_data["telemetry"]["battery"].append({
-                            "timestamp": getattr(msg, '_timestamp', 0),
-                            "voltage": getattr(msg, 'Volt', 0),
-                            "current": getattr(msg, 'Curr', 0),
-                            "remaining": getattr(msg, 'CurrTot', 0)
-                        })
-                    elif msg_type == 'VIBE':
-                        flight_data["telemetry"]["vibration"].append({
-                            "timestamp": getattr(msg, '_timestamp', 0),
-                            "vibe_x": getattr(msg, 'VibeX', 0),
-                            "vibe_y": getattr(msg, 'VibeY', 0),
-                            "vibe_z": getattr(msg, 'VibeZ', 0)
-                        })
-                    elif msg_type == 'BARO':
-                        flight_data["telemetry"]["barometer"] = flight_data["telemetry"].get("barometer", [])
-                        flight_data["telemetry"]["barometer"].append({
-                            "timestamp": getattr(msg, '_timestamp', 0),
-                            "altitude": getattr(msg, 'Alt', 0),
-                            "pressure": getattr(msg, 'Press', 0),
-                            "temperature": getattr(msg, 'Temp', 0)
-                        })
-                    elif msg_type == 'MODE':
-                        flight_data["telemetry"]["mode"] = flight_data["telemetry"].get("mode", [])
-                        flight_data["telemetry"]["mode"].append({
-                            "timestamp": getattr(msg, '_timestamp', 0),
-                            "mode": getattr(msg, 'Mode', 0),
-                            "mode_num": getattr(msg, 'ModeNum', 0)
-                        })
-                    # Handle standard MAVLink messages as fallback
-                    elif msg_type == 'GPS_RAW_INT':
-                        flight_data["telemetry"]["gps"].append({
-                            "timestamp": getattr(msg, '_timestamp', 0),
-                            "lat": msg.lat / 1e7,
-                            "lon": msg.lon / 1e7,
-                            "alt": msg.alt / 1000,
-                            "fix_type": msg.fix_type
-                        })
-                    elif msg_type == 'GLOBAL_POSITION_INT':
-                        flight_data["telemetry"]["position"].append({
-                            "timestamp": getattr(msg, '_timestamp', 0),
-                            "lat": msg.lat / 1e7,
-                            "lon": msg.lon / 1e7,
-                            "alt": msg.alt / 1000,
-                            "relative_alt": msg.relative_alt / 1000,
-                            "vx": msg.vx / 100.0,
-                            "vy": msg.vy / 100.0,
-                            "vz": msg.vz / 100.0
-                        })
-                    elif msg_type == 'ATTITUDE':
-                        flight_data["telemetry"]["attitude"].append({
-                            "timestamp": getattr(msg, '_timestamp', 0),
-                            "roll": msg.roll,
-                            "pitch": msg.pitch,
-                            "yaw": msg.yaw
-                        })
-                    elif msg_type == 'BATTERY_STATUS':
-                        flight_data["telemetry"]["battery"].append({
-                            "timestamp": getattr(msg, '_timestamp', 0),
-                            "voltage": msg.voltages[0] / 1000.0,
-                            "current": msg.current_battery / 100.0,
-                            "remaining": msg.battery_remaining
-                        })
-                    elif msg_type == 'SYS_STATUS':
-                        flight_data["telemetry"]["system_status"].append({
-                            "timestamp": getattr(msg, '_timestamp', 0),
-                            "voltage_battery": msg.voltage_battery / 1000.0,
-                            "current_battery": msg.current_battery / 100.0,
-                            "battery_remaining": msg.battery_remaining
-                        })
-                    elif msg_type == 'VIBRATION':
-                        flight_data["telemetry"]["vibration"].append({
-                            "timestamp": getattr(msg, '_timestamp', 0),
-                            "vibe_x": msg.vibration_x,
-                            "vibe_y": msg.vibration_y,
-                            "vibe_z": msg.vibration_z
-                        })
-                except Exception as msg_error:
-                    # Skip problematic messages but don't fail the entire parse
-                    print(f"Warning: Could not parse {msg_type}: {msg_error}")
-                    continue
+            engine = engine or Config.PARSE_ENGINE
+            with span("decode"):
+                if engine == "pymavlink":
+                    message_types = self._decode_with_pymavlink(file_path, telemetry, max_parse_time, cancel_event, progress)
+                else:
+                    try:
+                        decoder = self._decode_dataflash(file_path, telemetry, max_parse_time, cancel_event, progress)
+                        message_types = decoder.message_types
+                        flight_data["parse_state"] = decoder.state
+                    except UnsupportedLogError as e:
+                        if engine == "bulk":
+                            raise
+                        # Older log layouts still go through pymavlink
+                        print(f"Bulk decoder not applicable ({e}), falling back to pymavlink")
+                        telemetry = flight_data["telemetry"] = FlightTelemetry()
+                        message_types = self._decode_with_pymavlink(file_path, telemetry, max_parse_time, cancel_event, progress)
+            message_count = sum(message_types.values())
+
+            # Compact telemetry into read-only typed arrays, with zoom levels for plotting
+            with span("telemetry_freeze"):
+                telemetry.freeze()
+            with span("telemetry_pyramids"):
+                telemetry.build_pyramids()
+            flight_data["signal_manifest"] = telemetry.manifest()
 
             # Store debug info
             flight_data["message_types"] = message_types
             flight_data["total_messages"] = message_count
 
             # Generate summary
-            flight_data["summary"] = self._generate_summary(flight_data)
+            if summarize:
+                with span("summary"):
+                    flight_data["summary"] = self._generate_summary(flight_data)
 
             # Validate we got some useful data
             if message_count == 0:
@@ -192,27 +172,237 @@ class MAVLinkParser:
             
             # Check for essential telemetry
             essential_data = False
-            if (flight_data["telemetry"]["gps"] or 
-                flight_data["telemetry"]["position"] or 
-                flight_data["telemetry"]["attitude"]):
+            if (telemetry["gps"] or 
+                telemetry["position"] or 
+                telemetry["attitude"]):
                 essential_data = True
             
             if not essential_data:
                 raise Exception("No essential telemetry data found - file may not contain flight data")
 
-            # Store flight data
-            self.flights[flight_id] = flight_data
-
             return flight_data
 
+        except ParseCancelledError:
+            raise
         except Exception as e:
-            # Clean up any partial data
-            if 'flight_id' in locals() and flight_id in self.flights:
-                del self.flights[flight_id]
             raise Exception(f"Error parsing MAVLink file: {str(e)}")
 
+    def _decode_with_pymavlink(self, file_path: str, telemetry: FlightTelemetry,
+                               max_parse_time: float, cancel_event=None, progress=None) -> Dict[str, int]:
+        """Decode telemetry one message at a time through pymavlink's recv_match"""
+        # Create connection to log file
+        mlog = mavutil.mavlink_connection(file_path)
+
+        # Bind the per-signal appenders once instead of looking them up per message
+        append_gps = telemetry["gps"].append
+        append_attitude = telemetry["attitude"].append
+        append_battery = telemetry["battery"].append
+        append_vibration = telemetry["vibration"].append
+        append_position = telemetry["position"].append
+        append_system_status = telemetry["system_status"].append
+        append_barometer = telemetry["barometer"].append
+        append_mode = telemetry["mode"].append
+        append_standard = {signal: telemetry[signal].append for signal, _ in MAVLINK_SIGNALS.values()}
+
+        # Parse messages
+        message_count = 0
+        message_types = {}
+        decode_seconds = {}
+        start_time = time.time()
+        
+        while True:
+            # Check timeout
+            if time.time() - start_time > max_parse_time:
+                raise Exception("File parsing timeout - file may be corrupted or too complex")
+            
+            message_start = time.perf_counter()
+            msg = mlog.recv_match(blocking=False)
+            if msg is None:
+                break
+
+            message_count += 1
+            msg_type = msg.get_type()
+            message_types[msg_type] = message_types.get(msg_type, 0) + 1
+            
+            # Basic validation
+            if message_count > Config.MAX_LOG_MESSAGES:  # Prevent memory issues
+                raise Exception("File too complex - contains too many messages")
+
+            # Polling cross-process state is not free, so only do it periodically
+            if message_count % 10000 == 0:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise ParseCancelledError("Parsing was cancelled")
+                if progress is not None:
+                    progress.update(bytes_consumed=getattr(mlog, 'offset', 0), messages_decoded=message_count)
+
+            # Extract key telemetry data with better error handling
+            try:
+                # Handle ArduPilot log format messages
+                if msg_type == 'GPS':
+                    append_gps(
+                        timestamp=getattr(msg, '_timestamp', 0),
+                        lat=getattr(msg, 'Lat', 0),
+                        lon=getattr(msg, 'Lng', 0),
+                        alt=getattr(msg, 'Alt', 0),
+                        fix_type=getattr(msg, 'Status', 0),
+                        hdop=getattr(msg, 'HDop', 0),
+                        speed=getattr(msg, 'Spd', 0)
+                    )
+                elif msg_type == 'ATT':
+                    append_attitude(
+                        timestamp=getattr(msg, '_timestamp', 0),
+                        roll=getattr(msg, 'Roll', 0),
+                        pitch=getattr(msg, 'Pitch', 0),
+                        yaw=getattr(msg, 'Yaw', 0)
+                    )
+                elif msg_type == 'BAT':
+                    append_battery(
+                        timestamp=getattr(msg, '_timestamp', 0),
+                        voltage=getattr(msg, 'Volt', 0),
+                        current=getattr(msg, 'Curr', 0),
+                        remaining=getattr(msg, 'CurrTot', 0)
+                    )
+                elif msg_type == 'VIBE':
+                    append_vibration(
+                        timestamp=getattr(msg, '_timestamp', 0),
+                        vibe_x=getattr(msg, 'VibeX', 0),
+                        vibe_y=getattr(msg, 'VibeY', 0),
+                        vibe_z=getattr(msg, 'VibeZ', 0),
+                        clip_0=getattr(msg, 'Clip0', 0),
+                        clip_1=getattr(msg, 'Clip1', 0),
+                        clip_2=getattr(msg, 'Clip2', 0)
+                    )
+                elif msg_type == 'BARO':
+                    append_barometer(
+                        timestamp=getattr(msg, '_timestamp', 0),
+                        altitude=getattr(msg, 'Alt', 0),
+                        pressure=getattr(msg, 'Press', 0),
+                        temperature=getattr(msg, 'Temp', 0)
+                    )
+                elif msg_type == 'MODE':
+                    append_mode(
+                        timestamp=getattr(msg, '_timestamp', 0),
+                        mode=getattr(msg, 'Mode', 0),
+                        mode_num=getattr(msg, 'ModeNum', 0)
+                    )
+                # Handle standard MAVLink messages as fallback
+                elif msg_type in MAVLINK_SIGNALS:
+                    signal, convert = MAVLINK_SIGNALS[msg_type]
+                    append_standard[signal](timestamp=getattr(msg, '_timestamp', 0), **convert(msg))
+            except Exception as msg_error:
+                # Skip problematic messages but don't fail the entire parse
+                print(f"Warning: Could not parse {msg_type}: {msg_error}")
+
+            # Read plus extraction time, attributed to the message's type
+            decode_seconds[msg_type] = decode_seconds.get(msg_type, 0.0) + time.perf_counter() - message_start
+
+        if progress is not None:
+            progress.update(bytes_consumed=getattr(mlog, 'offset', 0), messages_decoded=message_count)
+        record_decode(message_types, decode_seconds)
+        return message_types
+
+    def _decode_dataflash(self, file_path: str, telemetry: FlightTelemetry, max_parse_time: float,
+                          cancel_event=None, progress=None, state: Dict[str, Any] = None) -> DataFlashDecoder:
+        """Decode telemetry in bulk from a memory-mapped DataFlash log
+
+        With `state` (from an earlier decoder) only the records after it are
+        decoded. Returns the decoder, whose state resumes after this run.
+        """
+        decoder = DataFlashDecoder(file_path, max_parse_time=max_parse_time,
+                                   cancel_event=cancel_event, progress=progress, state=state)
+        decoded = decoder.decode(DATAFLASH_SIGNALS.keys())
+
+        observe_stage("decode_scan", decoder.scan_seconds)
+        observe_stage("decode_columns", sum(decoder.decode_seconds.values()))
+        record_decode(decoder.decoded_message_types, decoder.decode_seconds)
+
+        if decoder.total_messages > Config.MAX_LOG_MESSAGES:  # Prevent memory issues
+            raise Exception("File too complex - contains too many messages")
+
+        with span("telemetry_build"):
+            for msg_type, (signal, field_map) in DATAFLASH_SIGNALS.items():
+                columns = decoded.get(msg_type)
+                if not columns:
+                    continue
+                telemetry[signal].extend({
+                    field: columns[column]
+                    for field, column in field_map.items()
+                    if column in columns
+                })
+
+        return decoder
+
+    def decode_appended(self, file_path: str, parse_state: Dict[str, Any], cancel_event=None,
+                        progress=None) -> Dict[str, Any]:
+        """Decode the records written to a log since `parse_state` was taken
+
+        Returns the new samples as (frozen) telemetry together with the
+        cumulative message counts and the state to resume from next time.
+        time_shift is non-zero when the log's time base was found in the
+        new records: it has to be added to the samples decoded before.
+        """
+        if not os.path.exists(file_path):
+            raise Exception("File not found")
+        if os.path.getsize(file_path) > Config.MAX_FILE_SIZE:
+            raise Exception(Config.FILE_TOO_LARGE_MESSAGE)
+
+        telemetry = FlightTelemetry()
+        with span("decode"):
+            decoder = self._decode_dataflash(file_path, telemetry, 60, cancel_event, progress, state=parse_state)
+        with span("telemetry_freeze"):
+            telemetry.freeze()
+        time_shift = 0.0
+        if parse_state["timebase"] is None and decoder.timebase is not None:
+            time_shift = decoder.timebase
+        return {
+            "telemetry": telemetry,
+            "message_types": decoder.message_types,
+            "total_messages": decoder.total_messages,
+            "parse_state": decoder.state,
+            "time_shift": time_shift,
+        }
+
+    def append_to_flight(self, flight_data: Dict[str, Any],
+                         appended: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        """Add samples from decode_appended() to a copy of a summarized flight
+
+        Telemetry, pyramids, the signal manifest and the summary are
+        extended using only the new samples. The flight passed in is left
+        as it was (the copy shares its sample arrays), so an append that
+        fails later can just be dropped. Anomaly events need the whole
+        flight, so they are marked stale for the background anomaly
+        analysis to recompute. Returns the grown flight and each signal's
+        previous sample count (see FlightTelemetry.grow).
+        """
+        telemetry = flight_data["telemetry"].copy()
+        with span("telemetry_grow"):
+            starts = telemetry.grow(appended["telemetry"], appended["time_shift"])
+        grown = {**flight_data, "telemetry": telemetry}
+        manifest = flight_data.get("signal_manifest")
+        if manifest is None or appended["time_shift"]:
+            grown["signal_manifest"] = telemetry.manifest()
+        else:
+            grown["signal_manifest"] = telemetry.extend_manifest(manifest, starts)
+
+        grown["message_types"] = appended["message_types"]
+        grown["total_messages"] = appended["total_messages"]
+        grown["parse_state"] = appended["parse_state"]
+        with span("summary"):
+            grown["summary"] = self._extend_summary(grown, starts)
+        return grown, starts
+
+    def summarize_flight(self, flight_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Generate the summary for a flight parsed with summarize=False"""
+        with span("summary"):
+            flight_data["summary"] = self._generate_summary(flight_data)
+        return flight_data["summary"]
+
     def _generate_summary(self, flight_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Generate flight summary statistics"""
+        """Generate flight summary statistics
+
+        Anomaly analysis is not part of the summary step; it is added later
+        by analyze_anomalies() (see anomaly_tasks).
+        """
         summary = {
             "duration": 0,
             "max_altitude": 0,
@@ -224,145 +414,242 @@ class MAVLinkParser:
             "total_messages": flight_data.get("total_messages", 0)
         }
 
+        telemetry = flight_data["telemetry"]
+
         # Try both GPS and position data for calculations
-        position_data = flight_data["telemetry"]["position"] or flight_data["telemetry"]["gps"]
+        position_data = telemetry["position"] or telemetry["gps"]
         
         # Calculate duration
         if position_data:
-            start_time = position_data[0]["timestamp"]
-            end_time = position_data[-1]["timestamp"]
-            summary["duration"] = end_time - start_time
+            timestamps = position_data["timestamp"]
+            summary["duration"] = float(timestamps[-1] - timestamps[0])
 
         # Calculate max altitude
         if position_data:
-            altitudes = [point.get("alt", 0) for point in position_data]
-            summary["max_altitude"] = max(altitudes) if altitudes else 0
+            summary["max_altitude"] = float(position_data["alt"].max())
 
         # Calculate max speed from position data
-        if flight_data["telemetry"]["position"]:
-            speeds = []
-            for point in flight_data["telemetry"]["position"]:
-                vx = point.get("vx", 0)
-                vy = point.get("vy", 0)
-                vz = point.get("vz", 0)
-                speed = (vx**2 + vy**2 + vz**2)**0.5
-                speeds.append(speed)
-            summary["max_speed"] = max(speeds) if speeds else 0
+        if telemetry["position"]:
+            position = telemetry["position"]
+            speeds = np.sqrt(position["vx"]**2 + position["vy"]**2 + position["vz"]**2)
+            summary["max_speed"] = float(speeds.max())
 
         # Battery usage from system status or battery data
-        battery_data = flight_data["telemetry"]["system_status"] or flight_data["telemetry"]["battery"]
-        if battery_data:
-            initial_battery = battery_data[0].get("battery_remaining", 100)
-            final_battery = battery_data[-1].get("battery_remaining", 100)
-            summary["battery_usage"] = initial_battery - final_battery
+        battery_data = telemetry["system_status"] or telemetry["battery"]
+        if battery_data and "battery_remaining" in battery_data:
+            remaining = battery_data["battery_remaining"]
+            summary["battery_usage"] = int(remaining[0]) - int(remaining[-1])
+
+        # Sample counts per signal, available even when telemetry is not loaded
+        summary["signal_counts"] = {name: len(signal) for name, signal in telemetry.items()}
 
         # Prepare telemetry summary for LLM analysis (no hardcoded rules)
-        summary["telemetry_summary"] = self._prepare_telemetry_summary(flight_data)
-        
-        # Proactively analyze anomalies using LLM
-        summary["anomaly_analysis"] = self._analyze_anomalies_with_llm(summary["telemetry_summary"])
+        with span("telemetry_summary"):
+            summary["telemetry_summary"] = self._prepare_telemetry_summary(flight_data)
+        summary["anomalies"] = anomaly_labels(summary["telemetry_summary"]["anomaly_events"])
+        summary["anomaly_analysis_status"] = "pending"
 
         return summary
 
+    def _extend_summary(self, flight_data: Dict[str, Any], starts: Dict[str, int]) -> Dict[str, Any]:
+        """_generate_summary() for a flight that grew, merging the old summary with the new samples
+
+        `starts` gives each signal's sample count before it grew. Sections
+        whose source signal changed (e.g. position data appearing where GPS
+        was used) are computed from all samples of the new source.
+        """
+        previous = flight_data["summary"]
+        summary = {**previous,
+                   "message_stats": flight_data.get("message_types", {}),
+                   "total_messages": flight_data.get("total_messages", 0)}
+        telemetry = flight_data["telemetry"]
+        telemetry_summary = dict(previous.get("telemetry_summary", {}))
+
+        # Source signal of a section: the first non-empty one, before and after growing
+        def source(*names):
+            before = next((name for name in names if starts.get(name)), None)
+            after = next((name for name in names if len(telemetry[name])), None)
+            start = starts[after] if after is not None and after == before else 0
+            return after, start
+
+        position_name, position_start = source("position", "gps")
+        if position_name:
+            position_data = telemetry[position_name]
+            timestamps, altitudes = position_data["timestamp"], position_data["alt"]
+            summary["duration"] = float(timestamps[-1] - timestamps[0])
+            new_altitudes = altitudes[position_start:]
+            if len(new_altitudes):
+                summary["max_altitude"] = (max(previous["max_altitude"], float(new_altitudes.max()))
+                                           if position_start else float(new_altitudes.max()))
+
+        if len(telemetry["position"]) > starts["position"]:
+            position = telemetry["position"]
+            start = starts["position"]
+            speeds = np.sqrt(position["vx"][start:]**2 + position["vy"][start:]**2 + position["vz"][start:]**2)
+            summary["max_speed"] = max(previous["max_speed"], float(speeds.max())) if start else float(speeds.max())
+
+        battery_name, battery_start = source("system_status", "battery")
+        battery_data = telemetry[battery_name] if battery_name else None
+        if battery_data and "battery_remaining" in battery_data:
+            remaining = battery_data["battery_remaining"]
+            summary["battery_usage"] = int(remaining[0]) - int(remaining[-1])
+
+        summary["signal_counts"] = {name: len(signal) for name, signal in telemetry.items()}
+
+        gps_data = telemetry["gps"]
+        start = starts["gps"]
+        if len(gps_data) > start:
+            fix_types = gps_data["fix_type"][start:]
+            hdop = gps_data["hdop"][start:]
+            old = telemetry_summary.get("gps_patterns") if start else None
+            old_fixes = old["fix_type_distribution"] if old else {}
+            telemetry_summary["gps_patterns"] = {
+                "total_points": len(gps_data),
+                "fix_type_distribution": {
+                    label: old_fixes.get(label, 0) + int(np.count_nonzero(fix_types == fix))
+                    for label, fix in (("no_fix", 0), ("gps_fix", 3), ("dgps_fix", 4), ("rtk_fix", 5))
+                },
+                # HDOP readings are positive, so a 0..0 range means there were none
+                "hdop_range": _merge_range(old["hdop_range"] if old and old["hdop_range"]["max"] else None,
+                                           hdop[hdop > 0]),
+                "satellite_range": {"min": 0, "max": 0}
+            }
+
+        vibe_data = telemetry["vibration"]
+        start = starts["vibration"]
+        if len(vibe_data) > start:
+            old = telemetry_summary.get("vibration_patterns") if start else None
+            telemetry_summary["vibration_patterns"] = {
+                "total_readings": len(vibe_data),
+                **{f"{axis}_axis": _merge_range(old[f"{axis}_axis"] if old else None, vibe_data[f"vibe_{axis}"][start:])
+                   for axis in ("x", "y", "z")}
+            }
+
+        if battery_data and len(battery_data) > battery_start:
+            if "voltage_battery" in battery_data:
+                voltages, currents = battery_data["voltage_battery"], battery_data["current_battery"]
+            else:
+                voltages, currents = battery_data["voltage"], battery_data["current"]
+            new_voltages, new_currents = voltages[battery_start:], currents[battery_start:]
+            old = telemetry_summary.get("battery_patterns") if battery_start else None
+            # Only positive voltages and non-zero currents are counted, so a 0..0 range means there were none
+            old_voltage = old["voltage_range"] if old and old["voltage_range"]["max"] else None
+            old_current = old["current_range"] if old and old["current_range"] != {"min": 0, "max": 0} else None
+            telemetry_summary["battery_patterns"] = {
+                "total_readings": len(battery_data),
+                "voltage_trend": _voltage_trend(voltages),
+                "voltage_range": _merge_range(old_voltage, new_voltages[new_voltages > 0]),
+                "current_range": _merge_range(old_current, new_currents[new_currents != 0])
+            }
+
+        if position_name and len(telemetry[position_name]) > 1:
+            altitudes = telemetry[position_name]["alt"]
+            old = telemetry_summary.get("altitude_patterns") if position_start > 1 else None
+            # The first new change is the one from the last old sample
+            changes = np.diff(altitudes[max(position_start - 1, 0):])
+            if len(changes):
+                largest_climb, largest_descent = float(changes.max()), float(changes.min())
+                if old:
+                    largest_climb = max(old["largest_climb"], largest_climb)
+                    largest_descent = min(old["largest_descent"], largest_descent)
+                telemetry_summary["altitude_patterns"] = {
+                    "total_points": len(altitudes),
+                    "altitude_range": _merge_range(old["altitude_range"] if old else None,
+                                                   altitudes[position_start if old else 0:]),
+                    "largest_climb": largest_climb,
+                    "largest_descent": largest_descent,
+                    "altitude_profile": altitudes[::max(1, len(altitudes)//20)].tolist()
+                }
+
+        summary["telemetry_summary"] = telemetry_summary
+        # Events from before the append stay until the background analysis refreshes them
+        summary["anomaly_events_stale"] = True
+        summary["anomaly_analysis_status"] = "pending"
+        return summary
+
     def _prepare_telemetry_summary(self, flight_data: Dict[str, Any]) -> Dict[str, Any]:
         """Prepare telemetry data summary for LLM analysis without hardcoded rules"""
         telemetry_summary = {}
+        telemetry = flight_data["telemetry"]
         
         # GPS data patterns
-        gps_data = flight_data["telemetry"]["gps"]
+        gps_data = telemetry["gps"]
         if gps_data:
-            fix_types = [point.get("fix_type", 0) for point in gps_data]
-            hdop_values = [point.get("hdop", 0) for point in gps_data if point.get("hdop", 0) > 0]
-            satellite_counts = [point.get("satellites_visible", 0) for point in gps_data]
+            fix_types = gps_data["fix_type"]
+            hdop_values = gps_data["hdop"][gps_data["hdop"] > 0]
             
             telemetry_summary["gps_patterns"] = {
                 "total_points": len(gps_data),
                 "fix_type_distribution": {
-                    "no_fix": fix_types.count(0),
-                    "gps_fix": fix_types.count(3),
-                    "dgps_fix": fix_types.count(4),
-                    "rtk_fix": fix_types.count(5)
+                    "no_fix": int(np.count_nonzero(fix_types == 0)),
+                    "gps_fix": int(np.count_nonzero(fix_types == 3)),
+                    "dgps_fix": int(np.count_nonzero(fix_types == 4)),
+                    "rtk_fix": int(np.count_nonzero(fix_types == 5))
                 },
-                "hdop_range": {"min": min(hdop_values) if hdop_values else 0, "max": max(hdop_values) if hdop_values else 0},
-                "satellite_range": {"min": min(satellite_counts) if satellite_counts else 0, "max": max(satellite_counts) if satellite_counts else 0}
+                "hdop_range": _value_range(hdop_values),
+                # Satellite counts are not extracted from the log yet
+                "satellite_range": {"min": 0, "max": 0}
             }
         
         # Vibration patterns
-        vibe_data = flight_data["telemetry"]["vibration"]
+        vibe_data = telemetry["vibration"]
         if vibe_data:
-            vibe_x_values = [v.get("vibe_x", 0) for v in vibe_data]
-            vibe_y_values = [v.get("vibe_y", 0) for v in vibe_data]
-            vibe_z_values = [v.get("vibe_z", 0) for v in vibe_data]
-            
             telemetry_summary["vibration_patterns"] = {
                 "total_readings": len(vibe_data),
-                "x_axis": {"min": min(vibe_x_values) if vibe_x_values else 0, "max": max(vibe_x_values) if vibe_x_values else 0},
-                "y_axis": {"min": min(vibe_y_values) if vibe_y_values else 0, "max": max(vibe_y_values) if vibe_y_values else 0},
-                "z_axis": {"min": min(vibe_z_values) if vibe_z_values else 0, "max": max(vibe_z_values) if vibe_z_values else 0}
+                "x_axis": _value_range(vibe_data["vibe_x"]),
+                "y_axis": _value_range(vibe_data["vibe_y"]),
+                "z_axis": _value_range(vibe_data["vibe_z"])
             }
         
         # Battery voltage patterns
-        battery_data = flight_data["telemetry"]["system_status"] or flight_data["telemetry"]["battery"]
+        battery_data = telemetry["system_status"] or telemetry["battery"]
         if battery_data:
-            voltage_values = [b.get("voltage_battery", b.get("voltage", 0)) for b in battery_data if b.get("voltage_battery", b.get("voltage", 0)) > 0]
-            current_values = [b.get("current_battery", b.get("current", 0)) for b in battery_data if b.get("current_battery", b.get("current", 0)) != 0]
+            if "voltage_battery" in battery_data:
+                voltages, currents = battery_data["voltage_battery"], battery_data["current_battery"]
+            else:
+                voltages, currents = battery_data["voltage"], battery_data["current"]
+            voltage_values = voltages[voltages > 0]
+            current_values = currents[currents != 0]
             
             telemetry_summary["battery_patterns"] = {
                 "total_readings": len(battery_data),
-                "voltage_trend": voltage_values[:5] + voltage_values[-5:] if len(voltage_values) > 10 else voltage_values,
-                "voltage_range": {"min": min(voltage_values) if voltage_values else 0, "max": max(voltage_values) if voltage_values else 0},
-                "current_range": {"min": min(current_values) if current_values else 0, "max": max(current_values) if current_values else 0}
+                "voltage_trend": (np.concatenate((voltage_values[:5], voltage_values[-5:])) if len(voltage_values) > 10 else voltage_values).tolist(),
+                "voltage_range": _value_range(voltage_values),
+                "current_range": _value_range(current_values)
             }
         
         # Altitude and position patterns
-        position_data = flight_data["telemetry"]["position"] or flight_data["telemetry"]["gps"]
+        position_data = telemetry["position"] or telemetry["gps"]
         if position_data and len(position_data) > 1:
-            altitudes = [point.get("alt", 0) for point in position_data]
-            altitude_changes = [altitudes[i] - altitudes[i-1] for i in range(1, len(altitudes))]
+            altitudes = position_data["alt"]
+            altitude_changes = np.diff(altitudes)
             
             telemetry_summary["altitude_patterns"] = {
                 "total_points": len(position_data),
-                "altitude_range": {"min": min(altitudes) if altitudes else 0, "max": max(altitudes) if altitudes else 0},
-                "largest_climb": max(altitude_changes) if altitude_changes else 0,
-                "largest_descent": min(altitude_changes) if altitude_changes else 0,
-                "altitude_profile": altitudes[::max(1, len(altitudes)//20)]  # Sample 20 points
+                "altitude_range": _value_range(altitudes),
+                "largest_climb": float(altitude_changes.max()),
+                "largest_descent": float(altitude_changes.min()),
+                "altitude_profile": altitudes[::max(1, len(altitudes)//20)].tolist()  # Sample 20 points
             }
         
+        # Events found by the local detectors over the full-resolution arrays
+        with span("anomaly_detection"):
+            telemetry_summary["anomaly_events"] = detect_anomalies(telemetry)
+        
         return telemetry_summary
     
-    def _analyze_anomalies_with_llm(self, telemetry_summary: Dict[str, Any]) -> Dict[str, Any]:
-        """Analyze anomalies using LLM for proactive detection"""
+    async def analyze_anomalies(self, telemetry_summary: Dict[str, Any], provider=None) -> Dict[str, Any]:
+        """Anomaly analysis of a telemetry summary through an (ideally shared) LLM provider"""
         try:
-            # Import here to avoid circular import
-            from chat_service import ChatService
-            
-            chat_service = ChatService()
-            
-            # Create a focused prompt for anomaly detection
-            anomaly_prompt = self._build_anomaly_detection_prompt(telemetry_summary)
-            
             # Get LLM analysis if available
-            if chat_service.openai_client:
-                response = chat_service.openai_client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": "You are an expert UAV flight data analyst. Analyze the provided telemetry patterns and identify potential anomalies with reasoning."},
-                        {"role": "user", "content": anomaly_prompt}
-                    ],
-                    max_tokens=500,
-                    temperature=0.3
-                )
-                analysis_result = response.choices[0].message.content
-            elif chat_service.anthropic_client:
-                response = chat_service.anthropic_client.messages.create(
-                    model="claude-3-sonnet-20240229",
-                    max_tokens=500,
-                    system="You are an expert UAV flight data analyst. Analyze the provided telemetry patterns and identify potential anomalies with reasoning.",
-                    messages=[
-                        {"role": "user", "content": anomaly_prompt}
-                    ]
-                )
-                analysis_result = response.content[0].text
+            if provider:
+                with span("anomaly_llm"):
+                    analysis_result = await provider.complete(
+                        "You are an expert UAV flight data analyst. Analyze the provided telemetry patterns and identify potential anomalies with reasoning.",
+                        self._build_anomaly_detection_prompt(telemetry_summary),
+                        max_tokens=500,
+                        temperature=0.3
+                    )
             else:
                 # Fallback analysis without LLM
                 analysis_result = self._fallback_anomaly_analysis(telemetry_summary)
@@ -395,7 +682,10 @@ Telemetry Data:
         # Add each telemetry section with clear formatting
         for section_name, section_data in telemetry_summary.items():
             prompt += f"\n{section_name.replace('_', ' ').title()}:\n"
-            if isinstance(section_data, dict):
+            if section_name == "anomaly_events":
+                prompt += "Detected by local analysis of the full-resolution telemetry (T+ is seconds after log start):\n"
+                prompt += format_anomaly_events(section_data) + "\n"
+            elif isinstance(section_data, dict):
                 for key, value in section_data.items():
                     prompt += f"  - {key}: {value}\n"
             else:
@@ -416,7 +706,26 @@ RECOMMENDATIONS: [Specific actions to take]
         analysis = "ANOMALIES: "
         anomalies = []
         
-        # Basic pattern-based analysis (not hardcoded rules, but pattern recognition)
+        # Events from the local detectors, when the summary has them
+        detected = telemetry_summary.get("anomaly_events")
+        if detected is not None:
+            labels = anomaly_labels(detected)
+            if not labels:
+                return analysis + "None detected\nSEVERITY: Low\nREASONING: Local detectors found no events\nRECOMMENDATIONS: Flight appears normal"
+            # The worst event of each type
+            worst = {}
+            for event in most_severe(detected):
+                worst.setdefault(event["type"], event)
+            reasoning = "; ".join(
+                f"{event['description']} at T+{event['offset']:.1f}s for {event['duration']:.1f}s"
+                for event in worst.values()
+            )
+            recommendations = ", ".join(EVENT_RECOMMENDATIONS[event_type] for event_type in detected["counts"]
+                                        if event_type in EVENT_RECOMMENDATIONS)
+            return (f"{analysis}{', '.join(labels)}\nSEVERITY: {highest_severity(detected).title()}\n"
+                    f"REASONING: {reasoning}\nRECOMMENDATIONS: {recommendations}")
+        
+        # Basic pattern-based analysis for summaries made before the detectors existed
         if "gps_patterns" in telemetry_summary:
             gps = telemetry_summary["gps_patterns"]
             if gps.get("fix_type_distribution", {}).get("no_fix", 0) > 0:
@@ -514,19 +823,18 @@ RECOMMENDATIONS: [Specific actions to take]
                 "raw_analysis": analysis_result
             }
 
+    def add_flight(self, flight_data: Dict[str, Any]):
+        """Register an analyzed flight (e.g. one parsed in a worker process)"""
+        self.repository.add(flight_data)
+
     def get_flight_list(self) -> List[Dict[str, Any]]:
         """Get list of all flights"""
-        return [
-            {
-                "flight_id": flight_id,
-                "summary": data["summary"]
-            }
-            for flight_id, data in self.flights.items()
-        ]
+        return self.repository.list_flights()
 
     def get_flight_details(self, flight_id: str) -> Dict[str, Any]:
         """Get detailed flight information"""
-        if flight_id not in self.flights:
+        flight_data = self.repository.get(flight_id)
+        if flight_data is None:
             raise Exception(f"Flight {flight_id} not found")
 
-        return self.flights[flight_id]
+        return flight_data
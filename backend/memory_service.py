@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 from dataclasses import dataclass, asdict
 import uuid
+from config import Config
 
 @dataclass
 class ConversationTurn:
@@ -29,8 +30,23 @@ class FlightSession:
     anomalies_explored: List[str]
 
 class AgentMemory:
+    """Conversation memory persisted as a snapshot plus an append-only journal.
+
+    Each chat turn appends one JSON line to the journal; the journal is
+    folded into the snapshot file every Config.MEMORY_COMPACT_EVERY turns.
+    Journal entries are numbered and the snapshot records the last one it
+    includes, so entries left behind by an interrupted compaction are not
+    replayed twice.
+    Turns keep a reference to their flight and a small metrics snapshot
+    rather than the flight's telemetry.
+    """
+
     def __init__(self):
         self.memory_file = "agent_memory.json"
+        self.journal_file = "agent_memory.journal"
+        self.journal_entries = 0
+        # Number of the last journal entry written (or folded into the snapshot)
+        self.journal_seq = 0
         self.flight_sessions: Dict[str, FlightSession] = {}
         self.user_profile = {
             "preferred_analysis_depth": "detailed",
@@ -42,7 +58,7 @@ class AgentMemory:
         self.load_memory()
     
     def load_memory(self):
-        """Load conversation memory from file"""
+        """Load the memory snapshot, then replay turns journaled since it was written"""
         if os.path.exists(self.memory_file):
             try:
                 with open(self.memory_file, 'r') as f:
@@ -63,33 +79,44 @@ class AgentMemory:
                     
                     # Reconstruct conversation turns
                     for turn_data in session_data.get("conversation_turns", []):
-                        turn = ConversationTurn(
-                            id=turn_data["id"],
-                            timestamp=datetime.fromisoformat(turn_data["timestamp"]),
-                            user_message=turn_data["user_message"],
-                            assistant_response=turn_data["assistant_response"],
-                            flight_id=turn_data["flight_id"],
-                            context=turn_data.get("context", {}),
-                            topic=turn_data.get("topic", "general"),
-                            sentiment=turn_data.get("sentiment", "neutral"),
-                            follow_up_suggested=turn_data.get("follow_up_suggested", False)
-                        )
-                        session.conversation_turns.append(turn)
+                        session.conversation_turns.append(self._turn_from_dict(turn_data))
                     
                     self.flight_sessions[session.flight_id] = session
                 
                 # Load user profile
                 self.user_profile.update(data.get("user_profile", {}))
+                self.journal_seq = data.get("journal_seq", 0)
                 
             except Exception as e:
                 print(f"Error loading memory: {e}")
+
+        if os.path.exists(self.journal_file):
+            try:
+                with open(self.journal_file, 'r') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # A partially written last line from an interrupted append
+                            continue
+                        if entry.get("seq", 0) <= self.journal_seq:
+                            # Already in the snapshot
+                            continue
+                        self.journal_seq = entry["seq"]
+                        if entry.get("type") == "turn":
+                            self._apply_turn(self._turn_from_dict(entry["turn"]))
+                            self.journal_entries += 1
+            except Exception as e:
+                print(f"Error replaying memory journal: {e}")
     
     def save_memory(self):
-        """Save conversation memory to file"""
+        """Write a full snapshot of memory and truncate the journal (compaction)"""
         try:
             data = {
                 "flight_sessions": [],
                 "user_profile": self.user_profile,
+                # Journal entries up to this one are included
+                "journal_seq": self.journal_seq,
                 "last_updated": datetime.now().isoformat()
             }
             
@@ -103,53 +130,80 @@ class AgentMemory:
                     "insights_shared": session.insights_shared,
                     "user_interests": session.user_interests,
                     "anomalies_explored": session.anomalies_explored,
-                    "conversation_turns": []
+                    "conversation_turns": [self._turn_to_dict(turn) for turn in session.conversation_turns]
                 }
-                
-                # Convert conversation turns
-                for turn in session.conversation_turns:
-                    turn_data = {
-                        "id": turn.id,
-                        "timestamp": turn.timestamp.isoformat(),
-                        "user_message": turn.user_message,
-                        "assistant_response": turn.assistant_response,
-                        "flight_id": turn.flight_id,
-                        "context": turn.context,
-                        "topic": turn.topic,
-                        "sentiment": turn.sentiment,
-                        "follow_up_suggested": turn.follow_up_suggested
-                    }
-                    session_data["conversation_turns"].append(turn_data)
-                
                 data["flight_sessions"].append(session_data)
             
-            with open(self.memory_file, 'w') as f:
+            tmp_file = f"{self.memory_file}.tmp"
+            with open(tmp_file, 'w') as f:
                 json.dump(data, f, indent=2)
+            os.replace(tmp_file, self.memory_file)
+
+            # Everything in the journal is now part of the snapshot; if this is
+            # interrupted, load_memory() skips the entries by their numbers
+            open(self.journal_file, 'w').close()
+            self.journal_entries = 0
                 
         except Exception as e:
             print(f"Error saving memory: {e}")
+
+    def _append_journal(self, entry: Dict[str, Any]):
+        """Append one entry to the journal, compacting when it gets long"""
+        entry = {"seq": self.journal_seq + 1, **entry}
+        try:
+            with open(self.journal_file, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+            self.journal_seq = entry["seq"]
+            self.journal_entries += 1
+        except Exception as e:
+            print(f"Error writing memory journal: {e}")
+            return
+
+        if self.journal_entries >= Config.MEMORY_COMPACT_EVERY:
+            self.save_memory()
+
+    def _turn_to_dict(self, turn: ConversationTurn) -> Dict[str, Any]:
+        return {
+            "id": turn.id,
+            "timestamp": turn.timestamp.isoformat(),
+            "user_message": turn.user_message,
+            "assistant_response": turn.assistant_response,
+            "flight_id": turn.flight_id,
+            "context": turn.context,
+            "topic": turn.topic,
+            "sentiment": turn.sentiment,
+            "follow_up_suggested": turn.follow_up_suggested
+        }
+
+    def _turn_from_dict(self, turn_data: Dict[str, Any]) -> ConversationTurn:
+        context = turn_data.get("context", {})
+        if context.get("flight_data") is not None:
+            # Older turns embedded the whole flight; keep only its metrics
+            context = {"metrics": self._extract_flight_metrics(context["flight_data"])}
+        return ConversationTurn(
+            id=turn_data["id"],
+            timestamp=datetime.fromisoformat(turn_data["timestamp"]),
+            user_message=turn_data["user_message"],
+            assistant_response=turn_data["assistant_response"],
+            flight_id=turn_data["flight_id"],
+            context=context,
+            topic=turn_data.get("topic", "general"),
+            sentiment=turn_data.get("sentiment", "neutral"),
+            follow_up_suggested=turn_data.get("follow_up_suggested", False)
+        )
     
     def add_conversation_turn(self, user_message: str, assistant_response: str, 
-                           flight_id: str, context: Dict[str, Any] = None):
-        """Add a new conversation turn to memory"""
-        if flight_id not in self.flight_sessions:
-            self.flight_sessions[flight_id] = FlightSession(
-                flight_id=flight_id,
-                start_time=datetime.now(),
-                last_activity=datetime.now(),
-                conversation_turns=[],
-                topics_discussed=[],
-                insights_shared=[],
-                user_interests=[],
-                anomalies_explored=[]
-            )
-        
-        session = self.flight_sessions[flight_id]
-        
-        # Analyze topic and sentiment
-        topic = self._analyze_topic(user_message)
-        sentiment = self._analyze_sentiment(user_message)
-        
+                           flight_id: str, context: Dict[str, Any] = None,
+                           flight_data: Dict[str, Any] = None):
+        """Add a new conversation turn to memory
+
+        When flight_data is given, the turn records a compact metrics
+        snapshot of the flight (not its telemetry) under context["metrics"].
+        """
+        context = dict(context or {})
+        if flight_data:
+            context["metrics"] = self._extract_flight_metrics(flight_data)
+
         # Create conversation turn
         turn = ConversationTurn(
             id=str(uuid.uuid4()),
@@ -157,23 +211,39 @@ class AgentMemory:
             user_message=user_message,
             assistant_response=assistant_response,
             flight_id=flight_id,
-            context=context or {},
-            topic=topic,
-            sentiment=sentiment
+            context=context,
+            topic=self._analyze_topic(user_message),
+            sentiment=self._analyze_sentiment(user_message)
         )
+        self._apply_turn(turn)
+
+        # Persist just this turn
+        self._append_journal({"type": "turn", "turn": self._turn_to_dict(turn)})
+
+    def _apply_turn(self, turn: ConversationTurn):
+        """Fold a turn into its flight session and the user profile"""
+        if turn.flight_id not in self.flight_sessions:
+            self.flight_sessions[turn.flight_id] = FlightSession(
+                flight_id=turn.flight_id,
+                start_time=turn.timestamp,
+                last_activity=turn.timestamp,
+                conversation_turns=[],
+                topics_discussed=[],
+                insights_shared=[],
+                user_interests=[],
+                anomalies_explored=[]
+            )
         
+        session = self.flight_sessions[turn.flight_id]
         session.conversation_turns.append(turn)
-        session.last_activity = datetime.now()
+        session.last_activity = turn.timestamp
         
         # Update session insights
-        if topic not in session.topics_discussed:
-            session.topics_discussed.append(topic)
+        if turn.topic not in session.topics_discussed:
+            session.topics_discussed.append(turn.topic)
         
         # Update user profile
-        self._update_user_profile(topic, sentiment)
-        
-        # Save memory
-        self.save_memory()
+        self._update_user_profile(turn.topic, turn.sentiment)
     
     def get_conversation_context(self, flight_id: str, recent_turns: int = 5) -> str:
         """Get recent conversation context for the flight"""
@@ -238,13 +308,11 @@ class AgentMemory:
         previous_metrics = []
         for session_id, session in self.flight_sessions.items():
             if session_id != current_flight_id and session.conversation_turns:
-                # Extract metrics from conversation context
+                # Use the metrics snapshot stored with the flight's turns
                 for turn in session.conversation_turns:
-                    if "altitude" in turn.context:
-                        prev_metrics = self._extract_flight_metrics(turn.context)
-                        if prev_metrics:
-                            previous_metrics.append(prev_metrics)
-                            break
+                    if turn.context.get("metrics"):
+                        previous_metrics.append(turn.context["metrics"])
+                        break
         
         if not previous_metrics:
             return ""
@@ -0,0 +1,481 @@
+import os
+import sys
+import threading
+import time
+import numpy as np
+from collections import Counter as StackCounter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Any, Optional, Tuple, Iterator
+from config import Config
+
+# Default histogram buckets (seconds), from sub-millisecond stages to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise Exception(f"Metric {self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonic per-label-set total"""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self.values)
+
+    def merge(self, values: Dict[Tuple[str, ...], float]):
+        with self._lock:
+            for key, value in values.items():
+                self.values[key] = self.values.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self.values.clear()
+
+
+class Gauge(_Metric):
+    """Current value, either set directly or read from a callback at render time"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), callback=None):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        # Returns {label values tuple: value}, or a number for unlabelled gauges
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                print(f"Error collecting metric {self.name}: {e}")
+                values = {}
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self.values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        return {}
+
+    def merge(self, values: Dict[Tuple[str, ...], float]):
+        pass
+
+    def reset(self):
+        with self._lock:
+            self.values.clear()
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram per label set, as Prometheus expects"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (non-cumulative, last is +Inf), sum, count]
+        self.values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = f'le="{_format_value(float(bound))}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+    def snapshot(self) -> Dict[Tuple[str, ...], List[Any]]:
+        with self._lock:
+            return {key: [list(counts), total, count] for key, (counts, total, count) in self.values.items()}
+
+    def merge(self, values: Dict[Tuple[str, ...], List[Any]]):
+        with self._lock:
+            for key, (counts, total, count) in values.items():
+                entry = self.values.get(key)
+                if entry is None:
+                    entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+
+    def reset(self):
+        with self._lock:
+            self.values.clear()
+
+
+class Summary(_Metric):
+    """Quantiles over a rolling window of observations, plus all-time sum and count.
+
+    Observations older than window_seconds are dropped, and at most
+    max_samples are kept per label set, so memory stays bounded.
+    """
+    kind = "summary"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 quantiles: Tuple[float, ...] = (0.5, 0.95, 0.99), window_seconds: float = None,
+                 max_samples: int = None):
+        super().__init__(name, help_text, labels)
+        self.quantiles = quantiles
+        self.window_seconds = window_seconds or Config.METRICS_WINDOW_SECONDS
+        self.max_samples = max_samples or Config.METRICS_WINDOW_SAMPLES
+        # label values -> [deque of (time, value), sum, count]
+        self.values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [deque(maxlen=self.max_samples), 0.0, 0]
+            entry[0].append((time.monotonic(), value))
+            entry[1] += value
+            entry[2] += 1
+
+    def quantile_values(self, **labels) -> Dict[float, Optional[float]]:
+        """Current windowed quantiles of one label set (None when the window is empty)"""
+        with self._lock:
+            entry = self.values.get(self._key(labels))
+            samples = self._window(entry[0]) if entry else []
+        return self._quantiles(samples)
+
+    def _window(self, samples: deque) -> List[float]:
+        cutoff = time.monotonic() - self.window_seconds
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return [value for _, value in samples]
+
+    def _quantiles(self, samples: List[float]) -> Dict[float, Optional[float]]:
+        if not samples:
+            return {q: None for q in self.quantiles}
+        return dict(zip(self.quantiles, np.quantile(samples, self.quantiles).tolist()))
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            entries = [(key, self._window(samples), total, count)
+                       for key, (samples, total, count) in sorted(self.values.items())]
+        for key, samples, total, count in entries:
+            for q, value in self._quantiles(samples).items():
+                quantile = f'quantile="{q}"'
+                rendered = "NaN" if value is None else _format_value(value)
+                lines.append(f"{self.name}{_format_labels(self.labels, key, quantile)} {rendered}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+    def snapshot(self) -> Dict[Tuple[str, ...], List[Any]]:
+        with self._lock:
+            return {key: [list(samples), total, count] for key, (samples, total, count) in self.values.items()}
+
+    def merge(self, values: Dict[Tuple[str, ...], List[Any]]):
+        # Samples keep their own monotonic timestamps, which are only
+        # comparable within one machine; good enough for worker processes
+        with self._lock:
+            for key, (samples, total, count) in values.items():
+                entry = self.values.get(key)
+                if entry is None:
+                    entry = self.values[key] = [deque(maxlen=self.max_samples), 0.0, 0]
+                entry[0].extend(samples)
+                entry[1] += total
+                entry[2] += count
+
+    def reset(self):
+        with self._lock:
+            self.values.clear()
+
+
+class MetricsRegistry:
+    """Named metrics rendered together in the Prometheus text format.
+
+    Worker processes have their own registry; they send snapshot() back
+    with their result and the server merge()s it, so counters and
+    histograms cover work done in any process.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...] = (), callback=None) -> Gauge:
+        return self._register(Gauge(name, help_text, labels, callback))
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def summary(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Summary:
+        return self._register(Summary(name, help_text, labels))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def merge(self, snapshot: Dict[str, Any]):
+        for name, values in snapshot.items():
+            metric = self.metrics.get(name)
+            if metric is not None:
+                metric.merge(values)
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+
+registry = MetricsRegistry()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = registry.histogram(
+    "uav_stage_duration_seconds", "Wall time of upload pipeline stages", ("stage",))
+DECODE_MESSAGES = registry.counter(
+    "uav_decode_messages_total", "Log messages read, by message type", ("type",))
+DECODE_SECONDS = registry.counter(
+    "uav_decode_seconds_total", "Time spent decoding messages, by message type", ("type",))
+
+CHAT_PHASE_SECONDS = registry.summary(
+    "uav_chat_phase_seconds", "Wall time of chat request phases (rolling window quantiles)", ("phase",))
+CHAT_REQUESTS = registry.counter(
+    "uav_chat_requests_total", "Chat answers by where they came from (cache, provider, fallback, provider_error, error)", ("source",))
+LLM_REQUESTS = registry.counter(
+    "uav_llm_requests_total", "LLM provider calls by outcome", ("provider", "model", "outcome"))
+LLM_SECONDS = registry.summary(
+    "uav_llm_request_seconds", "LLM provider round trip time (rolling window quantiles)", ("provider", "model"))
+LLM_TOKENS = registry.counter(
+    "uav_llm_tokens_total", "LLM tokens by kind (input, output, cache_read, cache_write)",
+    ("provider", "model", "kind"))
+LLM_COST = registry.counter(
+    "uav_llm_cost_usd_total", "Estimated LLM spend from Config.LLM_PRICING", ("provider", "model"))
+
+LIVE_MESSAGES = registry.counter(
+    "uav_live_messages_total", "Live MAVLink messages ingested, by message type", ("type",))
+LIVE_VEHICLES = registry.gauge(
+    "uav_live_vehicles", "Vehicles with a live telemetry window in memory")
+LIVE_SUBSCRIBERS = registry.gauge(
+    "uav_live_subscribers", "Open live telemetry WebSocket subscriptions")
+LIVE_BATCHES = registry.counter(
+    "uav_live_batches_total", "Live telemetry batches sent to WebSocket subscribers")
+
+# Stage timings of the current request or job: {stage: seconds}
+_current_trace: ContextVar[Optional[Dict[str, float]]] = ContextVar("metrics_trace", default=None)
+
+
+def observe_stage(stage: str, seconds: float):
+    """Record a stage duration in the histogram and the current trace, if any"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _current_trace.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a block as one pipeline stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def trace(timings: Optional[Dict[str, float]] = None) -> Iterator[Dict[str, float]]:
+    """Collect the stages timed within the block (and tasks or threads started from it)"""
+    timings = {} if timings is None else timings
+    token = _current_trace.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_trace.reset(token)
+
+
+def record_trace(timings: Dict[str, float]):
+    """Add stage timings measured elsewhere (e.g. in a worker) to the current trace"""
+    current = _current_trace.get()
+    if current is not None:
+        for stage, seconds in timings.items():
+            current[stage] = current.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def chat_phase(phase: str, timings: Dict[str, float]) -> Iterator[None]:
+    """Time one phase of a chat request, adding it to the request's timings"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        CHAT_PHASE_SECONDS.observe(seconds, phase=phase)
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+def record_llm_call(provider: str, model: str, seconds: float, outcome: str, usage: Dict[str, int]):
+    """Latency, outcome, token counts and estimated cost of one provider call"""
+    LLM_REQUESTS.inc(provider=provider, model=model, outcome=outcome)
+    LLM_SECONDS.observe(seconds, provider=provider, model=model)
+    for kind, tokens in usage.items():
+        if tokens:
+            LLM_TOKENS.inc(tokens, provider=provider, model=model, kind=kind)
+    prices = Config.LLM_PRICING.get(model)
+    if prices:
+        cost = sum(tokens * prices.get(kind, 0.0) for kind, tokens in usage.items() if tokens) / 1e6
+        LLM_COST.inc(cost, provider=provider, model=model)
+
+
+def record_decode(message_types: Dict[str, int], decode_seconds: Dict[str, float]):
+    """Per-message-type counts and decode times of one parse"""
+    for msg_type, count in message_types.items():
+        DECODE_MESSAGES.inc(count, type=msg_type)
+    for msg_type, seconds in decode_seconds.items():
+        DECODE_SECONDS.inc(seconds, type=msg_type)
+
+
+class StackSampler:
+    """Sampling profiler producing folded stacks (flamegraph.pl / speedscope input).
+
+    sample() polls the calling thread's Python stack from a background
+    thread every `interval` seconds while the block runs, so the profiled
+    code pays nothing per call. Each line of folded() is
+    "outer;...;inner count".
+    """
+
+    def __init__(self, interval: float = None):
+        self.interval = interval or Config.PROFILE_INTERVAL
+        self.counts: StackCounter = StackCounter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self, thread_id: int, stop: threading.Event):
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                with self._lock:
+                    self.counts[";".join(reversed(stack))] += 1
+
+    @contextmanager
+    def sample(self) -> Iterator["StackSampler"]:
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(threading.get_ident(), stop), daemon=True)
+        sampler.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            sampler.join()
+
+    def run(self, function, *args, **kwargs):
+        """Call function while sampling it (for use with asyncio.to_thread)"""
+        with self.sample():
+            return function(*args, **kwargs)
+
+    def merge(self, counts: Dict[str, int]):
+        with self._lock:
+            self.counts.update(counts)
+
+    def folded(self) -> str:
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
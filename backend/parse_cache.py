@@ -0,0 +1,81 @@
+import json
+import os
+import threading
+from typing import Dict, Any, Optional
+from config import Config
+
+
+class ParseCache:
+    """Content-addressed on-disk index of parsed flights.
+
+    Entries are keyed by the SHA-256 of the uploaded log. Each entry is a
+    <hash>.json file holding the flight id, summary and anomaly analysis
+    of the flight parsed from that log; the telemetry is not copied here,
+    it stays with the stored flight, so an entry is only usable while that
+    flight exists. The cache is bounded by total size; the least recently
+    used entries are evicted first (file modification time doubles as the
+    last-access time).
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None):
+        self.cache_dir = cache_dir or Config.PARSE_CACHE_DIR
+        self.max_bytes = Config.PARSE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{content_hash}.json")
+
+    def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Return the cached flight metadata for a log hash, or None on a miss"""
+        path = self._path(content_hash)
+        with self._lock:
+            if not os.path.exists(path):
+                return None
+            try:
+                with open(path, 'r') as f:
+                    metadata = json.load(f)
+            except Exception as e:
+                print(f"Error reading parse cache entry {content_hash}: {e}")
+                return None
+            # Mark as recently used
+            os.utime(path)
+        return metadata
+
+    def put(self, content_hash: str, flight_data: Dict[str, Any]):
+        """Record the flight parsed from a log (telemetry is left out), then evict down to the size budget"""
+        path = self._path(content_hash)
+        metadata = {key: value for key, value in flight_data.items() if key != "telemetry"}
+        with self._lock:
+            try:
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(metadata, f, default=str)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"Error writing parse cache entry {content_hash}: {e}")
+                return
+            self._evict()
+
+    def remove(self, content_hash: str):
+        """Drop an entry, e.g. once its flight no longer matches that log"""
+        path = self._path(content_hash)
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
@@ -0,0 +1,181 @@
+import asyncio
+import multiprocessing
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Optional
+from config import Config
+import metrics
+from dataflash_decoder import ParseCancelledError
+
+
+class ParsePoolFullError(Exception):
+    """Raised when the parse queue is already at capacity"""
+
+
+def _parse_in_worker(cancel_event, progress, file_path: str, engine: Optional[str],
+                     summarize: bool, profile: bool = False) -> Dict[str, Any]:
+    """Entry point executed inside a worker process
+
+    Returns the flight data together with the metrics and stage timings
+    recorded while parsing (and folded stacks when profiling), since the
+    worker's metrics registry is not the server's.
+    """
+    from mavlink_parser import MAVLinkParser
+
+    # Workers are reused, so only report this job's metrics
+    metrics.registry.reset()
+    sampler = metrics.StackSampler() if profile else None
+    # A throwaway parser: the flight is registered by the parent process
+    parser = MAVLinkParser()
+    with metrics.trace() as timings, metrics.span("parse_worker"):
+        if sampler is not None:
+            with sampler.sample():
+                flight_data = parser.parse_bin_file(file_path, engine=engine, cancel_event=cancel_event,
+                                                    progress=progress, summarize=summarize)
+        else:
+            flight_data = parser.parse_bin_file(file_path, engine=engine, cancel_event=cancel_event,
+                                                progress=progress, summarize=summarize)
+    return {
+        "flight_data": flight_data,
+        "metrics": metrics.registry.snapshot(),
+        "timings": timings,
+        "profile": dict(sampler.counts) if sampler is not None else None,
+    }
+
+
+def _decode_appended_in_worker(cancel_event, progress, file_path: str, parse_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker entry point for decoding the records appended to a log (see MAVLinkParser.decode_appended)"""
+    from mavlink_parser import MAVLinkParser
+
+    metrics.registry.reset()
+    with metrics.trace() as timings, metrics.span("parse_worker"):
+        appended = MAVLinkParser().decode_appended(file_path, parse_state, cancel_event=cancel_event,
+                                                   progress=progress)
+    return {
+        "flight_data": appended,
+        "metrics": metrics.registry.snapshot(),
+        "timings": timings,
+        "profile": None,
+    }
+
+
+class ParseWorkerPool:
+    """Runs log parsing in separate processes so the event loop stays free.
+
+    At most max_workers parses run at once and up to max_queue more may
+    wait; further submissions are rejected with ParsePoolFullError. Each job
+    gets a cancel event that the parser polls, so queued and running jobs
+    can both be cancelled.
+    """
+
+    def __init__(self, max_workers: int = None, max_queue: int = None, engine: str = None):
+        self.max_workers = max_workers or Config.PARSE_WORKERS
+        self.max_queue = Config.PARSE_QUEUE_SIZE if max_queue is None else max_queue
+        self.engine = engine
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._executor is None:
+            # spawn avoids forking the server process with its threads and sockets
+            context = multiprocessing.get_context("spawn")
+            self._manager = context.Manager()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+
+    @property
+    def pending_jobs(self) -> int:
+        return len(self._jobs)
+
+    @property
+    def is_full(self) -> bool:
+        return len(self._jobs) >= self.max_workers + self.max_queue
+
+    async def parse(self, file_path: str, job_id: str = None, track_progress: bool = False,
+                    summarize: bool = True, sampler: "metrics.StackSampler" = None) -> Dict[str, Any]:
+        """Parse a log in the pool and return its flight data
+
+        With track_progress=True the worker reports decode progress, which
+        can be read with get_progress(job_id) while the parse is running.
+        The worker's metrics are merged into the server's registry and its
+        stage timings into the current trace; with a sampler, the worker's
+        stacks are sampled as well and added to it.
+        """
+        job_id = self._submit(job_id, track_progress, _parse_in_worker, file_path, self.engine,
+                              summarize, sampler is not None)
+        return await self._collect(job_id, sampler)
+
+    async def decode_appended(self, file_path: str, parse_state: Dict[str, Any], job_id: str = None,
+                              track_progress: bool = False) -> Dict[str, Any]:
+        """Decode the records written to a log since parse_state (see MAVLinkParser.decode_appended)"""
+        job_id = self._submit(job_id, track_progress, _decode_appended_in_worker, file_path, parse_state)
+        return await self._collect(job_id)
+
+    def _submit(self, job_id: Optional[str], track_progress: bool, worker, *args) -> str:
+        """Queue worker(cancel_event, progress, *args) unless the pool is full; returns the job id"""
+        job_id = job_id or str(uuid.uuid4())
+        with self._lock:
+            if self.is_full:
+                raise ParsePoolFullError("Too many uploads are being processed - please retry shortly")
+            self._ensure_started()
+            cancel_event = self._manager.Event()
+            progress = self._manager.dict() if track_progress else None
+            future = self._executor.submit(worker, cancel_event, progress, *args)
+            self._jobs[job_id] = {"future": future, "cancel_event": cancel_event, "progress": progress}
+        return job_id
+
+    async def _collect(self, job_id: str, sampler: "metrics.StackSampler" = None) -> Dict[str, Any]:
+        """Wait for a job's worker, merging its metrics, timings and stack samples into this process"""
+        future = self._jobs[job_id]["future"]
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # The awaiting request went away; stop the worker as well
+            self.cancel(job_id)
+            raise
+        finally:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+
+        metrics.registry.merge(result["metrics"])
+        metrics.record_trace(result["timings"])
+        if sampler is not None and result["profile"]:
+            sampler.merge(result["profile"])
+        return result["flight_data"]
+
+    def get_progress(self, job_id: str) -> Dict[str, Any]:
+        """Latest progress reported by a running parse, empty if none"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job["progress"] is None:
+            return {}
+        try:
+            return job["progress"].copy()
+        except (EOFError, OSError):
+            # The manager is shutting down
+            return {}
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running parse; returns False for unknown jobs"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            if not job["future"].cancel():
+                # Already running: ask the worker to stop at its next check
+                job["cancel_event"].set()
+            return True
+
+    def shutdown(self):
+        with self._lock:
+            for job in self._jobs.values():
+                job["future"].cancel()
+                job["cancel_event"].set()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
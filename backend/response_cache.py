@@ -0,0 +1,115 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, FrozenSet
+from config import Config
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", question.lower()).split())
+
+
+# Filler words ignored by near-duplicate matching. Negations are deliberately
+# absent so "was there GPS loss" and "was there no GPS loss" stay apart.
+STOPWORDS = frozenset(
+    "a an the any some there was were is are be been did do does can could would "
+    "please me my i you your us we tell show give about of for in on at to this that "
+    "it its during flight".split()
+)
+
+
+def _trigrams(normalized: str) -> FrozenSet[str]:
+    """Character trigrams of a question's content words"""
+    words = [word for word in normalized.split() if word not in STOPWORDS] or normalized.split()
+    padded = f"  {' '.join(words)} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class ResponseCache:
+    """Cache of chat answers keyed by flight id and normalized question.
+
+    Entries expire after `ttl` seconds and the least recently used entry is
+    dropped once `max_entries` is reached. When no entry matches exactly,
+    questions about the same flight whose content words (stopwords removed)
+    have a character-trigram Jaccard similarity of at least `similarity`
+    count as a hit; similarity=1 disables near-duplicate matching.
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None, similarity: float = None):
+        self.max_entries = max_entries or Config.RESPONSE_CACHE_SIZE
+        self.ttl = Config.RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.similarity = Config.RESPONSE_CACHE_SIMILARITY if similarity is None else similarity
+        # (flight id, normalized question) -> (answer, trigrams, expiry), least recently used first
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, FrozenSet[str], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def get(self, flight_id: Optional[str], question: str) -> Optional[str]:
+        """Return a cached answer for this question about this flight, if any"""
+        normalized = normalize_question(question)
+        key = (flight_id or "", normalized)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+
+            if self.similarity < 1:
+                match = self._find_similar(key[0], _trigrams(normalized), now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.near_hits += 1
+                    return self._entries[match][0]
+
+            self.misses += 1
+            return None
+
+    def put(self, flight_id: Optional[str], question: str, answer: str):
+        normalized = normalize_question(question)
+        key = (flight_id or "", normalized)
+        with self._lock:
+            self._entries[key] = (answer, _trigrams(normalized), time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, flight_id: str):
+        """Forget every answer about one flight"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == flight_id]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+            }
+
+    def _find_similar(self, flight_key: str, grams: FrozenSet[str], now: float) -> Optional[Tuple[str, str]]:
+        """Most similar live entry for the same flight above the threshold"""
+        best_key, best_score = None, self.similarity
+        expired = []
+        for key, (_, entry_grams, expires_at) in self._entries.items():
+            if key[0] != flight_key:
+                continue
+            if expires_at <= now:
+                expired.append(key)
+                continue
+            score = len(grams & entry_grams) / len(grams | entry_grams)
+            if score >= best_score:
+                best_key, best_score = key, score
+        for key in expired:
+            del self._entries[key]
+        return best_key
@@ -0,0 +1,153 @@
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+# Samples per bucket at the finest pyramid level; windows with fewer samples
+# than this many per output point are answered from the raw arrays
+PYRAMID_BASE_BUCKET = 32
+LEVEL_STATS = ("min", "max", "sum", "min_first")
+
+
+class FieldPyramid:
+    """Level-of-detail pyramid of one telemetry field.
+
+    Level k groups the samples into buckets of base * 2**k consecutive
+    samples, aligned at sample 0, and keeps each bucket's min, max and sum
+    plus whether the minimum occurs before the maximum. Each level is built
+    from the one below by pairing buckets, so building is O(n) and the
+    whole pyramid holds about 2n/base buckets. The timestamps of a bucket
+    are read from the raw timestamp column, so they are not stored.
+    """
+
+    def __init__(self, count: int, base: int, levels: List[Dict[str, np.ndarray]]):
+        self.count = count
+        self.base = base
+        self.levels = levels
+
+    @classmethod
+    def build(cls, values: np.ndarray, base: int = PYRAMID_BASE_BUCKET) -> "FieldPyramid":
+        count = len(values)
+        levels = []
+        if count > base:
+            level = cls._bucket(values, base)
+            levels.append(level)
+            while len(level["min"]) > 1:
+                level = cls._coarsen(level)
+                levels.append(level)
+        return cls(count, base, levels)
+
+    def extend(self, values: np.ndarray) -> "FieldPyramid":
+        """Pyramid of `values`, whose first self.count samples are the ones this one was built from
+
+        Only the buckets the new samples fall into are computed (at every
+        level, the last partial bucket and the ones after it); the others
+        are copied over, so appending costs O(new samples + n / base).
+        """
+        if not self.levels:
+            return self.build(values, self.base)
+        # First level-0 bucket that gains samples
+        first = self.count // self.base
+        tail = self._bucket(values[first * self.base:], self.base)
+        level = {name: np.concatenate((self.levels[0][name][:first], tail[name])) for name in LEVEL_STATS}
+        levels = [level]
+        while len(level["min"]) > 1:
+            # Buckets are paired from an even index, so the pairs line up with the full level
+            first //= 2
+            tail = self._coarsen({name: array[2 * first:] for name, array in level.items()})
+            previous = self.levels[len(levels)] if len(levels) < len(self.levels) else None
+            level = {name: np.concatenate((previous[name][:first], tail[name])) if previous is not None
+                     else tail[name] for name in LEVEL_STATS}
+            levels.append(level)
+        return FieldPyramid(len(values), self.base, levels)
+
+    @staticmethod
+    def _bucket(values: np.ndarray, base: int) -> Dict[str, np.ndarray]:
+        """Finest level: statistics of consecutive runs of `base` samples"""
+        count = len(values)
+        # Pad the last bucket with its final value: min/max are unchanged
+        # and padded samples are excluded from the sums below
+        buckets = -(-count // base)
+        padded = np.concatenate((values, np.repeat(values[-1:], buckets * base - count)))
+        grid = padded.reshape(buckets, base)
+        argmin, argmax = grid.argmin(axis=1), grid.argmax(axis=1)
+        rows = np.arange(buckets)
+        sums = np.add.reduceat(values.astype(np.float64), np.arange(0, count, base))
+        return {"min": grid[rows, argmin], "max": grid[rows, argmax], "sum": sums,
+                "min_first": argmin <= argmax}
+
+    @staticmethod
+    def _coarsen(level: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Next level up: merge buckets pairwise"""
+        if len(level["min"]) % 2:
+            # A lone last bucket is paired with an empty copy of itself
+            level = {name: np.append(array, array[-1:]) for name, array in level.items()}
+            level["sum"][-1] = 0.0
+        mins, maxs = level["min"].reshape(-1, 2), level["max"].reshape(-1, 2)
+        sums, min_first = level["sum"].reshape(-1, 2), level["min_first"].reshape(-1, 2)
+
+        # Ties go to the left bucket, which holds the earlier sample
+        min_right = mins[:, 1] < mins[:, 0]
+        max_right = maxs[:, 1] > maxs[:, 0]
+        rows = np.arange(len(mins))
+        # Both extremes from the same child keep its order; otherwise the
+        # minimum comes first exactly when it is in the left child
+        same_child = min_right == max_right
+        return {
+            "min": mins[rows, min_right.astype(np.int64)],
+            "max": maxs[rows, max_right.astype(np.int64)],
+            "sum": sums.sum(axis=1),
+            "min_first": np.where(same_child, min_first[rows, min_right.astype(np.int64)], ~min_right),
+        }
+
+    def bucket_size(self, level: int) -> int:
+        return self.base << level
+
+    def select_level(self, samples: int, buckets: int) -> Optional[int]:
+        """Finest level that covers `samples` samples in at most `buckets` buckets.
+
+        None means the raw samples are already few enough.
+        """
+        if samples <= buckets * self.base or not self.levels:
+            return None
+        level = int(np.ceil(np.log2(samples / (buckets * self.base))))
+        return min(max(level, 0), len(self.levels) - 1)
+
+    def query(self, level: int, lo: int, hi: int) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Buckets of `level` overlapping samples [lo, hi): (first sample index of each bucket, stats)"""
+        size = self.bucket_size(level)
+        first, last = lo // size, -(-hi // size)
+        stats = {name: array[first:last] for name, array in self.levels[level].items()}
+        return np.arange(first, last) * size, stats
+
+    @staticmethod
+    def _level_sizes(count: int, base: int) -> List[int]:
+        sizes = []
+        if count > base:
+            size = -(-count // base)
+            sizes.append(size)
+            while size > 1:
+                size = -(-size // 2)
+                sizes.append(size)
+        return sizes
+
+    def to_arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+        """Flatten into one array per statistic (levels concatenated) for .npz storage"""
+        arrays = {f"{prefix}/shape": np.array([self.count, self.base])}
+        for name in LEVEL_STATS:
+            arrays[f"{prefix}/{name}"] = (np.concatenate([level[name] for level in self.levels])
+                                          if self.levels else np.zeros(0))
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, data, prefix: str) -> Optional["FieldPyramid"]:
+        if f"{prefix}/shape" not in data.files:
+            return None
+        count, base = (int(value) for value in data[f"{prefix}/shape"])
+        bounds = np.cumsum([0] + cls._level_sizes(count, base))
+        stats = {name: data[f"{prefix}/{name}"] for name in LEVEL_STATS}
+        levels = [{name: array[start:stop] for name, array in stats.items()}
+                  for start, stop in zip(bounds[:-1], bounds[1:])]
+        return cls(count, base, levels)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for level in self.levels for array in level.values())
@@ -0,0 +1,457 @@
+import copy
+import os
+import numpy as np
+from typing import Dict, List, Any, Iterator, Tuple, Optional
+from telemetry_pyramid import FieldPyramid
+
+# Field layout for every telemetry signal extracted from a flight log.
+# Each field is stored as its own typed array instead of one dict per sample.
+TELEMETRY_SCHEMA: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "gps": (
+        ("timestamp", "f8"), ("lat", "f8"), ("lon", "f8"), ("alt", "f8"),
+        ("fix_type", "i2"), ("hdop", "f8"), ("speed", "f8"),
+    ),
+    "attitude": (
+        ("timestamp", "f8"), ("roll", "f8"), ("pitch", "f8"), ("yaw", "f8"),
+    ),
+    "battery": (
+        ("timestamp", "f8"), ("voltage", "f8"), ("current", "f8"), ("remaining", "f8"),
+    ),
+    "vibration": (
+        ("timestamp", "f8"), ("vibe_x", "f8"), ("vibe_y", "f8"), ("vibe_z", "f8"),
+        ("clip_0", "i8"), ("clip_1", "i8"), ("clip_2", "i8"),
+    ),
+    "position": (
+        ("timestamp", "f8"), ("lat", "f8"), ("lon", "f8"), ("alt", "f8"),
+        ("relative_alt", "f8"), ("vx", "f8"), ("vy", "f8"), ("vz", "f8"),
+    ),
+    "system_status": (
+        ("timestamp", "f8"), ("voltage_battery", "f8"), ("current_battery", "f8"),
+        ("battery_remaining", "i2"),
+    ),
+    "barometer": (
+        ("timestamp", "f8"), ("altitude", "f8"), ("pressure", "f8"), ("temperature", "f8"),
+    ),
+    "mode": (
+        ("timestamp", "f8"), ("mode", "i4"), ("mode_num", "i4"),
+    ),
+}
+
+DEFAULT_CHUNK_SIZE = 4096
+
+
+class SignalColumns:
+    """Column store for a single telemetry signal, grown in fixed-size chunks"""
+
+    def __init__(self, name: str, fields: Tuple[Tuple[str, str], ...], chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.name = name
+        self.fields = tuple(field for field, _ in fields)
+        self.dtypes = {field: np.dtype(dtype) for field, dtype in fields}
+        self.chunk_size = chunk_size
+        self.frozen = False
+
+        # Completed chunks per field, plus the chunk currently being filled
+        self._chunks: Dict[str, List[np.ndarray]] = {field: [] for field in self.fields}
+        self._current = self._new_chunk()
+        self._fill = 0
+        self._size = 0
+        self._columns: Optional[Dict[str, np.ndarray]] = None
+        self._time_order: Optional[np.ndarray] = None
+        self._time_sorted: Optional[bool] = None
+        # Over-allocated storage behind the frozen columns once grow() is used
+        self._buffers: Optional[Dict[str, np.ndarray]] = None
+        self._capacity = 0
+
+    def _new_chunk(self) -> Dict[str, np.ndarray]:
+        return {field: np.zeros(self.chunk_size, dtype=self.dtypes[field]) for field in self.fields}
+
+    def _flush_chunk(self):
+        for field in self.fields:
+            self._chunks[field].append(self._current[field][:self._fill])
+        self._current = self._new_chunk()
+        self._fill = 0
+
+    def append(self, **values):
+        """Append one sample; fields that are not given are stored as 0"""
+        if self.frozen:
+            raise Exception(f"Telemetry signal '{self.name}' is frozen")
+
+        current = self._current
+        fill = self._fill
+        for field, value in values.items():
+            current[field][fill] = value
+
+        self._fill += 1
+        self._size += 1
+        self._columns = None
+        if self._fill == self.chunk_size:
+            self._flush_chunk()
+
+    def extend(self, columns: Dict[str, np.ndarray]):
+        """Append a block of samples given as one array per field"""
+        if self.frozen:
+            raise Exception(f"Telemetry signal '{self.name}' is frozen")
+
+        count = len(next(iter(columns.values()))) if columns else 0
+        if count == 0:
+            return
+
+        if self._fill:
+            self._flush_chunk()
+        for field in self.fields:
+            if field in columns:
+                block = np.asarray(columns[field], dtype=self.dtypes[field])
+            else:
+                block = np.zeros(count, dtype=self.dtypes[field])
+            self._chunks[field].append(block)
+        self._size += count
+        self._columns = None
+
+    def freeze(self) -> "SignalColumns":
+        """Compact the chunks into one read-only array per field"""
+        if self.frozen:
+            return self
+
+        columns = self._materialize()
+        for column in columns.values():
+            column.flags.writeable = False
+        self._columns = columns
+        self._chunks = {field: [] for field in self.fields}
+        self._current = {}
+        self._fill = 0
+        self.frozen = True
+        return self
+
+    def grow(self, columns: Dict[str, np.ndarray]):
+        """Append a block of samples to a frozen signal (incremental parsing)
+
+        The columns move into buffers with spare capacity that double when
+        full, so repeated appends cost time proportional to the new samples.
+        Columns handed out before stay valid and unchanged; the new ones
+        are read-only views of the buffers.
+        """
+        if not self.frozen:
+            self.extend(columns)
+            return
+
+        count = len(next(iter(columns.values()))) if columns else 0
+        if count == 0:
+            return
+
+        size = self._size
+        if self._buffers is None or size + count > self._capacity:
+            capacity = max(2 * size, size + count, self.chunk_size)
+            buffers = {}
+            for field in self.fields:
+                buffers[field] = np.empty(capacity, dtype=self.dtypes[field])
+                buffers[field][:size] = self._columns[field]
+            self._buffers, self._capacity = buffers, capacity
+
+        grown = {}
+        for field in self.fields:
+            buffer = self._buffers[field]
+            if field in columns:
+                buffer[size:size + count] = np.asarray(columns[field], dtype=self.dtypes[field])
+            else:
+                buffer[size:size + count] = 0
+            grown[field] = buffer[:size + count]
+            grown[field].flags.writeable = False
+
+        # Still in order if the new block is and it starts after the old samples
+        if self._time_sorted:
+            timestamps = grown["timestamp"]
+            self._time_sorted = bool(np.all(timestamps[size + 1:] >= timestamps[size:-1])
+                                     and (size == 0 or timestamps[size] >= timestamps[size - 1])) or None
+        self._time_order = None
+        # Readers see either the old or the new set of columns, never a mix
+        self._columns = grown
+        self._size = size + count
+
+    def copy(self) -> "SignalColumns":
+        """Copy of a frozen signal sharing its arrays; grow() on the copy leaves this one unchanged"""
+        signal = copy.copy(self)
+        # shift_time() replaces the timestamp buffer, which must not show through here
+        if self._buffers is not None:
+            signal._buffers = dict(self._buffers)
+        return signal
+
+    def shift_time(self, offset: float):
+        """Add `offset` seconds to every timestamp of a frozen signal"""
+        timestamps = self._columns["timestamp"] + offset
+        if self._buffers is not None:
+            buffer = np.empty(self._capacity, dtype=self.dtypes["timestamp"])
+            buffer[:self._size] = timestamps
+            self._buffers["timestamp"] = buffer
+            timestamps = buffer[:self._size]
+        timestamps.flags.writeable = False
+        self._columns = {**self._columns, "timestamp": timestamps}
+
+    def _materialize(self) -> Dict[str, np.ndarray]:
+        if self._columns is not None:
+            return self._columns
+
+        columns = {}
+        for field in self.fields:
+            parts = self._chunks[field]
+            if self._fill:
+                parts = parts + [self._current[field][:self._fill]]
+            if parts:
+                columns[field] = np.concatenate(parts)
+            else:
+                columns[field] = np.zeros(0, dtype=self.dtypes[field])
+        self._columns = columns
+        return columns
+
+    def column(self, field: str) -> np.ndarray:
+        """Return all samples of one field as a typed array"""
+        return self._materialize()[field]
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.column(field)
+
+    def time_window(self, start: Optional[float] = None, end: Optional[float] = None):
+        """Select the samples with start <= timestamp <= end by binary search.
+
+        Returns a slice when timestamps are in order (the usual case, and no
+        copy), otherwise an index array in timestamp order. Either can be
+        used to index any column of this signal.
+        """
+        timestamps = self.column("timestamp")
+        if self._time_sorted is None or not self.frozen:
+            self._time_sorted = bool(np.all(timestamps[1:] >= timestamps[:-1]))
+            self._time_order = None if self._time_sorted else np.argsort(timestamps, kind="stable")
+        ordered = timestamps if self._time_sorted else timestamps[self._time_order]
+
+        lo = 0 if start is None else int(np.searchsorted(ordered, start, side="left"))
+        hi = len(ordered) if end is None else int(np.searchsorted(ordered, end, side="right"))
+        hi = max(lo, hi)
+        return slice(lo, hi) if self._time_sorted else self._time_order[lo:hi]
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.dtypes
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by this signal"""
+        if self._buffers is not None:
+            return sum(buffer.nbytes for buffer in self._buffers.values())
+        if self.frozen:
+            return sum(column.nbytes for column in self._columns.values())
+        chunked = sum(part.nbytes for parts in self._chunks.values() for part in parts)
+        return chunked + sum(column.nbytes for column in self._current.values())
+
+    def records(self, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return samples as a list of dicts (the JSON representation)"""
+        columns = self._materialize()
+        stop = self._size if stop is None else min(stop, self._size)
+        if start >= stop:
+            return []
+
+        # tolist() converts to native Python types in one pass per field
+        values = [columns[field][start:stop].tolist() for field in self.fields]
+        return [dict(zip(self.fields, row)) for row in zip(*values)]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.records())
+
+
+class FlightTelemetry:
+    """Container of all telemetry signals for a flight"""
+
+    def __init__(self, schema: Dict[str, Tuple[Tuple[str, str], ...]] = TELEMETRY_SCHEMA,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.signals: Dict[str, SignalColumns] = {
+            name: SignalColumns(name, fields, chunk_size) for name, fields in schema.items()
+        }
+        # (signal, field) -> level-of-detail pyramid, built once telemetry is frozen
+        self.pyramids: Dict[Tuple[str, str], FieldPyramid] = {}
+
+    def __getitem__(self, name: str) -> SignalColumns:
+        return self.signals[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.signals
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.signals)
+
+    def __len__(self) -> int:
+        return len(self.signals)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.signals.get(name, default)
+
+    def keys(self):
+        return self.signals.keys()
+
+    def items(self):
+        return self.signals.items()
+
+    def freeze(self) -> "FlightTelemetry":
+        """Freeze every signal once parsing has finished"""
+        for signal in self.signals.values():
+            signal.freeze()
+        return self
+
+    def build_pyramids(self) -> "FlightTelemetry":
+        """Build the level-of-detail pyramid of every field (done at ingest)"""
+        for name, signal in self.signals.items():
+            for field in signal.fields:
+                if field != "timestamp" and len(signal):
+                    self.pyramid(name, field)
+        return self
+
+    def copy(self) -> "FlightTelemetry":
+        """Copy of frozen telemetry that shares the sample arrays, e.g. to grow() it tentatively"""
+        telemetry = copy.copy(self)
+        telemetry.signals = {name: signal.copy() for name, signal in self.signals.items()}
+        telemetry.pyramids = dict(self.pyramids)
+        return telemetry
+
+    def grow(self, tail: "FlightTelemetry", time_shift: float = 0.0) -> Dict[str, int]:
+        """Append the samples of `tail` to this (frozen) telemetry in place
+
+        Pyramids are extended rather than rebuilt. time_shift is first added
+        to the existing timestamps, for logs whose time base only became
+        known in the new data. Returns each signal's previous sample count.
+        """
+        starts = {name: len(signal) for name, signal in self.signals.items()}
+        for name, signal in self.signals.items():
+            if time_shift and len(signal):
+                signal.shift_time(time_shift)
+            new = tail.get(name)
+            if new is not None and len(new):
+                signal.grow({field: new.column(field) for field in new.fields if field in signal})
+
+        for (name, field), pyramid in list(self.pyramids.items()):
+            if len(self.signals[name]) != starts[name]:
+                self.pyramids[(name, field)] = pyramid.extend(self.signals[name].column(field))
+        # Signals that were empty until now
+        self.build_pyramids()
+        return starts
+
+    def pyramid(self, name: str, field: str) -> FieldPyramid:
+        """Pyramid of one field, built on first use for flights stored without one"""
+        pyramid = self.pyramids.get((name, field))
+        if pyramid is None:
+            signal = self.signals[name]
+            if not signal.frozen:
+                raise Exception(f"Telemetry signal '{name}' must be frozen before building its pyramid")
+            pyramid = self.pyramids[(name, field)] = FieldPyramid.build(signal.column(field))
+        return pyramid
+
+    @property
+    def nbytes(self) -> int:
+        signals = sum(signal.nbytes for signal in self.signals.values())
+        return signals + sum(pyramid.nbytes for pyramid in self.pyramids.values())
+
+    def manifest(self) -> Dict[str, Dict[str, Any]]:
+        """Sample count, time range and fields of every non-empty signal"""
+        manifest = {}
+        for name, signal in self.signals.items():
+            if not len(signal):
+                continue
+            timestamps = signal.column("timestamp")
+            manifest[name] = {
+                "samples": len(signal),
+                "start": float(timestamps.min()),
+                "end": float(timestamps.max()),
+                "fields": [field for field in signal.fields if field != "timestamp"],
+            }
+        return manifest
+
+    def extend_manifest(self, manifest: Dict[str, Dict[str, Any]],
+                        starts: Dict[str, int]) -> Dict[str, Dict[str, Any]]:
+        """manifest() after grow(), computed from the manifest before it and only the new samples"""
+        manifest = dict(manifest)
+        for name, signal in self.signals.items():
+            start = starts.get(name, 0)
+            if len(signal) == start:
+                continue
+            timestamps = signal.column("timestamp")[start:]
+            previous = manifest.get(name)
+            manifest[name] = {
+                "samples": len(signal),
+                "start": min(float(timestamps.min()), previous["start"]) if previous else float(timestamps.min()),
+                "end": max(float(timestamps.max()), previous["end"]) if previous else float(timestamps.max()),
+                "fields": [field for field in signal.fields if field != "timestamp"],
+            }
+        return manifest
+
+    def to_dict(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Convert to the per-sample JSON layout used by the API"""
+        return {name: signal.records() for name, signal in self.signals.items()}
+
+    def save_npz(self, path: str, starts: Optional[Dict[str, int]] = None):
+        """Write all signals to an uncompressed .npz file, one array per field
+
+        With `starts` (signal -> sample index, as returned by grow()) only
+        the later samples are written, without pyramids: a segment that
+        load_npz() can append to the telemetry saved before.
+        """
+        starts = starts or {}
+        arrays = {
+            f"{name}/{field}": signal.column(field)[starts.get(name, 0):]
+            for name, signal in self.signals.items()
+            for field in signal.fields
+        }
+        if not starts:
+            for (name, field), pyramid in self.pyramids.items():
+                arrays.update(pyramid.to_arrays(f"lod/{name}/{field}"))
+        # Write to a temporary file first so readers never see a partial file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_npz(cls, path: str, segments: List[str] = ()) -> "FlightTelemetry":
+        """Load telemetry written by save_npz, followed by any appended segments"""
+        telemetry = cls()
+        with np.load(path) as data:
+            for name, signal in telemetry.signals.items():
+                columns = {field: data[f"{name}/{field}"] for field in signal.fields
+                           if f"{name}/{field}" in data.files}
+                signal.extend(columns)
+            telemetry.freeze()
+            for name, signal in telemetry.signals.items():
+                for field in signal.fields:
+                    pyramid = FieldPyramid.from_arrays(data, f"lod/{name}/{field}")
+                    if pyramid is not None:
+                        telemetry.pyramids[(name, field)] = pyramid
+        for segment in segments:
+            telemetry.grow(cls.load_npz(segment))
+        return telemetry
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, List[Dict[str, Any]]]) -> "FlightTelemetry":
+        """Rebuild columnar telemetry from the per-sample JSON layout"""
+        telemetry = cls()
+        for name, samples in data.items():
+            signal = telemetry.signals.get(name)
+            if signal is None or not samples:
+                continue
+            signal.extend({
+                field: np.array([sample.get(field, 0) or 0 for sample in samples])
+                for field in signal.fields
+            })
+        return telemetry.freeze()
+
+
+def flight_to_jsonable(flight_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a copy of flight data with columnar telemetry expanded for JSON"""
+    telemetry = flight_data.get("telemetry")
+    if isinstance(telemetry, FlightTelemetry):
+        return {**flight_data, "telemetry": telemetry.to_dict()}
+    return flight_data
+
+
+def flight_from_jsonable(flight_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Inverse of flight_to_jsonable, used when loading cached flights"""
+    telemetry = flight_data.get("telemetry")
+    if isinstance(telemetry, dict):
+        return {**flight_data, "telemetry": FlightTelemetry.from_dict(telemetry)}
+    return flight_data
@@ -0,0 +1,190 @@
+import gzip
+import json
+import struct
+import numpy as np
+from typing import Dict, List, Any, Tuple, Optional
+from fastapi.responses import Response
+from config import Config
+from telemetry_store import FlightTelemetry, flight_to_jsonable
+from metrics import span
+
+try:
+    import zstandard
+except ImportError:  # optional: gzip is used when zstandard is not installed
+    zstandard = None
+
+# Binary flight payload:
+#   b"UAVT" | uint32 LE header length | JSON header (space-padded to a multiple of 8)
+#   | field arrays, little-endian, each starting on an 8-byte boundary
+# The header holds the flight metadata (everything but telemetry) and, per
+# signal, its sample count and each field's dtype, byte offset (from the start
+# of the array section) and length, so clients can view fields as typed arrays
+# without copying.
+BINARY_MEDIA_TYPE = "application/x-uav-telemetry"
+BINARY_MAGIC = b"UAVT"
+BINARY_VERSION = 1
+
+# Typed-array friendly dtypes; int64 has no convenient JS counterpart, so it is
+# sent as float64 (exact for the counters and ids stored in telemetry)
+_WIRE_DTYPES = {"f8": "<f8", "f4": "<f4", "i2": "<i2", "i4": "<i4", "i8": "<f8", "i1": "<i1", "u1": "<u1"}
+
+
+def _align(size: int) -> int:
+    return (size + 7) // 8 * 8
+
+
+def encode_flight_binary(flight_data: Dict[str, Any], signal_names: Optional[List[str]] = None) -> bytes:
+    """Encode a flight as a JSON header followed by raw column arrays
+
+    signal_names limits the payload to those signals (default: all).
+    """
+    telemetry = flight_data.get("telemetry")
+    metadata = {key: value for key, value in flight_data.items() if key != "telemetry"}
+
+    signals = {}
+    arrays = []
+    offset = 0
+    if isinstance(telemetry, FlightTelemetry):
+        for name, signal in telemetry.items():
+            if signal_names is not None and name not in signal_names:
+                continue
+            fields = {}
+            for field in signal.fields:
+                column = signal.column(field)
+                wire_dtype = np.dtype(_WIRE_DTYPES.get(column.dtype.str[1:], "<f8"))
+                data = np.ascontiguousarray(column, dtype=wire_dtype).tobytes()
+                fields[field] = {"dtype": wire_dtype.name, "offset": offset, "length": len(column)}
+                arrays.append(data)
+                padding = _align(len(data)) - len(data)
+                if padding:
+                    arrays.append(b"\0" * padding)
+                offset += len(data) + padding
+            signals[name] = {"length": len(signal), "fields": fields}
+
+    header = json.dumps({"version": BINARY_VERSION, "flight": metadata, "signals": signals},
+                        default=str).encode("utf-8")
+    # Pad the header so the array section starts 8-byte aligned
+    header += b" " * (_align(len(header) + 8) - len(header) - 8)
+    return b"".join([BINARY_MAGIC, struct.pack("<I", len(header)), header] + arrays)
+
+
+def decode_flight_binary(payload: bytes) -> Dict[str, Any]:
+    """Inverse of encode_flight_binary (used by tools and benchmarks)"""
+    if payload[:4] != BINARY_MAGIC:
+        raise Exception("Not a binary flight payload")
+    header_length = struct.unpack("<I", payload[4:8])[0]
+    header = json.loads(payload[8:8 + header_length])
+    data = memoryview(payload)[8 + header_length:]
+
+    telemetry = FlightTelemetry()
+    for name, layout in header["signals"].items():
+        signal = telemetry.get(name)
+        if signal is None:
+            continue
+        signal.extend({
+            field: np.frombuffer(data, dtype=spec["dtype"], count=spec["length"], offset=spec["offset"])
+            for field, spec in layout["fields"].items() if field in signal
+        })
+    return {**header["flight"], "telemetry": telemetry.freeze()}
+
+
+def wants_binary(accept: Optional[str]) -> bool:
+    """Whether the Accept header prefers the binary format over JSON"""
+    if not accept or BINARY_MEDIA_TYPE not in accept:
+        return False
+    quality = {}
+    for part in accept.split(","):
+        media_type, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        quality[media_type.strip()] = q
+    binary = quality.get(BINARY_MEDIA_TYPE, 0.0)
+    return binary > 0 and binary >= max(quality.get("application/json", 0.0), quality.get("*/*", 0.0))
+
+
+def compress(body: bytes, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Compress with zstd when available and accepted, else gzip, else not at all"""
+    accepted = {part.split(";")[0].strip() for part in (accept_encoding or "").split(",")}
+    if len(body) < Config.TRANSPORT_COMPRESS_MIN_BYTES:
+        return body, None
+    if zstandard is not None and "zstd" in accepted:
+        with span("compress_zstd"):
+            return zstandard.ZstdCompressor(level=Config.TRANSPORT_ZSTD_LEVEL).compress(body), "zstd"
+    if "gzip" in accepted:
+        with span("compress_gzip"):
+            return gzip.compress(body, compresslevel=Config.TRANSPORT_GZIP_LEVEL), "gzip"
+    return body, None
+
+
+def flight_response(flight_data: Dict[str, Any], accept: Optional[str] = None,
+                    accept_encoding: Optional[str] = None) -> Response:
+    """Flight data in the format the client asked for: binary if preferred, JSON otherwise"""
+    if wants_binary(accept):
+        with span("encode_binary"):
+            body, media_type = encode_flight_binary(flight_data), BINARY_MEDIA_TYPE
+    else:
+        with span("encode_json"):
+            body = json.dumps(flight_to_jsonable(flight_data), default=str).encode("utf-8")
+        media_type = "application/json"
+
+    body, encoding = compress(body, accept_encoding)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def signal_etag(flight_data: Dict[str, Any], name: str, binary: bool) -> str:
+    """Strong ETag of one signal in one representation.
+
+    The flight's content hash identifies its telemetry: it is the log's
+    hash, rehashed whenever data is appended to the flight, or the flight
+    id for flights stored before hashes were kept.
+    """
+    version = f"{'b' if binary else 'j'}{BINARY_VERSION}"
+    return f'"{flight_data.get("content_hash") or flight_data["flight_id"]}-{name}-{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def signal_response(flight_data: Dict[str, Any], name: str, accept: Optional[str] = None,
+                    accept_encoding: Optional[str] = None) -> Response:
+    """One telemetry signal, binary if preferred, with caching headers"""
+    metadata = {"flight_id": flight_data["flight_id"], "signal": name}
+    if wants_binary(accept):
+        with span("encode_binary"):
+            body = encode_flight_binary({**metadata, "telemetry": flight_data["telemetry"]}, [name])
+        media_type = BINARY_MEDIA_TYPE
+    else:
+        with span("encode_json"):
+            body = json.dumps({**metadata, "samples": flight_data["telemetry"][name].records()}).encode("utf-8")
+        media_type = "application/json"
+
+    body, encoding = compress(body, accept_encoding)
+    headers = {**signal_cache_headers(flight_data, name, accept), "Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def signal_cache_headers(flight_data: Dict[str, Any], name: str, accept: Optional[str]) -> Dict[str, str]:
+    return {
+        "ETag": signal_etag(flight_data, name, wants_binary(accept)),
+        "Cache-Control": f"private, max-age={Config.SIGNAL_CACHE_MAX_AGE}",
+    }
+
+
+def not_modified_response(flight_data: Dict[str, Any], name: str, accept: Optional[str]) -> Response:
+    return Response(status_code=304, headers={**signal_cache_headers(flight_data, name, accept),
+                                              "Vary": "Accept, Accept-Encoding"})
@@ -0,0 +1,423 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Dict, List, Any, Optional, AsyncIterator
+from config import Config
+from dataflash_decoder import ParseCancelledError
+from flight_prompt import build_flight_context
+from metrics import span, trace, observe_stage, StackSampler
+
+FINISHED_STATUSES = {"completed", "failed", "cancelled"}
+
+
+@dataclass
+class UploadJob:
+    job_id: str
+    filename: str
+    file_path: str
+    bytes_total: int
+    content_hash: Optional[str] = None
+    cached: bool = False
+    kind: str = "upload"  # upload, or append (data added to an existing flight's log)
+    status: str = "queued"  # queued, running, completed, failed, cancelled
+    stage: str = "queued"  # queued, [waiting_for_duplicate | appending,] parsing, summarizing, completed
+    bytes_consumed: int = 0
+    messages_decoded: int = 0
+    flight_id: Optional[str] = None
+    error: Optional[str] = None
+    # Seconds per pipeline stage, filled in as stages finish
+    timings: Dict[str, float] = field(default_factory=dict)
+    profiled: bool = False
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    updated_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    version: int = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("file_path")
+        data["progress"] = round(self.bytes_consumed / self.bytes_total, 4) if self.bytes_total else 0
+        return data
+
+
+class UploadJobManager:
+    """Runs uploaded logs through parse, summary and anomaly analysis in the background.
+
+    Clients get a job id right away and follow progress by polling
+    get_job() or by streaming events(); the parsed flight is registered with
+    the flight repository once it has been summarized. LLM anomaly analysis
+    is not part of the job: it is handed to the anomaly analysis manager
+    and fills in the flight's summary later. Logs whose
+    content hash is already in the parse cache skip all stages and resolve
+    to the previously parsed flight.
+
+    Append jobs add data to the log of a flight that is still being
+    recorded: only the new records are decoded, and the flight's telemetry
+    and summary are extended with them (see submit_append()).
+    """
+
+    def __init__(self, parser, parse_pool, parse_cache=None, anomaly_analysis=None, response_cache=None):
+        self.parser = parser
+        self.parse_pool = parse_pool
+        self.parse_cache = parse_cache
+        self.anomaly_analysis = anomaly_analysis
+        # Chat answers about a flight go stale when data is appended to it
+        self.response_cache = response_cache
+        self.jobs: Dict[str, UploadJob] = {}
+        self.results: Dict[str, Dict[str, Any]] = {}
+        # Stack samples of jobs submitted with profile=True
+        self.profiles: Dict[str, StackSampler] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Content hash -> task of the job currently processing that log
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        # Appends to one flight run one at a time, in submission order:
+        # flight id -> [lock, jobs holding or waiting for it], removed by the last job
+        self._append_locks: Dict[str, List[Any]] = {}
+        self._changed = asyncio.Condition()
+
+    def submit(self, filename: str, file_path: str, bytes_total: int,
+               content_hash: str = None, profile: bool = False,
+               timings: Dict[str, float] = None) -> UploadJob:
+        """Create a job for a saved upload and start processing it
+
+        timings holds stages already measured for the upload (e.g. receiving
+        the file). With profile=True the parse and summary are sampled; the
+        folded stacks are available from get_profile() once the job ends.
+        """
+        self._expire_finished_jobs()
+        job = UploadJob(job_id=str(uuid.uuid4()), filename=filename, file_path=file_path,
+                        bytes_total=bytes_total, content_hash=content_hash,
+                        timings=dict(timings or {}), profiled=profile)
+        self.jobs[job.job_id] = job
+        if profile:
+            self.profiles[job.job_id] = StackSampler()
+        self._tasks[job.job_id] = asyncio.create_task(self._run(job))
+        return job
+
+    def submit_append(self, flight_id: str, filename: str, file_path: str, bytes_total: int,
+                      content_hash: str, offset: Optional[int] = None,
+                      timings: Dict[str, float] = None) -> UploadJob:
+        """Create a job that appends a saved chunk to a flight's log and decodes just that
+
+        offset, if given, is where the chunk belongs in the log; the job
+        fails unless the log has exactly that many bytes, so a client that
+        lost track can resume from the log_bytes reported for the flight.
+        content_hash is the chunk's SHA-256, chained into the flight's hash.
+        """
+        self._expire_finished_jobs()
+        job = UploadJob(job_id=str(uuid.uuid4()), filename=filename, file_path=file_path,
+                        bytes_total=bytes_total, kind="append", flight_id=flight_id,
+                        timings=dict(timings or {}))
+        self.jobs[job.job_id] = job
+        self._tasks[job.job_id] = asyncio.create_task(self._run_append(job, content_hash, offset))
+        return job
+
+    def get_job(self, job_id: str) -> Optional[UploadJob]:
+        return self.jobs.get(job_id)
+
+    def get_profile(self, job_id: str) -> Optional[str]:
+        """Folded stacks of a finished profiled job, None otherwise"""
+        job = self.jobs.get(job_id)
+        sampler = self.profiles.get(job_id)
+        if job is None or sampler is None or not job.finished:
+            return None
+        return sampler.folded()
+
+    def get_result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.results.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not finished yet"""
+        task = self._tasks.get(job_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    async def events(self, job_id: str, keepalive: float = 15.0) -> AsyncIterator[str]:
+        """Server-sent event stream of job state, ending when the job finishes"""
+        job = self.jobs[job_id]
+        last_version = -1
+        while True:
+            if job.version != last_version:
+                last_version = job.version
+                event = job.status if job.finished else "progress"
+                yield f"event: {event}\ndata: {json.dumps(job.to_dict())}\n\n"
+                if job.finished:
+                    return
+            try:
+                async with self._changed:
+                    await asyncio.wait_for(
+                        self._changed.wait_for(lambda: job.version != last_version), keepalive)
+            except asyncio.TimeoutError:
+                # SSE comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+    async def _update(self, job: UploadJob, **changes):
+        for key, value in changes.items():
+            setattr(job, key, value)
+        job.version += 1
+        job.updated_at = datetime.now().isoformat()
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _run(self, job: UploadJob):
+        # Stages timed in this task, in worker processes and in threads it
+        # starts all land in job.timings
+        with trace(job.timings):
+            await self._run_stages(job)
+
+    async def _run_stages(self, job: UploadJob):
+        started = time.perf_counter()
+        sampler = self.profiles.get(job.job_id)
+        try:
+            if job.content_hash:
+                # An identical upload still being processed will populate the cache shortly
+                other = self._in_flight.get(job.content_hash)
+                if other is not None:
+                    await self._update(job, status="running", stage="waiting_for_duplicate")
+                    with span("wait_for_duplicate"):
+                        await asyncio.wait({other})
+                self._in_flight[job.content_hash] = asyncio.current_task()
+                if await self._resolve_from_cache(job):
+                    return
+
+            await self._update(job, status="running", stage="parsing")
+            with span("parse"):
+                flight_data = await self._parse(job, sampler)
+
+            await self._update(job, stage="summarizing", flight_id=flight_data["flight_id"])
+            if sampler is not None:
+                await asyncio.to_thread(sampler.run, self.parser.summarize_flight, flight_data)
+            else:
+                await asyncio.to_thread(self.parser.summarize_flight, flight_data)
+
+            # The chat prompt's flight section only depends on the summary, so render it once
+            with span("prompt_context"):
+                flight_data["prompt_context"] = build_flight_context(flight_data)
+
+            # Add timestamp for recency tracking
+            flight_data["timestamp"] = datetime.now().isoformat()
+            # Identifies the flight's content, e.g. for signal ETags
+            flight_data["content_hash"] = job.content_hash
+            with span("store"):
+                await asyncio.to_thread(self.parser.add_flight, flight_data)
+            if self.parse_cache and job.content_hash:
+                with span("parse_cache_put"):
+                    await asyncio.to_thread(self.parse_cache.put, job.content_hash, flight_data)
+
+            observe_stage("job_total", time.perf_counter() - started)
+            await self._complete(job, flight_data)
+            self._schedule_anomaly_analysis(job, flight_data["flight_id"])
+        except (asyncio.CancelledError, ParseCancelledError):
+            await self._update(job, status="cancelled", error="Upload processing was cancelled")
+        except Exception as e:
+            print(f"Upload job {job.job_id} failed: {e}")
+            await self._update(job, status="failed", error=str(e))
+        finally:
+            self._tasks.pop(job.job_id, None)
+            if job.content_hash and self._in_flight.get(job.content_hash) is asyncio.current_task():
+                del self._in_flight[job.content_hash]
+
+    async def _run_append(self, job: UploadJob, chunk_hash: str, offset: Optional[int]):
+        with trace(job.timings):
+            await self._append_stages(job, chunk_hash, offset)
+
+    async def _append_stages(self, job: UploadJob, chunk_hash: str, offset: Optional[int]):
+        started = time.perf_counter()
+        flight_id = job.flight_id
+        entry = self._append_locks.setdefault(flight_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._update(job, status="running", stage="appending")
+                flight_data = await asyncio.to_thread(self.parser.repository.get, flight_id)
+                if flight_data is None:
+                    raise Exception(f"Flight {flight_id} not found")
+                if not flight_data.get("parse_state") or flight_data.get("telemetry") is None:
+                    raise Exception("This flight's log cannot be extended - upload the complete log instead")
+
+                log_path = flight_data["file_path"]
+                previous_size = os.path.getsize(log_path)
+                with span("append_write"):
+                    log_bytes = await asyncio.to_thread(append_to_log, job.file_path, log_path, offset)
+                try:
+                    # Progress is measured over the whole log, from where decoding resumes
+                    await self._update(job, stage="parsing", bytes_total=log_bytes,
+                                       bytes_consumed=flight_data["parse_state"]["offset"])
+                    with span("parse"):
+                        appended = await self._follow_progress(
+                            job, self.parse_pool.decode_appended(log_path, flight_data["parse_state"],
+                                                                 job_id=job.job_id, track_progress=True))
+                    await self._update(job, stage="summarizing", bytes_consumed=log_bytes,
+                                       messages_decoded=appended["total_messages"])
+
+                    # Once decoded, the append runs to completion even if the job is
+                    # cancelled: its thread can't be stopped, and the log must only be
+                    # cut back if the grown flight was not stored
+                    store = asyncio.ensure_future(asyncio.to_thread(
+                        self._store_append, flight_data, appended, chunk_hash))
+                    try:
+                        await asyncio.shield(store)
+                    except asyncio.CancelledError:
+                        await asyncio.wait({store})
+                    grown = store.result()
+                except BaseException:
+                    # The flight still ends at the old size: drop the undecoded bytes so
+                    # the client can retry at the same offset (cancellation included)
+                    os.truncate(log_path, previous_size)
+                    raise
+                previous_hash = flight_data.get("content_hash")
+                if self.parse_cache and previous_hash:
+                    await asyncio.to_thread(self.parse_cache.remove, previous_hash)
+                if self.response_cache is not None:
+                    self.response_cache.invalidate(flight_id)
+
+                observe_stage("append_total", time.perf_counter() - started)
+                await self._complete(job, grown)
+                self._schedule_anomaly_analysis(job, flight_id)
+        except (asyncio.CancelledError, ParseCancelledError):
+            await self._update(job, status="cancelled", error="Append was cancelled")
+        except Exception as e:
+            print(f"Append job {job.job_id} failed: {e}")
+            await self._update(job, status="failed", error=str(e))
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._append_locks.pop(flight_id, None)
+            self._tasks.pop(job.job_id, None)
+            if os.path.exists(job.file_path):
+                os.remove(job.file_path)
+
+    def _store_append(self, flight_data: Dict[str, Any], appended: Dict[str, Any],
+                      chunk_hash: str) -> Dict[str, Any]:
+        """Grow a copy of the flight by decoded appended records and store it in the flight's place"""
+        grown, starts = self.parser.append_to_flight(flight_data, appended)
+        with span("prompt_context"):
+            grown["prompt_context"] = build_flight_context(grown)
+        grown["timestamp"] = datetime.now().isoformat()
+        # A new content hash gives the grown signals new ETags; the
+        # parse cache entry of the shorter log no longer matches this flight
+        grown["content_hash"] = hashlib.sha256(
+            f"{flight_data.get('content_hash') or flight_data['flight_id']}:{chunk_hash}".encode()).hexdigest()
+        with span("store"):
+            self.parser.repository.append(grown, starts, bool(appended["time_shift"]))
+        return grown
+
+    async def _resolve_from_cache(self, job: UploadJob) -> bool:
+        """Complete a job from the parse cache if the same log was processed before"""
+        if self.parse_cache is None:
+            return False
+        with span("parse_cache_get"):
+            cached = await asyncio.to_thread(self.parse_cache.get, job.content_hash)
+        if cached is None:
+            return False
+
+        # The entry points at the stored flight, which holds the telemetry
+        flight_id = cached["flight_id"]
+        flight_data = self.parser.repository.peek(flight_id)
+        if flight_data is None:
+            await asyncio.to_thread(self.parse_cache.remove, job.content_hash)
+            return False
+        changes = {"timestamp": datetime.now().isoformat(), "content_hash": job.content_hash}
+        if "signal_manifest" not in flight_data:
+            # Flights stored before manifests existed
+            stored = await asyncio.to_thread(self.parser.repository.get, flight_id)
+            if stored.get("telemetry") is not None:
+                changes["signal_manifest"] = stored["telemetry"].manifest()
+        flight_data = await asyncio.to_thread(self.parser.repository.update, flight_id, **changes)
+
+        # The log is already stored under the earlier upload
+        if job.file_path != flight_data.get("file_path") and os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        await self._update(job, cached=True, bytes_consumed=job.bytes_total,
+                           messages_decoded=flight_data.get("total_messages", 0))
+        await self._complete(job, flight_data)
+        # Picks up an analysis that never finished for the cached flight
+        self._schedule_anomaly_analysis(job, flight_data["flight_id"])
+        return True
+
+    def _schedule_anomaly_analysis(self, job: UploadJob, flight_id: str):
+        """Start background anomaly analysis, refreshing the parse cache when it is done"""
+        if self.anomaly_analysis is None:
+            return
+        on_complete = None
+        if self.parse_cache and job.content_hash:
+            def on_complete(flight_data, content_hash=job.content_hash):
+                # Unless data was appended to the flight meanwhile
+                if flight_data.get("content_hash") == content_hash:
+                    self.parse_cache.put(content_hash, flight_data)
+        self.anomaly_analysis.schedule(flight_id, on_complete)
+
+    async def _complete(self, job: UploadJob, flight_data: Dict[str, Any]):
+        # Telemetry is not part of the result; clients fetch the signals they need
+        self.results[job.job_id] = {
+            "flight_id": flight_data["flight_id"],
+            "summary": flight_data["summary"],
+            "signals": flight_data.get("signal_manifest", {}),
+            # Where data appended to the log has to start
+            "log_bytes": log_size(flight_data),
+        }
+        await self._update(job, status="completed", stage="completed", flight_id=flight_data["flight_id"])
+
+    async def _parse(self, job: UploadJob, sampler: Optional[StackSampler] = None) -> Dict[str, Any]:
+        """Parse in the worker pool, copying reported progress onto the job"""
+        flight_data = await self._follow_progress(
+            job, self.parse_pool.parse(job.file_path, job_id=job.job_id, track_progress=True, summarize=False,
+                                       sampler=sampler))
+        await self._update(job, bytes_consumed=job.bytes_total,
+                           messages_decoded=flight_data["total_messages"])
+        return flight_data
+
+    async def _follow_progress(self, job: UploadJob, work) -> Dict[str, Any]:
+        """Await a worker pool call, copying the progress it reports onto the job"""
+        parse_task = asyncio.ensure_future(work)
+        try:
+            while not parse_task.done():
+                await asyncio.wait({parse_task}, timeout=Config.JOB_PROGRESS_INTERVAL)
+                progress = self.parse_pool.get_progress(job.job_id)
+                if progress and progress.get("bytes_consumed") != job.bytes_consumed:
+                    await self._update(job, **progress)
+        except asyncio.CancelledError:
+            parse_task.cancel()
+            raise
+        return parse_task.result()
+
+    def _expire_finished_jobs(self):
+        """Forget finished jobs older than Config.JOB_RETENTION_SECONDS"""
+        cutoff = time.time() - Config.JOB_RETENTION_SECONDS
+        for job_id, job in list(self.jobs.items()):
+            if job.finished and datetime.fromisoformat(job.updated_at).timestamp() < cutoff:
+                del self.jobs[job_id]
+                self.results.pop(job_id, None)
+                self.profiles.pop(job_id, None)
+
+
+def log_size(flight_data: Dict[str, Any]) -> Optional[int]:
+    """Current size of a flight's stored log, None if the log is gone"""
+    file_path = flight_data.get("file_path")
+    return os.path.getsize(file_path) if file_path and os.path.exists(file_path) else None
+
+
+def append_to_log(chunk_path: str, log_path: str, offset: Optional[int] = None) -> int:
+    """Append a saved chunk to a log file; returns the log's new size
+
+    With an offset, the log must currently end exactly there.
+    """
+    size = os.path.getsize(log_path)
+    if offset is not None and offset != size:
+        raise Exception(f"Log has {size} bytes; appended data must start at offset {size}, not {offset}")
+    if size + os.path.getsize(chunk_path) > Config.MAX_FILE_SIZE:
+        raise Exception(Config.FILE_TOO_LARGE_MESSAGE)
+    with open(chunk_path, "rb") as chunk, open(log_path, "ab") as log:
+        shutil.copyfileobj(chunk, log, Config.UPLOAD_CHUNK_SIZE)
+    return os.path.getsize(log_path)
@@ -1,11 +1,15 @@
 import axios from 'axios'
+import { BINARY_MEDIA_TYPE, decodeFlight } from './telemetryCodec'
+
+// Signals loaded right after an upload; the rest are fetched on demand
+const UPLOAD_SIGNALS = ['gps', 'battery']
 
 class ChatService {
   constructor() {
     this.baseURL = 'http://localhost:8000/api'
   }
 
-  async uploadFlightFile(file) {
+  async uploadFlightFile(file, onProgress = null) {
     const formData = new FormData()
     formData.append('file', file)
     
@@ -15,13 +19,68 @@ class ChatService {
           'Content-Type': 'multipart/form-data',
         },
       })
-      return response.data
+      // Parsing runs as a background job; its result carries the summary and
+      // a manifest of signals, so only the signals the views plot are fetched
+      const job = await this.waitForUploadJob(response.data.job_id, onProgress)
+      const { flight_id: flightId, summary, signals } = job.result
+      const names = UPLOAD_SIGNALS.filter(name => signals[name] && signals[name].samples > 0)
+      const series = await Promise.all(names.map(name => this.getFlightSignal(flightId, name)))
+      const telemetry = {}
+      names.forEach((name, i) => { telemetry[name] = series[i] })
+      return {
+        flight_id: flightId,
+        summary,
+        signals,
+        telemetry,
+        message: 'Flight data uploaded and parsed successfully'
+      }
     } catch (error) {
       console.error('Error uploading file:', error)
       throw error
     }
   }
 
+  // Sends the bytes added to a flight's log since the last upload or append.
+  // offset is where they start in the log (the log_bytes of the previous
+  // result); the flight's summary and signal manifest are returned updated
+  async appendFlightData(flightId, blob, offset = null, onProgress = null) {
+    const formData = new FormData()
+    formData.append('file', blob, 'append.bin')
+    const params = offset === null ? {} : { offset }
+
+    try {
+      const response = await axios.post(`${this.baseURL}/flights/${flightId}/append`, formData, {
+        headers: {
+          'Content-Type': 'multipart/form-data',
+        },
+        params
+      })
+      const job = await this.waitForUploadJob(response.data.job_id, onProgress)
+      const { summary, signals, log_bytes: logBytes } = job.result
+      return { flight_id: flightId, summary, signals, logBytes }
+    } catch (error) {
+      console.error('Error appending flight data:', error)
+      throw error
+    }
+  }
+
+  async waitForUploadJob(jobId, onProgress = null, pollInterval = 500) {
+    for (;;) {
+      const response = await axios.get(`${this.baseURL}/jobs/${jobId}`)
+      const job = response.data
+      if (onProgress) {
+        onProgress(job)
+      }
+      if (job.status === 'completed') {
+        return job
+      }
+      if (job.status === 'failed' || job.status === 'cancelled') {
+        throw new Error(job.error || `Upload ${job.status}`)
+      }
+      await new Promise(resolve => setTimeout(resolve, pollInterval))
+    }
+  }
+
   async sendChatMessage(message, flightId = null) {
     try {
       const response = await axios.post(`${this.baseURL}/chat`, {
@@ -35,6 +94,54 @@ class ChatService {
     }
   }
 
+  // Streams the answer over server-sent events, calling onToken with each text
+  // fragment; resolves with the final result (suggestions, insights) when done
+  async streamChatMessage(message, flightId = null, onToken = null) {
+    const response = await fetch(`${this.baseURL}/chat/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ message, flight_id: flightId })
+    })
+    if (!response.ok) {
+      throw new Error(`Chat request failed with status ${response.status}`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    for (;;) {
+      const { done, value } = await reader.read()
+      if (done) {
+        break
+      }
+      buffer += decoder.decode(value, { stream: true })
+      let boundary
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const rawEvent = buffer.slice(0, boundary)
+        buffer = buffer.slice(boundary + 2)
+        let event = 'message'
+        let data = ''
+        for (const line of rawEvent.split('\n')) {
+          if (line.startsWith('event: ')) {
+            event = line.slice(7)
+          } else if (line.startsWith('data: ')) {
+            data += line.slice(6)
+          }
+        }
+        if (!data) {
+          continue
+        }
+        const payload = JSON.parse(data)
+        if (event === 'token' && onToken) {
+          onToken(payload.text)
+        } else if (event === 'done') {
+          return payload
+        }
+      }
+    }
+    throw new Error('Chat stream ended before the answer was complete')
+  }
+
   async getFlights() {
     try {
       const response = await axios.get(`${this.baseURL}/flights`)
@@ -45,20 +152,115 @@ class ChatService {
     }
   }
 
+  // Flight payloads ask for binary telemetry and fall back to JSON if the server sends that
+  async getFlightPayload(path) {
+    const response = await axios.get(`${this.baseURL}${path}`, {
+      headers: { Accept: `${BINARY_MEDIA_TYPE}, application/json;q=0.9` },
+      responseType: 'arraybuffer'
+    })
+    if ((response.headers['content-type'] || '').startsWith(BINARY_MEDIA_TYPE)) {
+      return decodeFlight(response.data)
+    }
+    return JSON.parse(new TextDecoder().decode(response.data))
+  }
+
   async getFlightDetails(flightId) {
     try {
-      const response = await axios.get(`${this.baseURL}/flights/${flightId}`)
-      return response.data
+      return await this.getFlightPayload(`/flights/${flightId}`)
     } catch (error) {
       console.error('Error fetching flight details:', error)
       throw error
     }
   }
 
-  async getRecentFlight() {
+  // Signal names with sample counts, time ranges and fields
+  async getFlightSignals(flightId) {
+    try {
+      const response = await axios.get(`${this.baseURL}/flights/${flightId}/signals`)
+      return response.data.signals
+    } catch (error) {
+      console.error('Error fetching flight signals:', error)
+      throw error
+    }
+  }
+
+  // Samples of one signal; responses carry an ETag so the browser can revalidate
+  async getFlightSignal(flightId, name) {
     try {
-      const response = await axios.get(`${this.baseURL}/flights/recent`)
+      const flight = await this.getFlightPayload(`/flights/${flightId}/signals/${name}`)
+      return flight.telemetry ? flight.telemetry[name] : flight.samples
+    } catch (error) {
+      console.error('Error fetching flight signal:', error)
+      throw error
+    }
+  }
+
+  // Downsampled telemetry for a time window: { signals: ['gps'], fields: ['alt'],
+  // start, end, points, method: 'minmax' | 'mean' | 'lttb' }
+  async getFlightTelemetry(flightId, { signals, fields, start, end, points, method } = {}) {
+    try {
+      const response = await axios.get(`${this.baseURL}/flights/${flightId}/telemetry`, {
+        params: {
+          signals: signals ? signals.join(',') : undefined,
+          fields: fields ? fields.join(',') : undefined,
+          start,
+          end,
+          points,
+          method
+        }
+      })
       return response.data
+    } catch (error) {
+      console.error('Error fetching flight telemetry:', error)
+      throw error
+    }
+  }
+
+  // Anomaly analysis finishes after the upload; status is pending, running,
+  // completed or failed
+  async getFlightAnomalies(flightId) {
+    try {
+      const response = await axios.get(`${this.baseURL}/flights/${flightId}/anomalies`)
+      return response.data
+    } catch (error) {
+      console.error('Error fetching flight anomalies:', error)
+      throw error
+    }
+  }
+
+  // Live telemetry from vehicles streaming MAVLink to the server. onBatch gets
+  // { vehicles: { [systemId]: { signals, skipped } } } with only new samples,
+  // at most once per interval seconds; close the returned socket to stop
+  subscribeLiveTelemetry({ vehicle, signals, interval } = {}, onBatch) {
+    const params = new URLSearchParams()
+    if (vehicle !== undefined && vehicle !== null) {
+      params.set('vehicle', vehicle)
+    }
+    if (signals) {
+      params.set('signals', signals.join(','))
+    }
+    if (interval) {
+      params.set('interval', interval)
+    }
+    const socket = new WebSocket(`${this.baseURL.replace(/^http/, 'ws')}/live/ws?${params}`)
+    socket.onmessage = event => onBatch(JSON.parse(event.data))
+    socket.onerror = error => console.error('Live telemetry connection error:', error)
+    return socket
+  }
+
+  async getLiveVehicles() {
+    try {
+      const response = await axios.get(`${this.baseURL}/live/vehicles`)
+      return response.data
+    } catch (error) {
+      console.error('Error fetching live vehicles:', error)
+      throw error
+    }
+  }
+
+  async getRecentFlight() {
+    try {
+      return await this.getFlightPayload('/flights/recent')
     } catch (error) {
       console.error('Error fetching recent flight:', error)
       throw error
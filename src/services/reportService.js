@@ -151,7 +151,7 @@ class ReportService {
       ['Maximum Altitude', `${flightData.summary.max_altitude?.toFixed(1)}m`, 'Normal'],
       ['Maximum Speed', `${flightData.summary.max_speed?.toFixed(1)}m/s`, 'Normal'],
       ['Battery Usage', `${flightData.summary.battery_usage?.toFixed(1)}%`, flightData.summary.battery_usage > 80 ? 'High' : 'Normal'],
-      ['GPS Points', `${flightData.telemetry?.gps?.length || 0}`, 'Good'],
+      ['GPS Points', `${this.signalSamples(flightData, 'gps')}`, 'Good'],
       ['Message Count', `${flightData.summary.total_messages || 'N/A'}`, 'Normal']
     ]
     
@@ -338,6 +338,17 @@ class ReportService {
     }
   }
 
+  // Sample count of a signal from the flight's signal manifest: telemetry
+  // only holds the signals that have been fetched so far
+  signalSamples(flightData, name) {
+    const manifest = flightData.signals || flightData.signal_manifest
+    if (manifest) {
+      return manifest[name]?.samples || 0
+    }
+    const samples = flightData.telemetry?.[name]
+    return samples ? samples.length : 'N/A'
+  }
+
   addTechnicalAppendix(flightData) {
     this.doc.addPage()
     
@@ -351,9 +362,9 @@ class ReportService {
       ['Flight ID', flightData.flight_id],
       ['Log Format', 'MAVLink Binary'],
       ['Total Messages', `${flightData.summary.total_messages || 'N/A'}`],
-      ['GPS Points', `${flightData.telemetry?.gps?.length || 0}`],
-      ['Attitude Points', `${flightData.telemetry?.attitude?.length || 0}`],
-      ['Battery Points', `${flightData.telemetry?.battery?.length || 0}`],
+      ['GPS Points', `${this.signalSamples(flightData, 'gps')}`],
+      ['Attitude Points', `${this.signalSamples(flightData, 'attitude')}`],
+      ['Battery Points', `${this.signalSamples(flightData, 'battery')}`],
       ['Analysis Date', new Date().toISOString()],
       ['Software Version', 'UAV Log Viewer v1.0']
     ]
@@ -0,0 +1,61 @@
+// Decoder for the backend's binary flight payload (application/x-uav-telemetry):
+// "UAVT" | uint32 LE header length | JSON header | 8-byte aligned little-endian arrays
+
+export const BINARY_MEDIA_TYPE = 'application/x-uav-telemetry'
+
+const TYPED_ARRAYS = {
+  float64: Float64Array,
+  float32: Float32Array,
+  int32: Int32Array,
+  int16: Int16Array,
+  int8: Int8Array,
+  uint8: Uint8Array
+}
+
+// Returns { flight, columns }: flight metadata plus one typed array per signal field
+// (views on the buffer, no copies)
+export function decodeFlightColumns (buffer) {
+  const view = new DataView(buffer)
+  const magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3))
+  if (magic !== 'UAVT') {
+    throw new Error('Not a binary flight payload')
+  }
+  const headerLength = view.getUint32(4, true)
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)))
+  const dataStart = 8 + headerLength
+
+  const columns = {}
+  for (const [name, signal] of Object.entries(header.signals)) {
+    columns[name] = {}
+    for (const [field, spec] of Object.entries(signal.fields)) {
+      const ArrayType = TYPED_ARRAYS[spec.dtype] || Float64Array
+      columns[name][field] = new ArrayType(buffer, dataStart + spec.offset, spec.length)
+    }
+  }
+  return { flight: header.flight, columns }
+}
+
+// Per-sample objects, the layout the JSON endpoint returns and the views expect
+export function columnsToRecords (signalColumns) {
+  const fields = Object.keys(signalColumns)
+  const length = fields.length ? signalColumns[fields[0]].length : 0
+  const records = new Array(length)
+  for (let i = 0; i < length; i++) {
+    const record = {}
+    for (const field of fields) {
+      record[field] = signalColumns[field][i]
+    }
+    records[i] = record
+  }
+  return records
+}
+
+// Flight data in the same shape as the JSON response
+export function decodeFlight (buffer) {
+  const { flight, columns } = decodeFlightColumns(buffer)
+  const telemetry = {}
+  for (const [name, signalColumns] of Object.entries(columns)) {
+    telemetry[name] = columnsToRecords(signalColumns)
+  }
+  return { ...flight, telemetry }
+}